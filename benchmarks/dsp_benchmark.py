@@ -0,0 +1,230 @@
+"""
+Micro benchmarks of the radar processing chain, on synthetic FMCW frames.
+
+Each step is timed in isolation, for a range of target counts and window capacities, and reported in calls per
+second and memory allocated per call. The results can be saved as a baseline, and later runs compared against it.
+
+Usage, from the root of the repository:
+    python -m benchmarks.dsp_benchmark --save-baseline
+    python -m benchmarks.dsp_benchmark --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from radar import cfar
+from radar.configuration.RadarConfiguration import RadarConfiguration
+from radar.radarprocessing.RadarDataWindow import RadarDataWindow
+from radar.simulation.FmcwSceneGenerator import FmcwSceneGenerator, RadarScene
+
+DEFAULT_TARGET_COUNTS = (1, 10, 50, 200)
+DEFAULT_CAPACITIES = (10, 50, 200)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'dsp_benchmark.json')
+
+def synthetic_td_frames(radar_config: RadarConfiguration, num_frames: int, num_targets: int, seed: int = 0) -> list:
+    """
+    TD frames of a scene of random moving targets, with some static clutter.
+    """
+    scene = RadarScene.random(num_targets, clutter_count=10, seed=seed)
+    return list(FmcwSceneGenerator(scene, radar_config).frames(num_frames))
+
+def measure(function, min_time: float = 0.2, repeat: int = 3) -> dict:
+    """
+    Time the function, the best of 'repeat' runs of at least 'min_time' seconds.
+    Then trace a single call, for the memory it allocates (the peak during the call) and the memory it keeps.
+    """
+    function()  # Warm up
+    best = float('inf')
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    function()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'opsPerSec': 1 / best,
+        'usPerCall': best * 1e6,
+        'allocatedBytesPerCall': peak - before,
+        'retainedBytesPerCall': after - before,
+    }
+
+def full_window(radar_config: RadarConfiguration, frames: list, capacity: int) -> RadarDataWindow:
+    """
+    A radar window that has processed all the frames, as it is once the radar has been running for a while.
+    """
+    window = RadarDataWindow(cfar_params=radar_config.cfar_params, start_time=frames[0].timestamp,
+                             bin_size=radar_config.bin_size_meters, f_c=radar_config.f_c, capacity=capacity)
+    for frame in frames:
+        window.add_raw_record(frame)
+        window.process_data()
+    return window
+
+def window_cases(radar_config: RadarConfiguration, frames: list, capacity: int) -> dict:
+    """
+    The steps of the radar window, each as a function of no arguments that runs the step once.
+    """
+    cases = {}
+
+    window = full_window(radar_config, frames, capacity)
+    frame_index = 0
+    detection_vector = window.detection_records[-1]
+    def add_raw_record():
+        # The window drops its oldest detections with its oldest record, there has to be one for each record
+        nonlocal frame_index
+        window.detection_records.append(detection_vector)
+        window.add_raw_record(frames[frame_index % len(frames)])
+        frame_index += 1
+    cases['add_raw_record'] = add_raw_record
+
+    process_window = full_window(radar_config, frames, capacity)
+    record_fft = process_window.records_fft[-1].copy()
+    def process_data():
+        # The CFAR scales the FFT in place, start each call from the same FFT
+        process_window.records_fft[-1] = record_fft.copy()
+        process_window.detection_records.pop()
+        process_window.process_data()
+    cases['process_data'] = process_data
+
+    movement_window = full_window(radar_config, frames, capacity)
+    detection_vector = movement_window.detection_records[-1]
+    distances = np.where(detection_vector[:, 2].astype(bool) | detection_vector[:, 6].astype(bool))[0] * movement_window.bin_size
+    # Recalculate the movement every call, as the radar does by default
+    cases['get_indexes_with_movement_only_Rx1'] = lambda: (setattr(movement_window, 'movement_distances', None),
+                                                           movement_window.get_indexes_with_movement_only_Rx1(distances))
+    cases['get_detections_combined_xy'] = lambda: (setattr(movement_window, 'movement_distances', None),
+                                                   movement_window.get_detections_combined_xy())
+    return cases
+
+def signal_cases(radar_config: RadarConfiguration, frames: list) -> dict:
+    """
+    The functions of the CFAR and the angles, on the spectrum of the last frame.
+    """
+    window = full_window(radar_config, frames[-1:], capacity=0)
+    record_fft = window.compute_fft(frames[-1].td_data)
+    amplitudes = window.detection_records[-1][:, 0]
+    params = radar_config.cfar_params
+    # A cell in the middle of the spectrum, with training cells on both sides
+    index_cut = len(amplitudes) // 2
+
+    return {
+        'calculate_angles': lambda: window.calculate_angles(*record_fft),
+        'cfar.ca_cfar_detector': lambda: cfar.ca_cfar_detector(amplitudes, params.num_train, params.num_guard, params.threshold),
+        'cfar.cfar_ca_2': lambda: cfar.cfar_ca_2(amplitudes, params.num_train, params.num_guard, params.threshold),
+        'cfar.cfar_ca_full': lambda: cfar.cfar_ca_full(amplitudes, params.num_train, params.num_guard, params.threshold),
+        'cfar.caso_cfar': lambda: cfar.caso_cfar(amplitudes, params.num_train, params.num_guard, params.threshold),
+        'cfar.cfar_single': lambda: cfar.cfar_single(amplitudes, index_cut, params),
+        'cfar.caso_cfar_single': lambda: cfar.caso_cfar_single(amplitudes, index_cut, params),
+        'cfar.leading_edge_cfar_single': lambda: cfar.leading_edge_cfar_single(amplitudes, index_cut, params),
+    }
+
+def run_benchmarks(radar_config: RadarConfiguration, target_counts=DEFAULT_TARGET_COUNTS, capacities=DEFAULT_CAPACITIES,
+                   min_time: float = 0.2, repeat: int = 3, filter_str: str = None) -> dict:
+    """
+    Run every case for every target count (and window capacity for the steps of the window).
+    Returns the results by case name, e.g. 'process_data[targets=10,capacity=200]'.
+    """
+    results = {}
+    def run(name, function):
+        if filter_str and filter_str not in name:
+            return
+        results[name] = measure(function, min_time, repeat)
+        result = results[name]
+        print(f"{name:<60} {result['opsPerSec']:>10.1f} ops/s {result['usPerCall']:>10.1f} us "
+              f"{result['allocatedBytesPerCall'] / 1024:>9.1f} KiB allocated {result['retainedBytesPerCall'] / 1024:>7.1f} KiB retained")
+
+    for num_targets in target_counts:
+        frames = synthetic_td_frames(radar_config, max(capacities) + 1, num_targets)
+        for name, function in signal_cases(radar_config, frames).items():
+            run(f"{name}[targets={num_targets}]", function)
+        for capacity in capacities:
+            for name, function in window_cases(radar_config, frames[:capacity + 1], capacity).items():
+                run(f"{name}[targets={num_targets},capacity={capacity}]", function)
+    return results
+
+def environment() -> dict:
+    """
+    The machine and library versions the results were measured on.
+    """
+    return {
+        'date': pd.Timestamp.now().isoformat(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'node': platform.node(),
+        'cpuCount': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Print the change of every case in the baseline, and return the cases that are slower by more than the threshold.
+
+    :param threshold: The fraction of the baseline ops/sec a case can lose before it is a regression, e.g. 0.1 for 10%.
+    """
+    regressions = []
+    print(f"\nCompared to the baseline of {baseline['environment'].get('date')} on {baseline['environment'].get('node')}:")
+    for name, result in results.items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        change = result['opsPerSec'] / reference['opsPerSec'] - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<60} {change * 100:>+7.1f}% ops/s, allocated {result['allocatedBytesPerCall'] - reference['allocatedBytesPerCall']:>+9d} B"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro benchmarks of the radar processing chain')
+    parser.add_argument('--radar-config', type=str, default='configuration/RadarConfig.yaml', help='radar configuration file path, for the ramp and CFAR settings')
+    parser.add_argument('--targets', type=int, nargs='+', default=DEFAULT_TARGET_COUNTS, help='number of targets in the synthetic frames')
+    parser.add_argument('--capacities', type=int, nargs='+', default=DEFAULT_CAPACITIES, help='capacities of the radar window')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum time in seconds of each timing run')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing runs of each case, the best is kept')
+    parser.add_argument('--filter', type=str, default=None, help='only run the cases with this in their name')
+    parser.add_argument('--output', type=str, default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='baseline JSON file to compare the results to')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline, instead of comparing to it')
+    parser.add_argument('--threshold', type=float, default=0.1, help='fraction of the baseline ops/sec a case can lose before it fails as a regression')
+    args = parser.parse_args()
+
+    radar_config = RadarConfiguration(config_path=args.radar_config)
+    results = {'environment': environment(),
+               'results': run_benchmarks(radar_config, args.targets, args.capacities, args.min_time, args.repeat, args.filter)}
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_to_baseline(results['results'], baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} cases are more than {args.threshold * 100:g}% slower than the baseline")
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one on this machine")
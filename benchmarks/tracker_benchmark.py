@@ -0,0 +1,375 @@
+"""
+Scaling benchmark of the trackers, on synthetic scenarios of 1 to 200 targets.
+
+Each scenario is replayed through 'update_tracks' at a fixed update rate, with simulated timestamps, as fast as the
+tracker can go. The latency of every update is compared to the update interval, to find the number of targets the
+tracker stops keeping up with real time at. The accuracy of the tracks is scored against the ground truth with GOSPA
+and OSPA.
+
+Usage, from the root of the repository:
+    python -m benchmarks.tracker_benchmark
+    python -m benchmarks.tracker_benchmark --filters gmPHD gnn --scenarios swarm --targets 1 10 100 --clutter-rate 20
+"""
+import argparse
+import gc
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+from benchmarks.dsp_benchmark import environment
+from pipeline.soak import resident_memory_bytes
+from tracking.DetectionBatch import DetectionBatch
+from tracking.object_tracker import get_object_tracker, GM_PHD_FILTER, GNN_FILTER
+from tracking.TrackingConfiguration import TrackingConfiguration
+
+CROSSING = 'crossing'
+SWARM = 'swarm'
+BIRTH_DEATH = 'birthDeath'
+SCENARIOS = (CROSSING, SWARM, BIRTH_DEATH)
+
+DEFAULT_TARGET_COUNTS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# The trackers cluster the detections on x. The benchmark clusters well below the noise of the detections by default,
+# so the targets stay separate measurements. With the distance of the tracking configuration most of them are merged
+DEFAULT_CLUSTER_DISTANCE_M = 0.05
+# A case is only valid if the tracker is given at least this fraction of the detections as measurements. Below it
+# the clustering has merged the targets and the tracker is timed on far fewer than the targets of the case
+MIN_MEASUREMENT_FRACTION = 0.8
+
+# The surveillance region of the scenarios in meters, in front of the sensors (x) and to the sides (y)
+REGION_X = (5.0, 95.0)
+REGION_Y = (-45.0, 45.0)
+
+class Scenario():
+    """
+    Ground truth of targets moving in straight lines, each alive from its birth step until its death step.
+    """
+    def __init__(self, name: str, positions: np.ndarray, velocities: np.ndarray, num_steps: int, interval: float,
+                 births: np.ndarray = None, deaths: np.ndarray = None):
+        """
+        :param positions: (N, 2) x, y of each target at its birth, in meters.
+        :param velocities: (N, 2) x, y velocity of each target, in m/s.
+        :param births: The first step each target is alive, 0 by default.
+        :param deaths: The step each target is gone at, the end of the scenario by default.
+        """
+        self.name = name
+        self.positions = positions
+        self.velocities = velocities
+        self.num_steps = num_steps
+        self.interval = interval
+        self.births = births if births is not None else np.zeros(len(positions), dtype=int)
+        self.deaths = deaths if deaths is not None else np.full(len(positions), num_steps)
+
+    def truth(self, step: int) -> np.ndarray:
+        """
+        The (K, 2) x, y of the targets alive at the step.
+        """
+        alive = (self.births <= step) & (step < self.deaths)
+        elapsed = (step - self.births[alive]) * self.interval
+        return self.positions[alive] + self.velocities[alive] * elapsed[:, np.newaxis]
+
+def crossing_scenario(num_targets: int, num_steps: int, interval: float, rng) -> Scenario:
+    """
+    Targets spread on a circle, each heading through the centre of the region to the opposite side.
+    They all cross the centre half way through the scenario.
+    """
+    centre = np.array([np.mean(REGION_X), np.mean(REGION_Y)])
+    radius = 0.9 * min(np.ptp(REGION_X), np.ptp(REGION_Y)) / 2
+    angles = 2 * np.pi * np.arange(num_targets) / num_targets + rng.uniform(0, 2 * np.pi)
+    directions = np.column_stack((np.cos(angles), np.sin(angles)))
+    # Cross slightly off the centre, so the crossing is not a single point
+    positions = centre + radius * directions + rng.normal(0, 1.0, (num_targets, 2))
+    speed = 2 * radius / (num_steps * interval)
+    return Scenario(CROSSING, positions, -speed * directions, num_steps, interval)
+
+def swarm_scenario(num_targets: int, num_steps: int, interval: float, rng, spacing: float = 2.0) -> Scenario:
+    """
+    Targets in a grid formation 'spacing' meters apart, moving across the region together.
+    """
+    columns = int(np.ceil(np.sqrt(num_targets)))
+    offsets = spacing * np.column_stack((np.arange(num_targets) % columns, np.arange(num_targets) // columns))
+    start = np.array([REGION_X[0] + 5.0, REGION_Y[0] + 5.0])
+    positions = start + offsets + rng.normal(0, 0.2, (num_targets, 2))
+    # Cross the region diagonally, with a little spread of velocity between the targets
+    span = np.array([np.ptp(REGION_X), np.ptp(REGION_Y)]) - 10.0 - offsets.max(axis=0)
+    velocity = np.maximum(span, 0) / (num_steps * interval)
+    velocities = velocity + rng.normal(0, 0.05, (num_targets, 2))
+    return Scenario(SWARM, positions, velocities, num_steps, interval)
+
+def birth_death_scenario(num_targets: int, num_steps: int, interval: float, rng, max_speed: float = 3.0) -> Scenario:
+    """
+    Targets appearing and disappearing at random steps, anywhere in the region, each alive for 20% to 60% of the scenario.
+    """
+    births = rng.integers(0, max(1, int(0.6 * num_steps)), num_targets)
+    lifetimes = rng.integers(max(1, int(0.2 * num_steps)), max(2, int(0.6 * num_steps)), num_targets)
+    positions = np.column_stack((rng.uniform(*REGION_X, num_targets), rng.uniform(*REGION_Y, num_targets)))
+    headings = rng.uniform(0, 2 * np.pi, num_targets)
+    speeds = rng.uniform(0, max_speed, num_targets)
+    velocities = speeds[:, np.newaxis] * np.column_stack((np.cos(headings), np.sin(headings)))
+    return Scenario(BIRTH_DEATH, positions, velocities, num_steps, interval, births, np.minimum(births + lifetimes, num_steps))
+
+SCENARIO_GENERATORS = {
+    CROSSING: crossing_scenario,
+    SWARM: swarm_scenario,
+    BIRTH_DEATH: birth_death_scenario,
+}
+
+def measure_detections(truth: np.ndarray, rng, probability_of_detection: float = 0.9, noise_m: float = 0.3,
+                       clutter_rate: float = 5.0) -> DetectionBatch:
+    """
+    The detections of a step: each target is detected with the probability of detection, with gaussian noise on its
+    position, plus a Poisson number of false detections spread uniformly over the region.
+    """
+    detected = truth[rng.random(len(truth)) < probability_of_detection]
+    detected = detected + rng.normal(0, noise_m, detected.shape)
+    num_clutter = rng.poisson(clutter_rate)
+    clutter = np.column_stack((rng.uniform(*REGION_X, num_clutter), rng.uniform(*REGION_Y, num_clutter)))
+    xy = np.vstack((detected, clutter))
+    return DetectionBatch.from_xy(xy[:, 0], xy[:, 1], 'target')
+
+def assignment(truth: np.ndarray, estimates: np.ndarray, cutoff: float, p: float) -> np.ndarray:
+    """
+    The optimal assignment between the truth and the estimates, with the distances cut off at 'cutoff'.
+    Returns the cut off distances of the assigned pairs, raised to the power p.
+    """
+    if len(truth) == 0 or len(estimates) == 0:
+        return np.empty(0)
+    distances = np.linalg.norm(truth[:, np.newaxis, :] - estimates[np.newaxis, :, :], axis=-1)
+    cost = np.minimum(distances, cutoff) ** p
+    rows, columns = linear_sum_assignment(cost)
+    return cost[rows, columns]
+
+def ospa(truth: np.ndarray, estimates: np.ndarray, cutoff: float = 5.0, p: float = 2.0) -> float:
+    """
+    The OSPA distance between the truth and the estimates, in meters, 0 when both are empty.
+    """
+    m, n = sorted((len(truth), len(estimates)))
+    if n == 0:
+        return 0.0
+    costs = assignment(truth, estimates, cutoff, p)
+    return float(((costs.sum() + cutoff ** p * (n - m)) / n) ** (1 / p))
+
+def gospa(truth: np.ndarray, estimates: np.ndarray, cutoff: float = 5.0, p: float = 2.0) -> dict:
+    """
+    The GOSPA distance (alpha = 2) between the truth and the estimates, in meters, split into the localisation error
+    of the assigned targets, the missed targets and the false tracks. A pair further apart than the cutoff counts as
+    a missed target and a false track.
+    """
+    costs = assignment(truth, estimates, cutoff, p)
+    assigned = costs < cutoff ** p
+    missed = len(truth) - int(assigned.sum())
+    false = len(estimates) - int(assigned.sum())
+    localisation = costs[assigned].sum()
+    return {
+        'gospa': float((localisation + cutoff ** p / 2 * (missed + false)) ** (1 / p)),
+        'localisation': float(localisation ** (1 / p)),
+        'missed': missed,
+        'false': false,
+    }
+
+def track_positions(tracker, timestamp) -> np.ndarray:
+    """
+    The (K, 2) x, y of the tracks the tracker reports at the timestamp, the tracks updated by the last update.
+    """
+    positions = []
+    for track in tracker.find_tracks_remove_older_tracks(timestamp, remove_tracks=False, interval=0):
+        # The GM PHD tracks are Stone Soup tracks of states, the GNN tracks hold their own state
+        x_y = tracker.get_tracks_x_y(getattr(track, 'state', track))
+        if x_y is not None:
+            positions.append(x_y)
+    return np.array(positions, dtype=float).reshape(-1, 2)
+
+def component_count(tracker) -> int:
+    """
+    The number of hypotheses the tracker carries between updates, the Gaussian components of the GM PHD or the
+    (tentative and confirmed) tracks of the GNN.
+    """
+    return len(getattr(tracker, 'reduced_states', tracker.tracks))
+
+def tracking_config_for(path: str, active_filter: str, cluster_distance: float = None) -> TrackingConfiguration:
+    """
+    The tracking configuration of the file, with the filter given and without the plot and the saved results.
+
+    :param cluster_distance: Overrides the distance the detections are clustered at, if given.
+    """
+    tracking_config = TrackingConfiguration(config_path=path)
+    tracking_config.activeFilter = active_filter
+    if cluster_distance is not None:
+        tracking_config.maxDistanceBetweenClusteredObjectsM = cluster_distance
+    tracking_config.saveTrackingResults = False
+    tracking_config.showTrackingPlot = False
+    tracking_config.set_active_filter_attributes()
+    return tracking_config
+
+def run_scenario(tracking_config: TrackingConfiguration, scenario: Scenario, rng, probability_of_detection: float = 0.9,
+                 noise_m: float = 0.3, clutter_rate: float = 5.0, cutoff: float = 5.0, max_seconds: float = None) -> dict:
+    """
+    Replay the scenario through a new tracker, one update per step, and summarise the latency, the component count,
+    the memory growth and the accuracy of the tracks.
+
+    :param max_seconds: Stop the scenario once the updates have taken this long, so a tracker that can't keep up
+        doesn't hold up the sweep. The result is marked as truncated.
+    """
+    # The detections are generated up front, so only the tracker is timed
+    detections = [measure_detections(scenario.truth(step), rng, probability_of_detection, noise_m, clutter_rate)
+                  for step in range(scenario.num_steps)]
+    start_time = pd.Timestamp('2024-01-01')
+    tracker = get_object_tracker(start_time, tracking_config)
+
+    latencies, measurements, components, track_counts, gospas, ospas = [], [], [], [], [], []
+    gc.collect()
+    start_memory = resident_memory_bytes()
+    total_time = 0.0
+    for step, step_detections in enumerate(detections):
+        timestamp = start_time + pd.Timedelta(seconds=(step + 1) * scenario.interval)
+        update_start = time.perf_counter()
+        tracker.update_tracks(step_detections, timestamp)
+        latency = time.perf_counter() - update_start
+        latencies.append(latency)
+        total_time += latency
+
+        estimates = track_positions(tracker, timestamp)
+        truth = scenario.truth(step)
+        # The detections left once the tracker has clustered them
+        measurements.append(len(tracker.all_measurements[-1]) if tracker.all_measurements else 0)
+        components.append(component_count(tracker))
+        track_counts.append(len(estimates))
+        gospas.append(gospa(truth, estimates, cutoff))
+        ospas.append(ospa(truth, estimates, cutoff))
+        if max_seconds is not None and total_time > max_seconds:
+            break
+    gc.collect()
+    memory_growth = resident_memory_bytes() - start_memory
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        'updates': len(latencies),
+        'truncated': len(latencies) < scenario.num_steps,
+        'meanTargets': float(np.mean([len(scenario.truth(step)) for step in range(len(latencies))])),
+        'p50Ms': float(p50),
+        'p95Ms': float(p95),
+        'p99Ms': float(p99),
+        'maxMs': float(latencies_ms.max()),
+        'meanDetections': float(np.mean([len(d) for d in detections[:len(latencies)]])),
+        'meanMeasurements': float(np.mean(measurements)),
+        'valid': bool(np.mean(measurements) >= MIN_MEASUREMENT_FRACTION * np.mean([len(d) for d in detections[:len(latencies)]])),
+        'updatesPerSec': len(latencies) / total_time if total_time else float('inf'),
+        # The fraction of the update interval the tracker is busy, above 1 it falls behind
+        'load': float(latencies_ms.mean() / 1000 / scenario.interval),
+        'keepsUp': bool(p95 / 1000 < scenario.interval),
+        'meanComponents': float(np.mean(components)),
+        'maxComponents': int(np.max(components)),
+        'meanTracks': float(np.mean(track_counts)),
+        'memoryGrowthBytes': int(memory_growth),
+        'gospa': float(np.mean([g['gospa'] for g in gospas])),
+        'gospaLocalisation': float(np.mean([g['localisation'] for g in gospas])),
+        'meanMissed': float(np.mean([g['missed'] for g in gospas])),
+        'meanFalse': float(np.mean([g['false'] for g in gospas])),
+        'ospa': float(np.mean(ospas)),
+    }
+
+def run_benchmarks(tracking_config_path: str, filters=(GM_PHD_FILTER, GNN_FILTER), scenarios=SCENARIOS,
+                   target_counts=DEFAULT_TARGET_COUNTS, num_steps: int = 100, rate_hz: float = 10.0,
+                   clutter_rate: float = 5.0, probability_of_detection: float = 0.9, noise_m: float = 0.3,
+                   cutoff: float = 5.0, max_seconds: float = 60.0, seed: int = 0,
+                   cluster_distance: float = DEFAULT_CLUSTER_DISTANCE_M) -> dict:
+    """
+    Run every scenario for every target count and filter.
+    Returns the results by case name, e.g. 'gmPHD.swarm[targets=50]'.
+
+    :param cluster_distance: The distance the trackers cluster the detections at, None for the one of the tracking configuration.
+    """
+    results = {}
+    print(f"{'case':<36} {'updates':>7} {'meas':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'load':>6} {'comps':>7} {'tracks':>7} "
+          f"{'mem MB':>7} {'GOSPA':>6} {'OSPA':>5} {'missed':>6} {'false':>6}")
+    for active_filter in filters:
+        tracking_config = tracking_config_for(tracking_config_path, active_filter, cluster_distance)
+        for scenario_name in scenarios:
+            for num_targets in target_counts:
+                # The same seed for each filter, so they see the same detections
+                rng = np.random.default_rng([seed, num_targets, SCENARIOS.index(scenario_name)])
+                scenario = SCENARIO_GENERATORS[scenario_name](num_targets, num_steps, 1 / rate_hz, rng)
+                name = f"{active_filter}.{scenario_name}[targets={num_targets}]"
+                result = run_scenario(tracking_config, scenario, rng, probability_of_detection, noise_m, clutter_rate,
+                                      cutoff, max_seconds)
+                results[name] = result
+                print(f"{name:<36} {result['updates']:>7d} {result['meanMeasurements']:>6.1f} {result['p50Ms']:>8.2f} {result['p95Ms']:>8.2f} {result['p99Ms']:>8.2f} "
+                      f"{result['load']:>6.2f} {result['meanComponents']:>7.1f} {result['meanTracks']:>7.1f} "
+                      f"{result['memoryGrowthBytes'] / 1e6:>7.1f} {result['gospa']:>6.1f} {result['ospa']:>5.2f} "
+                      f"{result['meanMissed']:>6.1f} {result['meanFalse']:>6.1f}"
+                      f"{'  TRUNCATED' if result['truncated'] else ''}{'' if result['keepsUp'] else '  BEHIND'}"
+                      f"{'' if result['valid'] else '  INVALID'}")
+    return results
+
+def capacity_limits(results: dict) -> dict:
+    """
+    The real time capacity of each filter and scenario, from its valid cases only:
+    - fallsBehindAt: the smallest number of targets it falls behind real time at (p95 latency over the update
+      interval), None if it keeps up with all of them
+    - keepsUpWith: the largest number of targets below that it keeps up with, None if there is none
+    - invalid: the target counts left out, where the clustering merged the targets into too few measurements
+    """
+    limits = {}
+    for name, result in results.items():
+        case, targets = name.rstrip(']').split('[targets=')
+        limit = limits.setdefault(case, {'fallsBehindAt': None, 'keepsUpWith': None, 'invalid': []})
+        targets = int(targets)
+        if not result['valid']:
+            limit['invalid'].append(targets)
+        elif not result['keepsUp'] and (limit['fallsBehindAt'] is None or targets < limit['fallsBehindAt']):
+            limit['fallsBehindAt'] = targets
+    for name, result in results.items():
+        case, targets = name.rstrip(']').split('[targets=')
+        limit, targets = limits[case], int(targets)
+        if (result['valid'] and result['keepsUp'] and (limit['fallsBehindAt'] is None or targets < limit['fallsBehindAt'])
+                and (limit['keepsUpWith'] is None or targets > limit['keepsUpWith'])):
+            limit['keepsUpWith'] = targets
+    return limits
+
+def describe_limit(limit: dict) -> str:
+    if limit['keepsUpWith'] is None and limit['fallsBehindAt'] is None:
+        description = "no valid cases"
+    elif limit['fallsBehindAt'] is None:
+        description = f"keeps up with up to {limit['keepsUpWith']} targets"
+    else:
+        description = f"falls behind at {limit['fallsBehindAt']} targets" + \
+            (f", keeps up with {limit['keepsUpWith']}" if limit['keepsUpWith'] is not None else "")
+    if limit['invalid']:
+        description += f" (invalid, targets merged by the clustering: {', '.join(str(t) for t in sorted(limit['invalid']))})"
+    return description
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the trackers')
+    parser.add_argument('--tracking-config', type=str, default='configuration/TrackingConfig.yaml', help='tracking configuration file path')
+    parser.add_argument('--filters', type=str, nargs='+', default=(GM_PHD_FILTER, GNN_FILTER), choices=(GM_PHD_FILTER, GNN_FILTER), help='trackers to benchmark')
+    parser.add_argument('--scenarios', type=str, nargs='+', default=SCENARIOS, choices=SCENARIOS, help='scenarios to run')
+    parser.add_argument('--targets', type=int, nargs='+', default=DEFAULT_TARGET_COUNTS, help='number of targets of the scenarios')
+    parser.add_argument('--steps', type=int, default=100, help='number of tracker updates of each scenario')
+    parser.add_argument('--rate', type=float, default=10.0, help='update rate in Hz, the real time budget of an update is 1 / rate')
+    parser.add_argument('--clutter-rate', type=float, default=5.0, help='mean number of false detections per update')
+    parser.add_argument('--probability-of-detection', type=float, default=0.9, help='probability each target is detected in an update')
+    parser.add_argument('--noise', type=float, default=0.3, help='standard deviation of the detection positions in meters')
+    parser.add_argument('--cutoff', type=float, default=5.0, help='cutoff distance of GOSPA and OSPA in meters')
+    parser.add_argument('--max-seconds', type=float, default=60.0, help='stop a scenario once its updates have taken this long')
+    parser.add_argument('--cluster-distance', type=float, default=DEFAULT_CLUSTER_DISTANCE_M, help='distance in meters the tracker clusters the detections at (on x)')
+    parser.add_argument('--config-cluster-distance', action='store_true', help='cluster at the distance of the tracking configuration instead')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the scenarios and detections')
+    parser.add_argument('--output', type=str, default=None, help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.tracking_config, args.filters, args.scenarios, args.targets, args.steps, args.rate,
+                             args.clutter_rate, args.probability_of_detection, args.noise, args.cutoff, args.max_seconds, args.seed,
+                             None if args.config_cluster_distance else args.cluster_distance)
+
+    limits = capacity_limits(results)
+    print(f"\nReal time capacity at {args.rate:g} Hz:")
+    for case, limit in limits.items():
+        print(f"{case:<24} {describe_limit(limit)}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'environment': environment(), 'settings': vars(args), 'results': results, 'capacityLimits': limits}, file, indent=2)
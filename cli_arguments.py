@@ -1,9 +1,16 @@
 import argparse
+import os
+import pandas as pd
 
 from radar.configuration.RadarConfiguration import RadarConfiguration
 from radar.configuration.RunType import RunType
+from radar.configuration.AcquisitionMode import AcquisitionMode
 from video.VideoConfiguration import VideoConfiguration
 from tracking.TrackingConfiguration import TrackingConfiguration
+from pipeline.PipelineConfiguration import PipelineConfiguration, PROCESS_NAMES
+from pipeline.profiling import PROFILERS, CPROFILE
+from pipeline.benchmark import METRICS_FOLDER, TRACE_FILE
+from pipeline.soak import MIN_TREND_SAMPLES
 
 def define_argument_parser() -> argparse.ArgumentParser:
     """
@@ -29,6 +36,9 @@ def define_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument('--radar-from-file', action='store_true', help='use previously recorded radar data')
     parser.add_argument('--radar-source', type=str, default=None, help='path to folder to read prerecorded radar data from. Only used if "--radar-rerun" is set')
     parser.add_argument('--radar-disable-print', action='store_true', help='disable printing of radar params')
+    parser.add_argument('--radar-simulated', action='store_true', help='use a synthetic scene of moving targets instead of the radar')
+    parser.add_argument('--radar-acquisition-mode', type=str, default=None, choices=['TD', 'FD', 'HT'], help='acquire the raw TD data and run the FFT on the host, the spectra computed by the radar (FD, no movement mask), or the targets of the Human Tracker of the radar (HT)')
+    parser.add_argument('--radar-replay-loop', action='store_true', help='replay the prerecorded radar data from the start again once it is read, until the run is stopped')
     
     # Options for the video configuration
     parser.add_argument('--video-config', type=str, default='/configuration/VideoConfig.yaml', help='video configuration file path')
@@ -42,8 +52,44 @@ def define_argument_parser() -> argparse.ArgumentParser:
     parser.add_argument('--tracking-config', type=str, default='/configuration/TrackingConfig.yaml', help='tracking configuration file path')
     parser.add_argument('--show-tracking-plot', action='store_true', help='show the tracking plot on completion')
     parser.add_argument('--tracking-disable-save', action='store_true', help='disable saving the tracking data')
-    parser.add_argument('--batching-time', type=float, default=0.3, help='time to accumulate detections before sending to tracking algorithm')
+    parser.add_argument('--batching-time', type=float, default=0.3, help='time to hold detections back for, waiting for older detections from the other sensor, before sending them to the tracking algorithm in time order')
+    
+    # Options for moving data between the processes
+    parser.add_argument('--pipeline-config', type=str, default='/configuration/PipelineConfig.yaml', help='pipeline configuration file path')
+    parser.add_argument('--shared-memory-queue', action='store_true', help='send detections to the tracking process through shared memory instead of a multiprocessing queue')
+    parser.add_argument('--shared-memory-max-detections', type=int, default=256, help='maximum number of detections per frame in the shared memory queue, any more are dropped')
+    
+    # Options for the scheduling of each process, given as <process>=<value>, processes are video, radar, radarAcquisition and tracking
+    parser.add_argument('--cpu-affinity', type=str, action='append', default=[], help='cpus a process can run on, e.g. radar=2,3. Can be repeated for each process')
+    parser.add_argument('--nice', type=str, action='append', default=[], help='nice level of a process, e.g. tracking=5. Can be repeated for each process')
+    parser.add_argument('--threads', type=str, action='append', default=[], help='thread pool size of the libraries (torch, blas, opencv) in a process, e.g. video=2. Can be repeated for each process')
+    
+    # Options for the instrumentation
+    parser.add_argument('--enable-instrumentation', action='store_true', help='record the latency histograms of each stage, and write them to the metrics directory')
+    parser.add_argument('--metrics-port', type=int, default=None, help='serve the latency histograms for Prometheus on this local port')
+    parser.add_argument('--print-trace', action='store_true', help='print the end to end latency breakdown of every tracker update')
+    
+    # Options for profiling the processes
+    parser.add_argument('--profile', type=str, action='append', default=[], choices=PROCESS_NAMES, help='profile a process, and write the profile and the top memory allocations to the profile folder. Can be repeated for each process')
+    parser.add_argument('--profiler', type=str, default=CPROFILE, choices=PROFILERS, help='cprofile records every function call, sampling records the stacks at an interval with a lower overhead')
+    parser.add_argument('--profile-duration', type=float, default=None, help='time in seconds to profile for, from the start of the process. By default until the process stops')
+    parser.add_argument('--profile-interval', type=float, default=0.005, help='time in seconds between the samples of the sampling profiler')
+    parser.add_argument('--profile-folder', type=str, default=None, help='folder the profiles are written to, <output folder>/<run start time>/profiles by default')
+    
+    # Options for the benchmark and soak test modes, a run is one or the other
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--benchmark', action='store_true', help='replay the radar source folder and the video source (a video file or a folder of images) through the pipeline as fast as possible, then write the throughput and latency report to <output folder>/<run start time>/benchmark')
+    parser.add_argument('--benchmark-label', type=str, default=None, help='label saved with the benchmark report, e.g. the release or the hardware')
+    mode_group.add_argument('--soak', type=float, default=None, help='run a soak test for this many seconds, sampling the memory, objects, queues and latency of the processes, then fail if they trend upward. Use with a simulated or looped source')
+    parser.add_argument('--soak-interval', type=float, default=None, help='time in seconds between the samples of the soak test')
     return parser
+
+def run_folder(args:argparse.Namespace, start_time:pd.Timestamp, name:str) -> str:
+    """
+    The folder of a result of the run, <output folder>/<run start time>/<name>, as for the results of the processes.
+    """
+    start_time = start_time if start_time is not None else pd.Timestamp.now()
+    return os.path.join(args.output_folder or '/output', start_time.strftime('%Y-%m-%d_%H-%M-%S'), name)
     
 def update_radar_config(config:RadarConfiguration, args:argparse.Namespace) -> RadarConfiguration:
     
@@ -62,6 +108,16 @@ def update_radar_config(config:RadarConfiguration, args:argparse.Namespace) -> R
         config.source_path = args.radar_source
     if args.radar_disable_print:
         config.print_settings = False
+    if args.radar_simulated:
+        config.run_type = RunType.SIMULATED
+    if args.radar_replay_loop:
+        config.replay_loop = True
+    if args.radar_acquisition_mode is not None:
+        config.acquisition_mode = AcquisitionMode[args.radar_acquisition_mode]
+    if args.benchmark:
+        # Replay the recording as fast as it is processed
+        config.run_type = RunType.RERUN
+        config.replay_interval_sec = 0
     
     return config
 
@@ -82,6 +138,12 @@ def update_video_config(config:VideoConfiguration, args:argparse.Namespace) -> V
         config.showVideo = True
     if args.video_proc_delay > 0:
         config.videoDelayBetweenProcessingSec = args.video_proc_delay
+    if args.benchmark:
+        # Headless, and only the processing is timed
+        config.showVideo = False
+        config.saveRawImages = False
+        config.saveProcessedVideo = False
+        config.videoDelayBetweenProcessingSec = 0.0
     
     return config
 
@@ -94,5 +156,86 @@ def update_tracking_config(config:TrackingConfiguration, args:argparse.Namespace
         config.showTrackingPlot = True
     if args.tracking_disable_save:
         config.saveTrackingResults = False
+    if args.benchmark or args.soak is not None:
+        # Unattended runs, the plot would wait for a browser at the end
+        config.showTrackingPlot = False
         
     return config
+
+def update_pipeline_config(config:PipelineConfiguration, args:argparse.Namespace, start_time:pd.Timestamp = None) -> PipelineConfiguration:
+    """
+    Update the pipeline configuration object with the process scheduling, instrumentation, tracing, profiling, benchmark and soak arguments from the command line.
+    The start time of the run names the folder of the profiles, the benchmark and the soak test, as for the other results of the run.
+    """
+    def process_values(values):
+        # Split the '<process>=<value>' arguments
+        for value in values:
+            name, _, setting = value.partition('=')
+            if name not in config.processes or setting == '':
+                raise argparse.ArgumentTypeError(f"Expected <process>=<value> with a process of {', '.join(config.processes)}, got '{value}'")
+            yield config.processes[name], setting
+    
+    for process, setting in process_values(args.cpu_affinity):
+        process['cpuAffinity'] = [int(cpu) for cpu in setting.split(',')]
+    for process, setting in process_values(args.nice):
+        process['nice'] = int(setting)
+    for process, setting in process_values(args.threads):
+        process['threads'] = {library: int(setting) for library in process['threads']}
+    
+    if args.enable_instrumentation:
+        config.instrumentation['enabled'] = True
+    if not config.instrumentation['directory']:
+        # A folder per run, the files left by the processes of earlier runs would be served as live data
+        config.instrumentation['directory'] = run_folder(args, start_time, METRICS_FOLDER)
+    if args.metrics_port is not None:
+        config.instrumentation['prometheusPort'] = args.metrics_port
+    if args.print_trace:
+        config.tracing['enabled'] = True
+        config.tracing['printUpdates'] = True
+    
+    if args.benchmark:
+        # The benchmark report is made from the latency histograms and the trace the processes write
+        benchmark_folder = run_folder(args, start_time, 'benchmark')
+        config.instrumentation['enabled'] = True
+        config.instrumentation['directory'] = os.path.join(benchmark_folder, METRICS_FOLDER)
+        config.tracing['enabled'] = True
+        config.tracing['reportPath'] = os.path.join(benchmark_folder, TRACE_FILE)
+    
+    if args.soak is not None:
+        config.soak['enabled'] = True
+        config.soak['durationSec'] = args.soak
+    if args.soak_interval is not None:
+        config.soak['intervalSec'] = args.soak_interval
+    if config.soak['enabled']:
+        min_duration = config.soak['warmupSec'] + MIN_TREND_SAMPLES * config.soak['intervalSec']
+        if config.soak['durationSec'] < min_duration:
+            raise argparse.ArgumentTypeError(f"The soak test needs at least {min_duration:g} seconds, the {config.soak['warmupSec']:g}s warm up "
+                                             f"and {MIN_TREND_SAMPLES} samples {config.soak['intervalSec']:g}s apart for a trend, got {config.soak['durationSec']:g}")
+        soak_folder = run_folder(args, start_time, 'soak')
+        config.soak['directory'] = soak_folder
+        # The latency of each stage is sampled from the histograms the processes export
+        config.instrumentation['enabled'] = True
+        config.instrumentation['directory'] = os.path.join(soak_folder, METRICS_FOLDER)
+        config.instrumentation['intervalSec'] = min(config.instrumentation['intervalSec'], config.soak['intervalSec'])
+        for name, process in config.processes.items():
+            process['soak'] = {
+                'name': name,
+                'directory': soak_folder,
+                'intervalSec': config.soak['intervalSec'],
+                'topObjectTypes': config.soak['topObjectTypes']
+            }
+    
+    if args.profile:
+        profile_folder = args.profile_folder
+        if profile_folder is None:
+            profile_folder = run_folder(args, start_time, 'profiles')
+        for name in args.profile:
+            config.processes[name]['profile'] = {
+                'name': name,
+                'directory': profile_folder,
+                'profiler': args.profiler,
+                'durationSec': args.profile_duration,
+                'intervalSec': args.profile_interval
+            }
+    
+    return config
@@ -0,0 +1,132 @@
+import multiprocessing as mp
+import queue
+
+# Policies for a full channel
+BLOCK = 'block'  # The producer waits for space, up to the block timeout, then the new data is dropped
+DROP_OLDEST = 'drop_oldest'  # The oldest data in the channel is dropped to make space
+KEEP_LATEST = 'keep_latest'  # As drop_oldest, and the consumer skips to the newest data on every get
+POLICIES = (BLOCK, DROP_OLDEST, KEEP_LATEST)
+
+# How long a producer waits for the oldest item when making space. The items it put itself may still be in the
+# feeder thread of its queue, not yet readable, so the channel is full while a get_nowait() finds nothing.
+EVICT_TIMEOUT_SEC = 0.01
+
+class BoundedChannel():
+    """
+    Bounded queue between two processes, with a policy for when it is full.
+
+    When the consumer falls behind an unbounded queue keeps growing and every following frame is processed
+    further in the past. A bounded channel instead blocks the producer or sheds the old data, depending on
+    its policy. The depth, the number of dropped items and the high water mark of the depth are shared
+    between the processes, so either side can report them.
+
+    It has the same put/get/empty interface as mp.Queue, so it can be used anywhere a queue was used.
+    """
+    def __init__(self, capacity: int = 8, policy: str = DROP_OLDEST, block_timeout: float = 1.0, name: str = None):
+        """
+        :param capacity: The maximum number of items in the channel.
+        :param policy: What to do when the channel is full, one of 'block', 'drop_oldest' or 'keep_latest'.
+        :param block_timeout: With the 'block' policy, how long in seconds to wait for space before dropping the data.
+        :param name: Name of the channel, used when printing the counters.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown channel policy '{policy}', options are {', '.join(POLICIES)}")
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._queue = mp.Queue(maxsize=capacity)
+        self._depth = mp.Value('q', 0)
+        self._dropped = mp.Value('q', 0)
+        self._high_water = mp.Value('q', 0)
+
+    def put(self, item, block: bool = True, timeout: float = None) -> bool:
+        """
+        Put an item into the channel, applying the policy if it is full.
+        Returns False if the item was dropped.
+        """
+        if self.policy == BLOCK:
+            try:
+                self._queue.put(item, block=block, timeout=self.block_timeout if timeout is None else timeout)
+            except queue.Full:
+                self._count_drop()
+                return False
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    # Make space by dropping the oldest item, waiting for it rather than spinning until it is flushed
+                    try:
+                        self._queue.get(timeout=EVICT_TIMEOUT_SEC)
+                        self._count_get()
+                        self._count_drop()
+                    except queue.Empty:
+                        pass
+
+        with self._depth.get_lock():
+            self._depth.value += 1
+            if self._depth.value > self._high_water.value:
+                self._high_water.value = self._depth.value
+        return True
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        Get the next item, with the 'keep_latest' policy the newest item is returned and any older items are dropped.
+        Raises queue.Empty if no item arrived within the timeout.
+        """
+        item = self._queue.get(block=block, timeout=timeout)
+        self._count_get()
+        if self.policy == KEEP_LATEST:
+            while True:
+                try:
+                    newer_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._count_get()
+                self._count_drop()
+                item = newer_item
+        return item
+
+    def _count_get(self):
+        with self._depth.get_lock():
+            self._depth.value -= 1
+
+    def _count_drop(self):
+        with self._dropped.get_lock():
+            self._dropped.value += 1
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def qsize(self) -> int:
+        return self.depth
+
+    @property
+    def depth(self) -> int:
+        """
+        The number of items currently in the channel.
+        """
+        return max(self._depth.value, 0)
+
+    @property
+    def dropped(self) -> int:
+        """
+        The number of items dropped because the channel was full.
+        """
+        return self._dropped.value
+
+    @property
+    def high_water(self) -> int:
+        """
+        The largest number of items that have been in the channel at once.
+        """
+        return self._high_water.value
+
+    def stats(self) -> dict:
+        return {'depth': self.depth, 'dropped': self.dropped, 'high_water': self.high_water}
+
+    def __repr__(self):
+        return f"BoundedChannel(name={self.name}, policy={self.policy}, capacity={self.capacity}, depth={self.depth}, dropped={self.dropped}, high_water={self.high_water})"
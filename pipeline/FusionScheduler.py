@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import queue
+import threading
+from datetime import timedelta
+
+from tracking.DetectionsAtTime import DetectionsAtTime
+from tracking.clock import monotonic_now
+from tracking.TraceContext import DEQUEUED
+
+class FusionScheduler():
+    """
+    Merges the DetectionsAtTime of several sensor queues into a single stream ordered by timestamp.
+
+    A reader thread per source blocks on its queue, so nothing busy-waits, and hands the data to the
+    scheduler. The data is held in a heap ordered by timestamp and released once every source has sent
+    newer data, or once it is older than the lateness window. Data that arrives after newer data has
+    already been released is late, the tracker can't go back in time, so it is dropped and counted.
+
+    Attributes:
+        received (int): Number of DetectionsAtTime received from all the sources.
+        released (int): Number of DetectionsAtTime released in time order.
+        late (int): Number of DetectionsAtTime dropped because they arrived after the lateness window.
+    """
+    def __init__(self, sources: dict, lateness: float = 0.3, poll_interval: float = 0.1, max_pending: int = 4):
+        """
+        :param sources: Map of the source name to its queue, queues that are None are ignored.
+        :param lateness: Time in seconds to hold the data back for, waiting for older data from the other sources.
+        :param poll_interval: How often in seconds the reader threads check if the scheduler is stopped.
+        :param max_pending: The number of received items waiting to be scheduled. When the tracker falls behind
+            the reader threads stop taking data, so it backs up into the source queues where their policy applies.
+        """
+        self.sources = {name: source for name, source in sources.items() if source is not None}
+        self.lateness = timedelta(seconds=lateness)
+        self.poll_interval = poll_interval
+
+        self._inbox = queue.Queue(maxsize=max_pending)
+        self._heap = []
+        self._counter = itertools.count()  # Tie breaker for data with the same timestamp
+        self._latest = {}  # source name -> latest timestamp received from the source
+        self._last_released = None
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.received = 0
+        self.released = 0
+        self.late = 0
+
+    def start(self):
+        """
+        Start a reader thread for each source.
+        """
+        for name, source in self.sources.items():
+            thread = threading.Thread(target=self._read_source, args=(name, source), name=f"Fusion {name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _read_source(self, name: str, source):
+        while not self._stop.is_set():
+            try:
+                detections_at_time = source.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError, ValueError):
+                break  # The queue was closed
+            if detections_at_time.trace is not None:
+                detections_at_time.trace.mark(DEQUEUED)
+            while not self._stop.is_set():
+                try:
+                    self._inbox.put((name, detections_at_time), timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    continue
+
+    def _push(self, name: str, detections_at_time: DetectionsAtTime):
+        self.received += 1
+        timestamp = detections_at_time.timestamp
+        if self._last_released is not None and timestamp < self._last_released:
+            self.late += 1
+            return
+
+        latest = self._latest.get(name)
+        if latest is None or timestamp > latest:
+            self._latest[name] = timestamp
+        heapq.heappush(self._heap, (timestamp, next(self._counter), detections_at_time))
+
+    def _watermark(self):
+        """
+        All the sources have sent data up to this time, so nothing older can still arrive (in order).
+        """
+        if len(self._latest) < len(self.sources):
+            return None
+        return min(self._latest.values())
+
+    def _pop_ready(self, now):
+        if not self._heap:
+            return None
+        timestamp = self._heap[0][0]
+        watermark = self._watermark()
+        if (watermark is not None and timestamp <= watermark) or timestamp + self.lateness <= now:
+            _, _, detections_at_time = heapq.heappop(self._heap)
+            self._last_released = timestamp
+            self.released += 1
+            return detections_at_time
+        return None
+
+    def get(self, timeout: float = None) -> DetectionsAtTime:
+        """
+        Block until the next DetectionsAtTime in time order is ready, or the timeout in seconds passes.
+        Returns None on a timeout.
+        """
+        deadline = None if timeout is None else monotonic_now() + timedelta(seconds=timeout)
+        while True:
+            # Move everything that has arrived into the heap
+            while True:
+                try:
+                    self._push(*self._inbox.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = monotonic_now()
+            detections_at_time = self._pop_ready(now)
+            if detections_at_time is not None:
+                return detections_at_time
+
+            # Wait for new data, or until the oldest data is due or the timeout
+            wake_times = [time for time in (deadline, self._heap[0][0] + self.lateness if self._heap else None) if time is not None]
+            wait = max((min(wake_times) - now).total_seconds(), 0) if wake_times else None
+            if deadline is not None and now >= deadline:
+                return None
+            try:
+                self._push(*self._inbox.get(timeout=wait))
+            except queue.Empty:
+                pass
+
+    def get_batch(self, timeout: float = None, window: float = 0.0) -> list:
+        """
+        Get the next DetectionsAtTime in time order, along with any others that are ready and within 'window'
+        seconds of it. Returns an empty list on a timeout.
+        """
+        detections_at_time = self.get(timeout)
+        if detections_at_time is None:
+            return []
+        batch = [detections_at_time]
+        window_end = detections_at_time.timestamp + timedelta(seconds=window)
+        now = monotonic_now()
+        while window > 0 and self._heap and self._heap[0][0] <= window_end:
+            next_detections_at_time = self._pop_ready(now)
+            if next_detections_at_time is None:
+                break
+            batch.append(next_detections_at_time)
+        return batch
+
+    def flush(self):
+        """
+        Release all the held data in time order, used when stopping.
+        """
+        while True:
+            try:
+                self._push(*self._inbox.get_nowait())
+            except queue.Empty:
+                break
+        while self._heap:
+            timestamp, _, detections_at_time = heapq.heappop(self._heap)
+            self._last_released = timestamp
+            self.released += 1
+            yield detections_at_time
+
+    def stats(self) -> dict:
+        """
+        Counters of the scheduler, including the data dropped by sources that count it.
+        """
+        stats = {'received': self.received, 'released': self.released, 'late': self.late, 'pending': len(self._heap)}
+        for name, source in self.sources.items():
+            if hasattr(source, 'stats'):
+                stats.update({f'{name}_{key}': value for key, value in source.stats().items()})
+            elif getattr(source, 'dropped', None) is not None:
+                stats[f'{name}_dropped'] = source.dropped
+        return stats
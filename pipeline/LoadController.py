@@ -0,0 +1,140 @@
+import multiprocessing as mp
+import threading
+
+# The knobs the controller can turn, in the default order they are raised when the pipeline is overloaded
+TRACKER_BATCH_TIME = 'trackerBatchTimeSec'  # Merge the detections within this time into a single tracker update
+MOVEMENT_MASK_EVERY = 'movementMaskEvery'  # Recalculate the radar movement mask every N radar frames
+RADAR_DECIMATION = 'radarDecimation'  # Process 1 of every N radar frames
+VIDEO_STRIDE = 'videoStride'  # Process roughly 1 of every N video frames
+
+INTEGER_KNOBS = (MOVEMENT_MASK_EVERY, RADAR_DECIMATION, VIDEO_STRIDE)
+
+class LoadKnobs():
+    """
+    Run time settings shared between the processes, that trade accuracy for processing time.
+    The LoadController in the tracking process sets them, and each stage reads them on every frame.
+    Each stage also reports its processing latency, as an exponential moving average, for the controller.
+    """
+    def __init__(self, knob_bounds: dict, stages=('radar', 'video', 'tracker', 'endToEnd'), smoothing: float = 0.2):
+        """
+        :param knob_bounds: Map of the knob name to its settings {'min', 'max', 'step'}, the knobs start at their minimum.
+        :param stages: The names of the stages that report their latency.
+        :param smoothing: Weight of the newest latency in the moving average.
+        """
+        # The YAML may write an integer bound as a float (1.0), the shared values need the exact type
+        self.bounds = {name: {key: int(value) if name in INTEGER_KNOBS and key != 'step' else float(value) for key, value in bounds.items()}
+                       for name, bounds in knob_bounds.items()}
+        self.smoothing = smoothing
+        self._values = {name: mp.Value('i' if name in INTEGER_KNOBS else 'd', bounds['min']) for name, bounds in self.bounds.items()}
+        self._latency = {stage: mp.Value('d', 0.0) for stage in stages}
+
+    def get(self, name: str, default=None):
+        """
+        The current value of a knob, or the default if the knob isn't controlled.
+        """
+        value = self._values.get(name)
+        return default if value is None else value.value
+
+    def set(self, name: str, value):
+        bounds = self.bounds[name]
+        value = min(max(value, bounds['min']), bounds['max'])
+        self._values[name].value = int(value) if name in INTEGER_KNOBS else round(value, 6)
+
+    def record_latency(self, stage: str, seconds: float):
+        """
+        Add a latency measurement of the stage to its moving average.
+        """
+        latency = self._latency.get(stage)
+        if latency is None:
+            return
+        with latency.get_lock():
+            latency.value = seconds if latency.value == 0 else (1 - self.smoothing) * latency.value + self.smoothing * seconds
+
+    def latency(self, stage: str) -> float:
+        return self._latency[stage].value
+
+    def values(self) -> dict:
+        return {name: value.value for name, value in self._values.items()}
+
+    def latencies(self) -> dict:
+        return {stage: latency.value for stage, latency in self._latency.items()}
+
+class LoadController():
+    """
+    Keeps the pipeline within its latency budget by turning the LoadKnobs, using additive increase
+    and multiplicative decrease of the load.
+
+    Every interval the end to end latency and the depth of the channels are checked. If the latency is over
+    the budget, or a channel is more than half full, the pipeline is overloaded and the next knob (in the
+    configured order) that isn't at its maximum is raised, integer knobs are doubled and time knobs are
+    increased by their step. Once the latency is back under the low watermark of the budget and the channels
+    are empty, the last raised knob is lowered by a single step, so the load is added back slowly.
+    """
+    def __init__(self, knobs: LoadKnobs, channels: list = None, latency_budget: float = 0.5,
+                 low_watermark: float = 0.5, interval: float = 1.0, print_changes: bool = True):
+        """
+        :param knobs: The shared knobs to turn.
+        :param channels: The channels between the stages, anything with a qsize() and a capacity.
+        :param latency_budget: The end to end latency in seconds the pipeline should stay under.
+        :param low_watermark: Fraction of the budget the latency must be under before load is added back.
+        :param interval: Time in seconds between adjustments.
+        :param print_changes: If True, print every change of a knob.
+        """
+        self.knobs = knobs
+        self.channels = [channel for channel in (channels or []) if channel is not None]
+        self.latency_budget = latency_budget
+        self.low_watermark = low_watermark
+        self.interval = interval
+        self.print_changes = print_changes
+        self.adjustments = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="Load Controller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.step()
+
+    def _channel_fill(self) -> float:
+        fills = [channel.qsize() / channel.capacity for channel in self.channels if getattr(channel, 'capacity', 0)]
+        return max(fills, default=0.0)
+
+    def step(self):
+        """
+        Check the load once and turn a knob if needed.
+        """
+        latency = self.knobs.latency('endToEnd')
+        fill = self._channel_fill()
+
+        if latency > self.latency_budget or fill > 0.5:
+            # Overloaded, shed load with the first knob that can still be raised
+            for name in self.knobs.bounds:
+                value, bounds = self.knobs.get(name), self.knobs.bounds[name]
+                if value < bounds['max']:
+                    new_value = max(value * 2, value + 1) if name in INTEGER_KNOBS else value + bounds.get('step', 0.1)
+                    self._change(name, value, new_value, f"latency {latency:.3f}s, channel fill {fill:.0%}")
+                    break
+
+        elif latency < self.latency_budget * self.low_watermark and fill == 0:
+            # Headroom, add load back with the last knob that was raised
+            for name in reversed(list(self.knobs.bounds)):
+                value, bounds = self.knobs.get(name), self.knobs.bounds[name]
+                if value > bounds['min']:
+                    new_value = value - 1 if name in INTEGER_KNOBS else value - bounds.get('step', 0.1)
+                    self._change(name, value, new_value, f"latency {latency:.3f}s")
+                    break
+
+    def _change(self, name: str, old_value, new_value, reason: str):
+        self.knobs.set(name, new_value)
+        self.adjustments += 1
+        if self.print_changes:
+            print(f"Load controller: {name} {old_value} -> {self.knobs.get(name)} ({reason})")
@@ -0,0 +1,192 @@
+import yaml
+import os
+
+# The processes of the pipeline that can have their own scheduling settings
+PROCESS_NAMES = ('video', 'radar', 'radarAcquisition', 'tracking')
+
+class PipelineConfiguration:
+    """
+    A class to handle loading and accessing the pipeline configuration settings, how data moves
+    between the sensor processes and the tracking process.
+    The class checks for the existence of a YAML configuration file and
+    loads the settings. If the file is missing, default settings are applied.
+
+    Attributes:
+        config_path (str): The file path to the pipeline YAML configuration file.
+        channels (dict): The capacity and full policy of the channel for each sensor.
+        blockTimeoutSec (float): With the 'block' policy, how long a sensor waits for space before dropping the data.
+        loadController (dict): The latency budget of the load controller, and the bounds of the knobs it can turn.
+        radarStages (dict): If the radar processing runs as a graph of stages, and the placement of each stage.
+        radarAcquisition (dict): If the radar frames are acquired by a separate process, and the capacity of the shared memory ring of frames.
+        processes (dict): The cpu affinity, nice level and library thread counts of each process.
+        tracing (dict): If the end to end latency of every tracker update is traced, and if it is printed.
+        instrumentation (dict): If the latency histograms of each stage are recorded, and where they are written.
+        soak (dict): If the run is a soak test, its duration, how often it is sampled, and the memory and latency growth it fails at.
+    """
+
+    def __init__(self, config_path="/configuration/PipelineConfig.yaml"):
+        """
+        Initializes the PipelineConfiguration instance by checking if the configuration file exists.
+        If the file exists, it loads the configuration settings from it.
+        Otherwise, it assigns default values.
+
+        Args:
+            config_path (str): The path to the pipeline YAML configuration file.
+        """
+        self.config_path = config_path  # Path to the pipeline configuration file
+
+        # Default values if the YAML file is not found
+        self.defaults = {
+            'channels': {
+                'radar': {
+                    'capacity': 8,
+                    'policy': 'drop_oldest'
+                },
+                'image': {
+                    'capacity': 8,
+                    'policy': 'drop_oldest'
+                }
+            },
+            'blockTimeoutSec': 1.0,
+            'loadController': {
+                'enabled': False,
+                'latencyBudgetSec': 0.5,
+                'lowWatermark': 0.5,
+                'intervalSec': 1.0,
+                'knobs': {
+                    'trackerBatchTimeSec': {'min': 0.0, 'max': 0.5, 'step': 0.1},
+                    'movementMaskEvery': {'min': 1, 'max': 4},
+                    'radarDecimation': {'min': 1, 'max': 4},
+                    'videoStride': {'min': 1, 'max': 4}
+                }
+            },
+            'radarStages': {
+                'enabled': False,
+                'capacity': 4,
+                'policy': 'block',
+                'blockTimeoutSec': 1.0,
+                'placement': {
+                    'fft': 'inline',
+                    'cfar': 'inline',
+                    'movementMask': 'inline',
+                    'extraction': 'inline'
+                }
+            },
+            'radarAcquisition': {
+                'separateProcess': False,
+                'ringCapacity': 32
+            },
+            'processes': {
+                name: {
+                    'cpuAffinity': [],
+                    'nice': None,
+                    'threads': {'torch': None, 'blas': None, 'opencv': None}
+                } for name in PROCESS_NAMES
+            },
+            'tracing': {
+                'enabled': True,
+                'printUpdates': False,
+                'maxSamples': 10000
+            },
+            'instrumentation': {
+                'enabled': False,
+                'directory': None,  # The metrics folder of the run
+                'intervalSec': 10.0,
+                'prometheusPort': None
+            },
+            'soak': {
+                'enabled': False,
+                'durationSec': 3600,
+                'intervalSec': 30.0,
+                'warmupSec': 120.0,
+                'memoryGrowthMbPerHour': 20.0,
+                'latencyGrowth': 0.25,
+                'topObjectTypes': 20
+            }
+        }
+
+        # Load the configuration
+        self.load_config()
+
+    def load_config(self):
+        """
+        Loads the pipeline configuration from the YAML file if it exists. If the file doesn't exist,
+        it applies the default settings.
+        """
+        if os.path.exists(self.config_path):
+            with open(self.config_path, 'r') as file:
+                try:
+                    config = yaml.safe_load(file) or {}
+
+                    # Any channel setting missing from the file falls back to the default
+                    channels = config.get('channels', {}) or {}
+                    self.channels = {name: {**settings, **(channels.get(name) or {})}
+                                     for name, settings in self.defaults['channels'].items()}
+                    self.blockTimeoutSec = config.get('blockTimeoutSec', self.defaults['blockTimeoutSec'])
+                    
+                    # The knobs are used in the order they are listed in the file, missing knobs are not turned
+                    load_controller = config.get('loadController', {}) or {}
+                    self.loadController = {**self.defaults['loadController'], **load_controller}
+                    self.loadController['knobs'] = {name: {**self.defaults['loadController']['knobs'].get(name, {}), **(bounds or {})}
+                                                    for name, bounds in self.loadController['knobs'].items()}
+                    
+                    # Any stage missing from the placements stays inline
+                    radar_stages = config.get('radarStages', {}) or {}
+                    self.radarStages = {**self.defaults['radarStages'], **radar_stages}
+                    self.radarStages['placement'] = {**self.defaults['radarStages']['placement'], **(radar_stages.get('placement') or {})}
+                    self.radarAcquisition = {**self.defaults['radarAcquisition'], **(config.get('radarAcquisition', {}) or {})}
+                    
+                    # Any process or setting missing from the file keeps the default scheduling
+                    processes = config.get('processes', {}) or {}
+                    self.processes = {}
+                    for name, settings in self.defaults['processes'].items():
+                        process = processes.get(name) or {}
+                        self.processes[name] = {**settings, **process, 'threads': {**settings['threads'], **(process.get('threads') or {})}}
+                    
+                    self.tracing = {**self.defaults['tracing'], **(config.get('tracing', {}) or {})}
+                    self.instrumentation = {**self.defaults['instrumentation'], **(config.get('instrumentation', {}) or {})}
+                    self.soak = {**self.defaults['soak'], **(config.get('soak', {}) or {})}
+
+                except yaml.YAMLError as exc:
+                    print(f"Error reading YAML file: {exc}")
+                    self.apply_defaults()
+        else:
+            print(f"Pipeline configuration file not found. Using default settings.")
+            self.apply_defaults()
+
+    def apply_defaults(self):
+        """
+        Apply the default settings if the configuration file is not found or cannot be read.
+        """
+        self.channels = {name: dict(settings) for name, settings in self.defaults['channels'].items()}
+        self.blockTimeoutSec = self.defaults['blockTimeoutSec']
+        self.loadController = self.defaults['loadController']
+        self.radarStages = self.defaults['radarStages']
+        self.radarAcquisition = self.defaults['radarAcquisition']
+        self.processes = self.defaults['processes']
+        self.tracing = self.defaults['tracing']
+        self.instrumentation = self.defaults['instrumentation']
+        self.soak = self.defaults['soak']
+
+    def __str__(self):
+        """
+        Returns a string representation of the pipeline configuration.
+
+        Returns:
+            str: A formatted string displaying all configuration settings.
+        """
+        channels_str = '\n'.join(f"{name}: capacity {settings['capacity']}, policy {settings['policy']}" for name, settings in self.channels.items())
+        return f"PipelineConfiguration:\n" \
+               f"{channels_str}\n" \
+               f"blockTimeoutSec: {self.blockTimeoutSec}\n" \
+               f"loadController: {self.loadController}\n" \
+               f"radarStages: {self.radarStages}\n" \
+               f"radarAcquisition: {self.radarAcquisition}\n" \
+               f"processes: {self.processes}\n" \
+               f"tracing: {self.tracing}\n" \
+               f"instrumentation: {self.instrumentation}\n" \
+               f"soak: {self.soak}"
+
+if __name__ == "__main__":
+    pipeline_config = PipelineConfiguration()
+    print(pipeline_config)
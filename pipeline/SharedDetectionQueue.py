@@ -0,0 +1,208 @@
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from numpy.lib.recfunctions import structured_to_unstructured
+
+from constants import RADAR_DETECTION_TYPE, IMAGE_DETECTION_TYPE
+from tracking.DetectionsAtTime import DetectionsAtTime
+from tracking.DetectionBatch import DetectionBatch
+from tracking.TraceContext import TraceContext, TRACE_POINTS
+from pipeline.SharedRing import SharedRing
+
+# Sensor types, the index is stored in the 'sensor' field of the records
+SENSOR_TYPES = (RADAR_DETECTION_TYPE, IMAGE_DETECTION_TYPE)
+
+# A single detection
+DETECTION_DTYPE = np.dtype([
+    ('timestamp', np.int64),  # Nanoseconds of the naive timestamp, as pd.Timestamp.value
+    ('sensor', np.uint8),
+    ('class_id', np.int32),  # Index into the class name table of the queue
+    ('x', np.float32),
+    ('vx', np.float32),
+    ('y', np.float32),
+    ('vy', np.float32),
+    ('score', np.float32),
+])
+
+MAX_CLASS_NAMES = 256
+CLASS_NAME_DTYPE = np.dtype('S32')
+
+def detection_frame_dtype(max_detections: int) -> np.dtype:
+    """
+    The dtype of a single slot in the ring, all the detections of one DetectionsAtTime.
+    """
+    return np.dtype([
+        ('timestamp', np.int64),
+        ('sensor', np.uint8),
+        ('count', np.uint32),
+        ('trace', np.float64, (len(TRACE_POINTS),)),  # The times of the TraceContext, all NaN if there is none
+        ('detections', DETECTION_DTYPE, (max_detections,)),
+    ])
+
+class SharedDetectionQueue():
+    """
+    Drop in replacement for the mp.Queue of DetectionsAtTime between a sensor process and the tracking process.
+    Each DetectionsAtTime is written as a frame of fixed-size records into a SharedRing, so nothing is pickled.
+
+    There must only be a single producer (the sensor process) and a single consumer (the tracking process).
+
+    The object class names are stored in a small table in shared memory. The producer adds a name to the
+    table the first time it is seen, before the frame that uses it is published.
+
+    The producer can't remove frames from the ring, so when it is full the newest frame is dropped.
+    With 'keep_latest' the consumer skips straight to the newest frame on every get.
+
+    get() copies each frame out of the shared memory once, into the float64 arrays of a DetectionBatch: the
+    fusion scheduler holds the frames for up to its lateness window, longer than the slot could be held.
+    Consumers that process the frames in place can read them with zero copy with get_frames() and release_frames().
+    """
+    def __init__(self, max_detections: int = 256, capacity: int = 64, keep_latest: bool = False):
+        """
+        :param max_detections: The maximum number of detections in a frame, any more are dropped.
+        :param capacity: The number of frames the queue can hold.
+        :param keep_latest: If True, get() returns the newest frame and drops the older ones.
+        """
+        self.max_detections = max_detections
+        self.keep_latest = keep_latest
+        self.skipped = 0  # Consumer side, frames dropped by keep_latest
+        self.ring = SharedRing(detection_frame_dtype(max_detections), capacity)
+        self.class_names = shared_memory.SharedMemory(create=True, size=CLASS_NAME_DTYPE.itemsize * MAX_CLASS_NAMES)
+        self.truncated = 0
+        self._class_ids = {}  # Producer side, class name -> class id
+        self._class_name_cache = {}  # Consumer side, class id -> class name
+        self._class_table = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_class_table'] = None  # The view is rebuilt on the shared memory in the child process
+        return state
+
+    def _get_class_table(self) -> np.ndarray:
+        if self._class_table is None:
+            self._class_table = np.ndarray((MAX_CLASS_NAMES,), dtype=CLASS_NAME_DTYPE, buffer=self.class_names.buf)
+        return self._class_table
+
+    def _class_id(self, name: str) -> int:
+        class_id = self._class_ids.get(name)
+        if class_id is None:
+            if len(self._class_ids) >= MAX_CLASS_NAMES:
+                return -1
+            class_id = len(self._class_ids)
+            self._get_class_table()[class_id] = str(name).encode()[:CLASS_NAME_DTYPE.itemsize]
+            self._class_ids[name] = class_id
+        return class_id
+
+    def _class_name(self, class_id: int) -> str:
+        name = self._class_name_cache.get(class_id)
+        if name is None:
+            name = self._get_class_table()[class_id].decode() if class_id >= 0 else 'unknown'
+            self._class_name_cache[class_id] = name
+        return name
+
+    def put(self, detections_at_time: DetectionsAtTime) -> bool:
+        """
+        Write the detections into the next free frame. Returns False if the queue was full and they were dropped.
+        """
+        frame = self.ring.reserve()
+        if frame is None:
+            return False
+
+        detections = DetectionBatch.from_details(detections_at_time.detections)
+        count = min(len(detections), self.max_detections)
+        self.truncated += len(detections) - count
+
+        # Stored as the nanoseconds of the wall clock value, no time zone conversion, so it reads back the same
+        timestamp = pd.Timestamp(detections_at_time.timestamp).value
+        sensor = SENSOR_TYPES.index(detections_at_time.type)
+        frame['timestamp'] = timestamp
+        frame['sensor'] = sensor
+        frame['count'] = count
+        frame['trace'] = detections_at_time.trace.times if detections_at_time.trace is not None else np.nan
+        if count:
+            records = frame['detections'][:count]
+            records['timestamp'] = timestamp
+            records['sensor'] = sensor
+            class_ids = np.array([self._class_id(name) for name in detections.class_names], dtype=np.int32)
+            records['class_id'] = class_ids[detections.class_ids[:count]]
+            for column, field in enumerate(('x', 'vx', 'y', 'vy')):
+                records[field] = detections.data[:count, column]
+            records['score'] = detections.scores[:count]
+        self.ring.commit()
+        return True
+
+    def get_frames(self, timeout: float = None, max_frames: int = None) -> np.ndarray:
+        """
+        Zero copy view of the next available frames. The view is only valid until release_frames() is called.
+        Raises queue.Empty if no frame arrived within the timeout.
+        """
+        if not self.ring.wait(timeout):
+            raise queue.Empty
+        return self.ring.read(max_frames)
+
+    def release_frames(self, count: int):
+        """
+        Hand frames returned by get_frames() back to the producer.
+        """
+        self.ring.release(count)
+
+    def frame_to_detections_at_time(self, frame) -> DetectionsAtTime:
+        """
+        Convert a frame back into a DetectionsAtTime holding a DetectionBatch, copying the data out of the shared memory.
+        """
+        records = frame['detections'][:int(frame['count'])]
+        # A single copy of the consecutive float32 fields into the Nx4 float64 array of the batch
+        data = structured_to_unstructured(records[['x', 'vx', 'y', 'vy']], dtype=float)
+        # Index the classes of the frame into the class names of the batch
+        frame_class_ids, class_ids = np.unique(records['class_id'], return_inverse=True)
+        class_names = [self._class_name(int(class_id)) for class_id in frame_class_ids]
+        detections = DetectionBatch(data, class_ids, class_names, records['score'])
+        trace = None if np.isnan(frame['trace']).all() else TraceContext(frame['trace'])
+        return DetectionsAtTime(pd.Timestamp(int(frame['timestamp'])), SENSOR_TYPES[int(frame['sensor'])], detections, trace)
+
+    def get(self, block: bool = True, timeout: float = None) -> DetectionsAtTime:
+        """
+        Get the next DetectionsAtTime, the same as mp.Queue.get(). Raises queue.Empty if none arrived within the timeout.
+        """
+        frames = self.get_frames(timeout if block else 0, max_frames=1)
+        if self.keep_latest:
+            # Skip to the newest frame, the view may stop at the end of the buffer so read until it is empty
+            while self.ring.available() > 1:
+                skip = min(self.ring.available() - 1, len(self.ring.read()))
+                self.release_frames(skip)
+                self.skipped += skip
+            frames = self.ring.read(1)
+        detections_at_time = self.frame_to_detections_at_time(frames[0])
+        self.release_frames(1)
+        return detections_at_time
+
+    def empty(self) -> bool:
+        return self.ring.empty()
+
+    def qsize(self) -> int:
+        return len(self.ring)
+
+    @property
+    def capacity(self) -> int:
+        return self.ring.capacity
+
+    @property
+    def dropped(self) -> int:
+        """
+        The number of frames dropped because the queue was full, or skipped by keep_latest.
+        """
+        return self.ring.dropped + self.skipped
+
+    @property
+    def high_water(self) -> int:
+        return self.ring.high_water
+
+    def close(self):
+        self.ring.close()
+        self._class_table = None
+        self.class_names.close()
+
+    def unlink(self):
+        self.ring.unlink()
+        self.class_names.unlink()
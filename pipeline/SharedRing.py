@@ -0,0 +1,198 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Header of the ring, [head, tail, dropped, high water], each an int64 at the start of the shared memory block
+HEADER_DTYPE = np.dtype(np.int64)
+HEADER_FIELDS = 4
+HEAD, TAIL, DROPPED, HIGH_WATER = range(HEADER_FIELDS)
+
+class SharedRing():
+    """
+    Single producer, single consumer ring buffer of fixed-size structured NumPy records in shared memory.
+
+    The producer only writes 'head' and the consumer only writes 'tail', so no lock is needed.
+    The slots are handed between the processes by two counting semaphores, one permit per record:
+    - 'filled' is released by the producer after it has written a record, and acquired by the consumer
+      before it reads the record.
+    - 'free' is acquired by the producer before it writes into a slot, and released by the consumer once
+      it has finished reading the slot.
+    The semaphores are the memory barriers between the processes, the slots and the indexes are plain
+    loads and stores, so neither side may use a slot it doesn't hold a permit for. 'head' and 'tail' are
+    only read across the processes for the depth of the ring, which is just an estimate.
+
+    If the ring is full the new record is dropped (the producer never waits on the consumer) and the
+    drop is counted in the header. The producer also keeps the most records the ring has held (the high water mark).
+
+    The consumer can read records with zero copy, read() returns a view of the slots which stays valid
+    until release() is called for them.
+
+    The ring can be passed to a child process as an argument of mp.Process, the child attaches to the
+    same shared memory block. Only the process that created the ring should call unlink().
+    """
+    def __init__(self, dtype: np.dtype, capacity: int = 64, name: str = None):
+        """
+        Create a new ring in shared memory.
+
+        :param dtype: The structured NumPy dtype of a single record.
+        :param capacity: The number of records the ring can hold.
+        :param name: Optional name of the shared memory block, a unique name is generated if not given.
+        """
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        size = HEADER_DTYPE.itemsize * HEADER_FIELDS + self.dtype.itemsize * capacity
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._filled = mp.Semaphore(0)
+        self._free = mp.Semaphore(capacity)
+        self._available = 0  # Consumer side, 'filled' permits held for the records not released yet
+        self._attach()
+        self._header[:] = 0
+
+    def _attach(self):
+        header_size = HEADER_DTYPE.itemsize * HEADER_FIELDS
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=HEADER_DTYPE, buffer=self._shm.buf)
+        self._slots = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self._shm.buf, offset=header_size)
+
+    def __getstate__(self):
+        # Only the name is sent to the child process, which attaches to the existing block
+        return {'dtype': self.dtype, 'capacity': self.capacity, 'name': self._shm.name, 'filled': self._filled, 'free': self._free}
+
+    def __setstate__(self, state):
+        self.dtype = state['dtype']
+        self.capacity = state['capacity']
+        self._filled = state['filled']
+        self._free = state['free']
+        self._available = 0
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._attach()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def dropped(self) -> int:
+        """
+        The number of records dropped because the ring was full.
+        """
+        return int(self._header[DROPPED])
+
+    @property
+    def high_water(self) -> int:
+        """
+        The most records the ring has held at once.
+        """
+        return int(self._header[HIGH_WATER])
+
+    def __len__(self):
+        """
+        The number of records in the ring, an estimate when called from the other process.
+        """
+        return int(self._header[HEAD] - self._header[TAIL])
+
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    # Producer side
+
+    def reserve(self):
+        """
+        Get the next free slot to be filled in place, or None if the ring is full.
+        The record is only visible to the consumer once commit() is called.
+        """
+        if not self._free.acquire(block=False):
+            self._header[DROPPED] += 1
+            return None
+        return self._slots[int(self._header[HEAD]) % self.capacity]
+
+    def commit(self):
+        """
+        Publish the slot returned by reserve() and notify the consumer.
+        """
+        self._header[HEAD] += 1
+        depth = len(self)
+        if depth > self._header[HIGH_WATER]:
+            self._header[HIGH_WATER] = depth
+        self._filled.release()
+
+    def put(self, record) -> bool:
+        """
+        Copy a record into the ring. Returns False if the ring was full and the record was dropped.
+        """
+        if self.reserve() is None:
+            return False
+        self._slots[int(self._header[HEAD]) % self.capacity] = record
+        self.commit()
+        return True
+
+    # Consumer side
+
+    def available(self) -> int:
+        """
+        The number of records the consumer can read now, taking the permits of the records published since the last call.
+        """
+        while self._available < self.capacity and self._filled.acquire(block=False):
+            self._available += 1
+        return self._available
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until at least one record is available, or the timeout in seconds passes.
+        Returns True if a record is available.
+        """
+        if self._available > 0:
+            return True
+        if not self._filled.acquire(timeout=timeout):
+            return False
+        self._available += 1
+        return True
+
+    def read(self, max_items: int = None) -> np.ndarray:
+        """
+        Zero copy view of the next available records, without removing them from the ring.
+        The view only covers the records up to the end of the buffer, the rest are returned by the next read.
+        The view must not be used after release() is called for it.
+        """
+        tail = int(self._header[TAIL])
+        start = tail % self.capacity
+        count = min(self.available(), self.capacity - start)
+        if max_items is not None:
+            count = min(count, max_items)
+        return self._slots[start:start + count]
+
+    def release(self, count: int):
+        """
+        Hand the oldest 'count' records back to the producer, once they have been processed.
+        Only records returned by read() can be released.
+        """
+        if count > self._available:
+            raise ValueError(f"Releasing {count} records, only {self._available} were read")
+        self._header[TAIL] += count
+        self._available -= count
+        for _ in range(count):
+            self._free.release()
+
+    def get(self, timeout: float = None):
+        """
+        Copy out the oldest record and release it, or None if no record arrived within the timeout.
+        """
+        if not self.wait(timeout):
+            return None
+        record = self.read(1)[0].copy()
+        self.release(1)
+        return record
+
+    def close(self):
+        """
+        Detach from the shared memory, call in every process using the ring once it is finished with it.
+        """
+        self._header = None
+        self._slots = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Free the shared memory block, only called by the process that created the ring.
+        """
+        self._shm.unlink()
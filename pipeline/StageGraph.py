@@ -0,0 +1,290 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+from pipeline.BoundedChannel import BoundedChannel, BLOCK, KEEP_LATEST, POLICIES
+from pipeline.instrumentation import start_child_instrumentation, stop_instrumentation
+
+# Where a stage runs
+INLINE = 'inline'  # In the same worker as the stage before it, no channel between them
+THREAD = 'thread'  # In its own thread, in the process that started the graph
+PROCESS = 'process'  # In its own process, so it can use its own core
+PLACEMENTS = (INLINE, THREAD, PROCESS)
+
+class EndOfStream():
+    """
+    Sent through the channels when the graph is stopped, each worker passes it on and exits.
+    """
+
+class Stage():
+    """
+    A single step of the processing, declared by a factory so its state is created in the worker it runs in.
+
+    The factory is called once in the worker with 'args', and returns the function that processes each item.
+    The function returns the item for the next stage, or None to drop the item (the following stages are skipped).
+    For the 'process' placement the factory, its args and the items must be picklable.
+    """
+    def __init__(self, name: str, factory, args: tuple = (), placement: str = INLINE, output_type: type = None):
+        """
+        :param name: Name of the stage, used for the workers and the timing.
+        :param factory: Called as factory(*args) in the worker, returns the function that processes each item.
+        :param args: Arguments of the factory.
+        :param placement: Where the stage runs, one of 'inline', 'thread' or 'process'.
+        :param output_type: The type of the items the stage produces, checked when they are put into a channel.
+        """
+        if placement not in PLACEMENTS:
+            raise ValueError(f"Unknown placement '{placement}' for stage '{name}', options are {', '.join(PLACEMENTS)}")
+        self.name = name
+        self.factory = factory
+        self.args = args
+        self.placement = placement
+        self.output_type = output_type
+
+class StageChannel():
+    """
+    Typed bounded channel between two workers of the graph.
+    Between threads a plain queue.Queue is used, a BoundedChannel is only used when a process is involved.
+    """
+    def __init__(self, name: str, item_type: type = None, capacity: int = 4, policy: str = BLOCK,
+                 block_timeout: float = 1.0, between_processes: bool = False):
+        """
+        :param name: Name of the channel, the stages either side of it.
+        :param item_type: The type every item put into the channel must have, None to accept anything.
+        :param capacity: The maximum number of items in the channel.
+        :param policy: What to do when the channel is full, as for the BoundedChannel.
+        :param block_timeout: With the 'block' policy, how long in seconds to wait for space before dropping the item.
+        :param between_processes: If True the channel crosses a process boundary.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown channel policy '{policy}', options are {', '.join(POLICIES)}")
+        self.name = name
+        self.item_type = item_type
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.between_processes = between_processes
+        self.dropped = 0
+        if between_processes:
+            self._queue = BoundedChannel(capacity, policy, block_timeout, name=name)
+        else:
+            self._queue = queue.Queue(maxsize=capacity)
+
+    def put(self, item) -> bool:
+        """
+        Put an item into the channel, returns False if it was dropped because the channel was full.
+        Raises a TypeError if the item isn't of the channel's type.
+        """
+        if self.item_type is not None and not isinstance(item, (self.item_type, EndOfStream)):
+            raise TypeError(f"Channel '{self.name}' expects {self.item_type.__name__}, got {type(item).__name__}")
+        if self.between_processes:
+            return self._queue.put(item)
+
+        if self.policy == BLOCK:
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                # Make space by dropping the oldest item
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None):
+        """
+        Get the next item, raises queue.Empty if no item arrived within the timeout.
+        """
+        item = self._queue.get(timeout=timeout)
+        if self.policy == KEEP_LATEST and not self.between_processes:
+            while not isinstance(item, EndOfStream):
+                try:
+                    item = self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+        return item
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        if self.between_processes:
+            return self._queue.stats()
+        return {'depth': self.qsize(), 'dropped': self.dropped}
+
+class _StageRunner():
+    """
+    Runs a group of stages one after the other, and keeps the time spent in each.
+    """
+    def __init__(self, stages: list):
+        self.stages = stages
+        self.functions = [stage.factory(*stage.args) for stage in stages]
+        self.counts = [0] * len(stages)
+        self.seconds = [0.0] * len(stages)
+
+    def __call__(self, item):
+        for index, function in enumerate(self.functions):
+            start = time.perf_counter()
+            item = function(item)
+            self.seconds[index] += time.perf_counter() - start
+            self.counts[index] += 1
+            if item is None:
+                return None
+        return item
+
+    def timing(self) -> str:
+        return ', '.join(f"{stage.name} {count} in {seconds:.3f}s" + (f" ({seconds / count * 1000:.2f}ms avg)" if count else "")
+                         for stage, count, seconds in zip(self.stages, self.counts, self.seconds))
+
+def _run_worker(stages: list, inbox: StageChannel, outbox: StageChannel, sink, stop_event, poll_interval: float = 0.1):
+    """
+    Target of the thread and process workers, processes the items of the inbox until the end of the stream.
+    """
+    # A process worker exports its own histograms
+    instrumented = start_child_instrumentation('_'.join(stage.name for stage in stages))
+    runner = _StageRunner(stages)
+    while True:
+        try:
+            item = inbox.get(timeout=poll_interval)
+        except queue.Empty:
+            if stop_event is not None and stop_event.is_set():
+                break
+            continue
+        except (EOFError, OSError):
+            break  # The channel was closed
+        if isinstance(item, EndOfStream):
+            break
+        item = runner(item)
+        if item is None:
+            continue
+        if outbox is not None:
+            outbox.put(item)
+        elif sink is not None:
+            sink(item)
+    if outbox is not None:
+        outbox.put(EndOfStream())
+    print(f"Stages finished: {runner.timing()}")
+    if instrumented:
+        stop_instrumentation()
+
+class StageGraph():
+    """
+    Runs a chain of stages, with each stage placed inline, in a thread or in a process.
+
+    Consecutive inline stages are merged into the worker of the stage before them, so they pass items by a
+    plain function call. A 'thread' or 'process' stage starts a new worker, and a typed bounded channel is
+    placed between it and the worker before it. The stages before the first thread or process stage run
+    in the caller of put(). Moving a stage to its own core, or merging stages to save the IPC, is a change
+    of the placements only.
+    """
+    def __init__(self, stages: list, capacity: int = 4, policy: str = BLOCK, block_timeout: float = 1.0, name: str = "Stages"):
+        """
+        :param stages: The stages, in the order the items pass through them.
+        :param capacity: The capacity of each channel between the workers.
+        :param policy: What to do when a channel is full, one of 'block', 'drop_oldest' or 'keep_latest'.
+        :param block_timeout: With the 'block' policy, how long in seconds to wait for space before dropping the item.
+        :param name: Name of the graph, used for the workers.
+        """
+        self.stages = stages
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        # Split the stages into the groups that run in the same worker
+        self.groups = [[]]
+        self.group_placements = [INLINE]
+        for stage in stages:
+            if stage.placement == INLINE:
+                self.groups[-1].append(stage)
+            else:
+                self.groups.append([stage])
+                self.group_placements.append(stage.placement)
+
+        self.channels = []
+        self._workers = []
+        self._runner = None
+        self._first_channel = None
+        self._sink = None
+
+    def _group_type(self, group_index: int):
+        """
+        The type of the items leaving a group, from the last stage that declares one.
+        """
+        for stage in reversed(self.groups[group_index]):
+            if stage.output_type is not None:
+                return stage.output_type
+        return None if group_index == 0 else self._group_type(group_index - 1)
+
+    def start(self, sink=None, stop_event=None):
+        """
+        Start the workers.
+        :param sink: Called with the output of the last stage, in the worker of the last stage. It must be picklable if that is a process.
+        :param stop_event: Optional event, the workers also exit when it is set.
+        """
+        self._sink = sink
+
+        # A channel before every group after the first, it needs to cross processes if either side is a process
+        self.channels = []
+        for group_index in range(1, len(self.groups)):
+            between_processes = PROCESS in (self.group_placements[group_index - 1], self.group_placements[group_index])
+            name = f"{self.groups[group_index - 1][-1].name if self.groups[group_index - 1] else 'source'} -> {self.groups[group_index][0].name}"
+            self.channels.append(StageChannel(name, self._group_type(group_index - 1), self.capacity, self.policy,
+                                              self.block_timeout, between_processes=between_processes))
+
+        # Thread workers run in the process that started the graph
+        self._runner = _StageRunner(self.groups[0])
+        self._first_channel = self.channels[0] if self.channels else None
+        self._workers = []
+        for group_index in range(1, len(self.groups)):
+            inbox = self.channels[group_index - 1]
+            outbox = self.channels[group_index] if group_index < len(self.channels) else None
+            group_sink = sink if outbox is None else None
+            worker_name = f"{self.name} {'/'.join(stage.name for stage in self.groups[group_index])}"
+            if self.group_placements[group_index] == PROCESS:
+                worker = mp.Process(name=worker_name, target=_run_worker, args=(self.groups[group_index], inbox, outbox, group_sink, stop_event))
+            else:
+                worker = threading.Thread(name=worker_name, target=_run_worker, args=(self.groups[group_index], inbox, outbox, group_sink, stop_event), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def put(self, item) -> bool:
+        """
+        Run an item through the inline stages, and pass it on to the next worker.
+        Returns False if the item was dropped by a stage or a full channel.
+        """
+        item = self._runner(item)
+        if item is None:
+            return False
+        if self._first_channel is not None:
+            return self._first_channel.put(item)
+        if self._sink is not None:
+            self._sink(item)
+        return True
+
+    def stop(self):
+        """
+        Send the end of the stream through the graph, and wait for the workers to process what they hold.
+        """
+        if self._first_channel is not None:
+            self._first_channel.put(EndOfStream())
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        if self._runner.stages:
+            print(f"Stages finished: {self._runner.timing()}")
+
+    def stats(self) -> dict:
+        return {channel.name: channel.stats() for channel in self.channels}
+
+    def __str__(self):
+        return f"{self.name}: " + ' -> '.join(f"{stage.name} ({stage.placement})" for stage in self.stages)
@@ -0,0 +1,41 @@
+import multiprocessing as mp
+import time
+from contextlib import contextmanager
+
+class StartupTimer():
+    """
+    Times the start of a process, split into its steps (importing a subsystem, building a model, ...), for the startup report.
+
+    Usage:
+        timer = StartupTimer()
+        with timer.step('import radar'):
+            from radar.radar_tracking import RadarTracking
+        timer.report()
+    """
+    def __init__(self, name: str = None, start: float = None):
+        """
+        :param name: Name of the process, the name of the current process by default.
+        :param start: perf_counter() time the process started at, now by default.
+        """
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.steps = []
+
+    @contextmanager
+    def step(self, name: str):
+        step_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - step_start))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def report(self):
+        """
+        Print the time the process took to be ready, and the time of each step.
+        """
+        name = self.name or mp.current_process().name
+        steps_str = ', '.join(f"{step} {seconds:.2f}s" for step, seconds in self.steps)
+        print(f"Startup of '{name}': ready in {self.elapsed():.2f}s" + (f" ({steps_str})" if steps_str else ""))
@@ -0,0 +1 @@
+# init
\ No newline at end of file
@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+from pipeline.instrumentation import read_histograms
+
+# The files of the benchmark folder
+METRICS_FOLDER = 'metrics'  # The latency histograms each process writes
+TRACE_FILE = 'trace.json'  # The end to end latency the tracking process writes
+REPORT_FILE = 'benchmark.json'
+
+def wait_for_replay_end(stop_event, source_processes: list, channels: list, settle_time: float = 1.0, poll_interval: float = 0.1):
+    """
+    Wait for the source processes to finish replaying their recordings, then for the data still in the queues to
+    be processed, and stop the pipeline.
+
+    :param source_processes: The processes that read the recordings, they exit at the end of their recording.
+    :param channels: The queues and rings between the processes, None for those not used.
+    :param settle_time: The time the queues have to stay empty for, for the last frames to get through the
+        processing and the lateness of the fusion.
+    """
+    for process in source_processes:
+        process.join()
+    empty_since = None
+    while not stop_event.is_set():
+        if all(channel.empty() for channel in channels if channel is not None):
+            empty_since = empty_since if empty_since is not None else time.monotonic()
+            if time.monotonic() - empty_since >= settle_time:
+                break
+        else:
+            empty_since = None
+        time.sleep(poll_interval)
+    stop_event.set()
+
+def queue_stats(channels: dict) -> dict:
+    """
+    The capacity, the high water mark and the dropped frames of each queue, by name.
+    """
+    return {name: {'capacity': channel.capacity, 'highWater': channel.high_water, 'dropped': channel.dropped}
+            for name, channel in channels.items() if channel is not None}
+
+def stage_stats(histograms: dict, duration: float) -> dict:
+    """
+    The throughput and latency of each stage recorded by the processes, by '<process>.<stage>'.
+
+    framesPerSec is the rate the stage ran at over the whole replay, busyFramesPerSec the rate it could run at if it
+    never waited for input. The percentiles are the upper bounds of the histogram buckets they fall in.
+    """
+    stages = {}
+    for process_name, process_histograms in sorted(histograms.items()):
+        for stage, histogram in sorted(process_histograms.items()):
+            # The end to end latency is reported from the exact samples of the trace
+            if stage.startswith('trace_') or histogram.count == 0:
+                continue
+            stages[f"{process_name}.{stage}"] = {
+                'count': histogram.count,
+                'framesPerSec': histogram.count / duration if duration else 0.0,
+                'busyFramesPerSec': histogram.count / histogram.sum if histogram.sum else 0.0,
+                'meanMs': histogram.sum / histogram.count * 1000,
+                'p50Ms': histogram.quantile(0.5) * 1000,
+                'p95Ms': histogram.quantile(0.95) * 1000,
+                'p99Ms': histogram.quantile(0.99) * 1000,
+            }
+    return stages
+
+def write_benchmark_report(directory: str, wall_duration: float, channels: dict, settings: dict = None) -> dict:
+    """
+    Collect the results of a benchmark run from the files the processes wrote to the benchmark folder, and the
+    queues, into '<directory>/benchmark.json'. Called once all the processes have finished.
+
+    The rates are over the span of the trace, from the first frame acquired to the last track output, so they
+    leave out the start of the processes (the imports, the model loads) and the wait for the queues to settle.
+
+    :param wall_duration: The seconds from the start of the processes to the end of the replay, only used for the
+        rates if the trace has no span.
+    :param channels: The queues and rings between the processes, by name.
+    :param settings: The settings of the run, to tell the runs apart (sources, label, options).
+    """
+    # Only needed for the report, it loads the radar processing
+    from benchmarks.dsp_benchmark import environment
+
+    trace_path = os.path.join(directory, TRACE_FILE)
+    end_to_end = None
+    if os.path.exists(trace_path):
+        with open(trace_path) as file:
+            end_to_end = json.load(file)
+    duration = (end_to_end or {}).get('spanSec') or wall_duration
+    duration_source = 'trace' if duration != wall_duration else 'wall'
+
+    stages = stage_stats(read_histograms(os.path.join(directory, METRICS_FOLDER)), duration)
+    tracker_updates = next((stage for name, stage in stages.items() if name.endswith('.tracker_update')), None)
+
+    report = {
+        'environment': environment(),
+        'settings': settings or {},
+        'durationSec': duration,
+        'durationSource': duration_source,  # 'trace', first frame acquired to last track output, or 'wall'
+        'wallDurationSec': wall_duration,
+        'stages': stages,
+        'queues': queue_stats(channels),
+        'tracker': {
+            'updates': tracker_updates['count'] if tracker_updates else 0,
+            'updatesPerSec': tracker_updates['framesPerSec'] if tracker_updates else 0.0,
+            'busyUpdatesPerSec': tracker_updates['busyFramesPerSec'] if tracker_updates else 0.0,
+        },
+        'endToEnd': end_to_end,
+    }
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, REPORT_FILE), 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(f"Benchmark over {duration:.1f}s, from the first frame acquired to the last track output:"
+          if duration_source == 'trace' else f"Benchmark over {duration:.1f}s, no trace, from the start of the processes to the end of the replay:")
+    for name, stage in stages.items():
+        print(f"  {name:<40} {stage['count']:>7d} frames {stage['framesPerSec']:>8.1f}/s (busy {stage['busyFramesPerSec']:>8.1f}/s) mean {stage['meanMs']:>7.2f}ms")
+    for name, stats in report['queues'].items():
+        print(f"  queue {name:<34} high water {stats['highWater']}/{stats['capacity']}, {stats['dropped']} dropped")
+    print(f"  tracker updates {report['tracker']['updates']}, {report['tracker']['updatesPerSec']:.1f}/s")
+    for sensor, segments in (end_to_end or {}).get('sensors', {}).items():
+        if 'endToEnd' in segments:
+            latency = segments['endToEnd']
+            print(f"  {sensor} end to end p50 {latency['p50Ms']:.1f}ms p95 {latency['p95Ms']:.1f}ms p99 {latency['p99Ms']:.1f}ms")
+    print(f"Benchmark report written to {os.path.join(directory, REPORT_FILE)}")
+    return report
@@ -0,0 +1,267 @@
+import glob
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the histogram buckets in seconds, from 0.5ms to 10s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_NAME = 'pipeline_stage_seconds'
+PROMETHEUS_LINE = re.compile(rf'^{METRIC_NAME}_(bucket|sum|count){{process="([^"]*)",stage="([^"]*)"(?:,le="([^"]*)")?}} (\S+)$')
+PROMETHEUS_HEADER = f'# HELP {METRIC_NAME} Latency of each stage of the pipeline in seconds.\n# TYPE {METRIC_NAME} histogram\n'
+
+class LatencyHistogram():
+    """
+    Fixed bucket histogram of the latency of a stage, as a Prometheus histogram.
+    Observing a value is a binary search and a few additions, so it can be used on every frame.
+    """
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate of the quantile, the upper bound of the bucket it falls in.
+        """
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def to_prometheus(self, labels: str) -> list:
+        """
+        The lines of the histogram in the Prometheus text format, with cumulative buckets.
+        """
+        lines = []
+        cumulative = 0
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{{labels}}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{{labels}}} {count}')
+        return lines
+
+# The histograms of this process, by stage name. Nothing is recorded until the instrumentation is enabled.
+_histograms = {}
+_histograms_lock = threading.Lock()
+_enabled = False
+_settings = None
+_process_name = None
+_exporter = None
+
+def enabled() -> bool:
+    return _enabled
+
+def histogram(stage: str) -> LatencyHistogram:
+    stage_histogram = _histograms.get(stage)
+    if stage_histogram is None:
+        with _histograms_lock:
+            stage_histogram = _histograms.setdefault(stage, LatencyHistogram())
+    return stage_histogram
+
+def observe(stage: str, seconds: float):
+    """
+    Record a latency of the stage, in seconds.
+    """
+    if _enabled:
+        histogram(stage).observe(seconds)
+
+@contextmanager
+def timer(stage: str):
+    """
+    Time the block with the monotonic clock, and record it as a latency of the stage.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(stage).observe(time.perf_counter() - start)
+
+def timed(stage: str):
+    """
+    Decorator that records the time of every call of the function as a latency of the stage.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram(stage).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def prometheus_text(process_name: str = None) -> str:
+    """
+    All the histograms of this process in the Prometheus text format.
+    """
+    process_name = process_name or _process_name
+    lines = [PROMETHEUS_HEADER.rstrip('\n')]
+    for stage, stage_histogram in sorted(_histograms.items()):
+        lines.extend(stage_histogram.to_prometheus(f'process="{process_name}",stage="{stage}"'))
+    return '\n'.join(lines) + '\n'
+
+def summary() -> str:
+    """
+    Short summary of each stage, for printing.
+    """
+    return ', '.join(f"{stage} n={h.count} mean={h.sum / h.count * 1000:.2f}ms p95<={h.quantile(0.95) * 1000:g}ms"
+                     for stage, h in sorted(_histograms.items()) if h.count)
+
+class MetricsExporter():
+    """
+    Writes the histograms of the process to '<directory>/<process>.prom' every interval, in the Prometheus text
+    format. The file is replaced atomically, so it can be read at any time (e.g. by the node exporter textfile collector).
+    """
+    def __init__(self, directory: str, process_name: str, interval: float = 10.0):
+        self.directory = directory
+        self.process_name = process_name
+        self.interval = interval
+        self.path = os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', process_name)}.prom")
+        self.pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Metrics Exporter", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            file.write(prometheus_text(self.process_name))
+        os.replace(temp_path, self.path)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+def start_instrumentation(settings: dict, process_name: str):
+    """
+    Enable the instrumentation in this process if it is configured, and start writing its histograms to file.
+    Called at the start of each process, a process started by fork has to call it again to export its own histograms.
+
+    :param settings: The 'instrumentation' settings of the pipeline configuration.
+    :param process_name: Name of the process, used for the label and the file name.
+    """
+    global _enabled, _settings, _process_name, _exporter
+    if not settings or not settings.get('enabled'):
+        return
+    _settings = settings
+    # The histograms of the parent process are copied by fork, start from empty
+    if _exporter is not None and _exporter.pid != os.getpid():
+        _histograms.clear()
+        _exporter = None
+    _enabled = True
+    _process_name = process_name
+    if _exporter is None:
+        _exporter = MetricsExporter(settings['directory'], process_name, settings['intervalSec'])
+        _exporter.start()
+
+def start_child_instrumentation(process_name: str) -> bool:
+    """
+    In a process forked from an instrumented process, export the histograms of this process under its own name.
+    Does nothing in the process that started the instrumentation, or if it isn't enabled.
+    Returns True if the instrumentation was started.
+    """
+    if _settings is not None and (_exporter is None or _exporter.pid != os.getpid()):
+        start_instrumentation(_settings, process_name)
+        return True
+    return False
+
+def stop_instrumentation():
+    """
+    Write the final histograms of this process, and print a summary.
+    """
+    global _exporter
+    if _exporter is None or _exporter.pid != os.getpid():
+        return
+    _exporter.stop()
+    _exporter = None
+    print(f"Latency of '{_process_name}': {summary()}")
+
+def read_histograms(directory: str) -> dict:
+    """
+    Read back the histograms the processes wrote to the directory, as {process: {stage: LatencyHistogram}}.
+    """
+    histograms = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.prom'))):
+        cumulative_counts = {}
+        with open(path) as file:
+            for line in file:
+                match = PROMETHEUS_LINE.match(line.strip())
+                if match is None:
+                    continue
+                kind, process_name, stage, bound, value = match.groups()
+                stage_histogram = histograms.setdefault(process_name, {}).setdefault(stage, LatencyHistogram())
+                if kind == 'bucket':
+                    cumulative_counts.setdefault((process_name, stage), []).append(int(float(value)))
+                elif kind == 'sum':
+                    stage_histogram.sum = float(value)
+                else:
+                    stage_histogram.count = int(float(value))
+        # The buckets are written cumulative, in the order of the bounds
+        for (process_name, stage), counts in cumulative_counts.items():
+            stage_histogram = histograms[process_name][stage]
+            if len(counts) == len(stage_histogram.counts):
+                stage_histogram.counts = [count - previous for count, previous in zip(counts, [0] + counts[:-1])]
+    return histograms
+
+def serve_metrics(directory: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the histograms the processes write to the directory at http://localhost:<port>/metrics, for Prometheus to scrape.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            # Every file has the same header, it is only sent once
+            lines = [line for path in sorted(glob.glob(os.path.join(directory, '*.prom'))) 
+                     for line in open(path).read().splitlines() if not line.startswith('#')]
+            body = (PROMETHEUS_HEADER + '\n'.join(lines) + '\n').encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Don't print every scrape
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="Metrics Server", daemon=True).start()
+    print(f"Serving the pipeline metrics at http://127.0.0.1:{port}/metrics")
+    return server
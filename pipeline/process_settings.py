@@ -0,0 +1,105 @@
+import multiprocessing as mp
+import os
+import sys
+
+from threadpoolctl import threadpool_info, threadpool_limits
+
+# Environment variables read by the BLAS/OpenMP libraries when they are loaded
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+def apply_process_settings(settings: dict, print_settings: bool = True) -> dict:
+    """
+    Apply the scheduling settings of a pipeline process, called at the start of the process.
+    Settings that are None (or an empty affinity) are left at their default.
+
+    :param settings: {'cpuAffinity': list of cpu indexes, 'nice': nice level, 'threads': {'torch', 'blas', 'opencv'}}
+    :param print_settings: If True, print the effective values once applied.
+    :return: The effective values of the process.
+    """
+    affinity = settings.get('cpuAffinity')
+    if affinity:
+        try:
+            os.sched_setaffinity(0, affinity)
+        except (AttributeError, OSError) as exc:
+            print(f"Could not set the cpu affinity to {affinity}: {exc}")
+
+    nice = settings.get('nice')
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except (AttributeError, OSError) as exc:
+            # Raising the priority (a negative nice level) needs extra privileges
+            print(f"Could not set the nice level to {nice}: {exc}")
+
+    threads = settings.get('threads') or {}
+    set_library_threads(threads.get('torch'), threads.get('blas'), threads.get('opencv'))
+
+    effective = effective_process_settings()
+    if print_settings:
+        print(f"Process '{mp.current_process().name}' settings: {effective}")
+    return effective
+
+def set_library_threads(torch_threads: int = None, blas_threads: int = None, opencv_threads: int = None):
+    """
+    Limit the thread pools of the numerical libraries.
+    Torch and OpenCV are only limited if they are available, they are imported here when a limit is given.
+    """
+    if blas_threads is not None:
+        # For the libraries loaded after this point, and the processes started from this one
+        for env_var in THREAD_ENV_VARS:
+            os.environ[env_var] = str(blas_threads)
+        # For the libraries that are already loaded, numpy and scipy
+        threadpool_limits(limits=blas_threads)
+
+    if torch_threads is not None:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+
+    if opencv_threads is not None:
+        try:
+            import cv2
+            cv2.setNumThreads(opencv_threads)
+        except ImportError:
+            pass
+
+def effective_process_settings() -> dict:
+    """
+    The scheduling settings the process is running with. Libraries that haven't been imported by the process are not reported.
+    """
+    effective = {}
+    if hasattr(os, 'sched_getaffinity'):
+        effective['cpuAffinity'] = sorted(os.sched_getaffinity(0))
+    if hasattr(os, 'getpriority'):
+        effective['nice'] = os.getpriority(os.PRIO_PROCESS, 0)
+
+    effective['blasThreads'] = {pool['internal_api']: pool['num_threads'] for pool in threadpool_info()}
+    if 'torch' in sys.modules:
+        effective['torchThreads'] = sys.modules['torch'].get_num_threads()
+    if 'cv2' in sys.modules:
+        effective['opencvThreads'] = sys.modules['cv2'].getNumThreads()
+    return effective
+
+def run_with_process_settings(settings: dict, target, *args):
+    """
+    Target for mp.Process, applies the process settings before running the target with its arguments.
+    If the settings have a 'profile', the target is run under the profiler.
+    If the settings have a 'soak', the memory and the objects of the process are sampled while the target runs.
+    """
+    sampler = None
+    if settings is not None:
+        apply_process_settings(settings)
+        if settings.get('soak'):
+            from pipeline.soak import SoakSampler
+            sampler = SoakSampler.for_process(settings['soak'])
+            sampler.start()
+    try:
+        if settings is not None and settings.get('profile'):
+            from pipeline.profiling import run_profiled
+            return run_profiled(settings['profile'], target, *args)
+        return target(*args)
+    finally:
+        if sampler is not None:
+            sampler.stop()
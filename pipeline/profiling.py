@@ -0,0 +1,177 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+PROFILERS = (CPROFILE, SAMPLING)
+
+# The number of lines of the text reports
+TOP_COUNT = 50
+
+class SamplingProfiler():
+    """
+    Statistical profiler, a thread takes the stack of every other thread of the process at a fixed interval.
+    The overhead does not depend on the number of function calls, so it can run on a loaded system, but
+    functions shorter than the interval are only seen in proportion to the time they take.
+
+    The stacks are written in the folded format ('thread;outer;...;inner count'), which flamegraph.pl and speedscope read.
+    """
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: Time in seconds between the samples.
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.ignored_threads = set()  # Idents of the threads that are not sampled, other than the profiler's own
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Sampling Profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or thread_id in self.ignored_threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path: str):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{';'.join(stack)} {count}\n")
+
+    def top(self, count: int = TOP_COUNT) -> str:
+        """
+        The functions seen the most, on top of the stack (self) and anywhere in the stack (total).
+        """
+        own, total = Counter(), Counter()
+        for stack, samples in self.stacks.items():
+            own[stack[-1]] += samples
+            for function in set(stack[1:]):
+                total[function] += samples
+        lines = [f"{self.samples} samples every {self.interval * 1000:g}ms, of all the threads", "", "Self samples:"]
+        lines += [f"{samples:8d}  {function}" for function, samples in own.most_common(count)]
+        lines += ["", "Total samples:"]
+        lines += [f"{samples:8d}  {function}" for function, samples in total.most_common(count)]
+        return '\n'.join(lines) + '\n'
+
+class FunctionProfiler():
+    """
+    cProfile of the thread that starts it, the main thread of the process.
+    The profile is written in the pstats format, it can be read with 'python -m pstats' or snakeviz.
+    """
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def write(self, path: str):
+        self.profiler.dump_stats(path)
+
+    def top(self, count: int = TOP_COUNT) -> str:
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(count)
+        return stream.getvalue()
+
+def write_tracemalloc_snapshot(path: str, count: int = TOP_COUNT):
+    """
+    Write the lines that allocated the most memory that is still in use, from the memory traced by tracemalloc.
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    stats = snapshot.statistics('lineno')
+    current, peak = tracemalloc.get_traced_memory()
+    with open(path, 'w') as file:
+        file.write(f"Traced memory: {current / 1e6:.1f}MB in use, {peak / 1e6:.1f}MB peak\n\n")
+        for stat in stats[:count]:
+            file.write(f"{stat}\n")
+
+def run_profiled(settings: dict, target, *args):
+    """
+    Run the target with its arguments under a profiler, and write the profile and a tracemalloc snapshot to
+    '<directory>/<name>*' when the profiling duration is over or when the target returns.
+
+    :param settings: {'name': name of the process, 'directory': folder the profiles are written to,
+        'profiler': 'cprofile' or 'sampling', 'durationSec': how long to profile for (None until the target returns),
+        'intervalSec': time between the samples of the sampling profiler}
+    """
+    name = settings['name']
+    directory = settings['directory']
+    duration = settings.get('durationSec')
+    os.makedirs(directory, exist_ok=True)
+
+    if settings.get('profiler', CPROFILE) == SAMPLING:
+        profiler = SamplingProfiler(settings.get('intervalSec') or 0.005)
+        profile_path = os.path.join(directory, f"{name}.folded")
+    else:
+        profiler = FunctionProfiler()
+        profile_path = os.path.join(directory, f"{name}.prof")
+
+    finished = threading.Lock()
+    start = time.perf_counter()
+    def finish(*_):
+        # Called once, by the end of the duration or the end of the target, whichever is first
+        if not finished.acquire(blocking=False):
+            return
+        profiler.stop()
+        elapsed = time.perf_counter() - start
+        # Before writing the profile, so its allocations are not in the snapshot
+        write_tracemalloc_snapshot(os.path.join(directory, f"{name}-tracemalloc.txt"))
+        tracemalloc.stop()
+        profiler.write(profile_path)
+        with open(os.path.join(directory, f"{name}-profile.txt"), 'w') as file:
+            file.write(f"Profile of '{name}' over {elapsed:.1f}s\n\n{profiler.top()}")
+        print(f"Profile of '{name}' over {elapsed:.1f}s written to {directory}")
+
+    timer = None
+    if duration:
+        if isinstance(profiler, FunctionProfiler):
+            # cProfile can only be stopped by the thread it profiles, the alarm signal is handled by the main thread
+            signal.signal(signal.SIGALRM, finish)
+            signal.setitimer(signal.ITIMER_REAL, duration)
+        else:
+            timer = threading.Timer(duration, finish)
+            timer.daemon = True
+            timer.start()
+            profiler.ignored_threads.add(timer.ident)
+
+    tracemalloc.start()
+    profiler.start()
+    try:
+        return target(*args)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        elif duration:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        finish()
@@ -0,0 +1,234 @@
+import gc
+import glob
+import json
+import os
+import resource
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from pipeline.instrumentation import LatencyHistogram, read_histograms
+
+# The files of the soak folder
+SAMPLES_SUFFIX = '.jsonl'  # The samples of each process, one JSON object per line
+MAIN_SAMPLES = 'main'  # The samples of the main process, with the queue depths and the latencies of all the processes
+REPORT_FILE = 'soak.json'
+
+# The number of object types with the largest growth listed in the report, per process
+GROWING_TYPES_COUNT = 10
+# The number of samples after the warm up needed to fit a trend
+MIN_TREND_SAMPLES = 3
+
+def resident_memory_bytes() -> int:
+    """
+    The resident memory of the process, or its peak where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def object_type_counts() -> Counter:
+    """
+    The number of objects tracked by the garbage collector, by type.
+    """
+    counts = Counter()
+    for obj in gc.get_objects():
+        object_type = type(obj)
+        module = object_type.__module__
+        counts[object_type.__qualname__ if module == 'builtins' else f"{module}.{object_type.__qualname__}"] += 1
+    return counts
+
+class SoakSampler():
+    """
+    Samples the memory and the Python objects of the process at a fixed interval, in a thread, and appends each
+    sample to '<directory>/<name>.jsonl' as it is taken, so the samples of a run that is killed are kept.
+    """
+    def __init__(self, directory: str, name: str, interval: float = 30.0, top_types: int = 20, extra_sample=None):
+        """
+        :param directory: The folder the samples are written to.
+        :param name: Name of the process, used for the file name.
+        :param interval: Time in seconds between the samples.
+        :param top_types: The number of object types recorded in each sample, the most numerous.
+        :param extra_sample: Optional function returning a dict of more values to add to each sample.
+        """
+        self.path = os.path.join(directory, f"{name}{SAMPLES_SUFFIX}")
+        self.interval = interval
+        self.top_types = top_types
+        self.extra_sample = extra_sample
+        self.start_time = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Soak Sampler", daemon=True)
+
+    @classmethod
+    def for_process(cls, settings: dict) -> 'SoakSampler':
+        """
+        The sampler of a pipeline process, from the 'soak' settings of the process.
+
+        :param settings: {'name': name of the process, 'directory': the soak folder, 'intervalSec', 'topObjectTypes'}
+        """
+        return cls(settings['directory'], settings['name'], settings['intervalSec'], settings['topObjectTypes'])
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.start_time = time.monotonic()
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the sampling, after a last sample.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write(self.sample())
+
+    def _run(self):
+        self.write(self.sample())
+        while not self._stop.wait(self.interval):
+            self.write(self.sample())
+
+    def sample(self) -> dict:
+        types = object_type_counts()
+        sample = {
+            'elapsedSec': time.monotonic() - self.start_time,
+            'rssBytes': resident_memory_bytes(),
+            'objects': sum(types.values()),
+            'types': dict(types.most_common(self.top_types)),
+        }
+        if self.extra_sample is not None:
+            sample.update(self.extra_sample())
+        return sample
+
+    def write(self, sample: dict):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(sample) + '\n')
+
+class PipelineSampler():
+    """
+    The samples of the whole pipeline taken by the main process: the depth of the queues between the processes,
+    and the latency of every stage of every process over the last interval, from the histograms they export.
+    """
+    def __init__(self, channels: dict, metrics_directory: str):
+        """
+        :param channels: The queues and rings between the processes, by name, None for those not used.
+        :param metrics_directory: The folder the processes write their latency histograms to.
+        """
+        self.channels = {name: channel for name, channel in channels.items() if channel is not None}
+        self.metrics_directory = metrics_directory
+        self.previous = {}  # '<process>.<stage>' -> (counts, sum, count) of the last sample
+
+    def __call__(self) -> dict:
+        return {'queues': {name: len(channel) if hasattr(channel, '__len__') else channel.qsize() for name, channel in self.channels.items()},
+                'latency': self.interval_latencies()}
+
+    def interval_latencies(self) -> dict:
+        """
+        The mean and the percentiles (the upper bounds of their buckets) of each stage, over the frames since the last sample.
+        """
+        latencies = {}
+        for process_name, process_histograms in read_histograms(self.metrics_directory).items():
+            for stage, histogram in process_histograms.items():
+                name = f"{process_name}.{stage}"
+                previous_counts, previous_sum, previous_count = self.previous.get(name, ([0] * len(histogram.counts), 0.0, 0))
+                self.previous[name] = (histogram.counts, histogram.sum, histogram.count)
+                interval = LatencyHistogram(histogram.buckets)
+                interval.counts = [count - previous for count, previous in zip(histogram.counts, previous_counts)]
+                interval.sum = histogram.sum - previous_sum
+                interval.count = histogram.count - previous_count
+                if interval.count <= 0:
+                    continue
+                latencies[name] = {
+                    'count': interval.count,
+                    'meanMs': interval.sum / interval.count * 1000,
+                    'p50Ms': interval.quantile(0.5) * 1000,
+                    'p95Ms': interval.quantile(0.95) * 1000,
+                    'p99Ms': interval.quantile(0.99) * 1000,
+                }
+        return latencies
+
+def read_samples(path: str) -> list:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def trend(times, values) -> tuple:
+    """
+    The slope per second of the least squares line through the values, and its value at the first time.
+    """
+    slope, intercept = np.polyfit(np.asarray(times, dtype=float), np.asarray(values, dtype=float), 1)
+    return float(slope), float(intercept + slope * times[0])
+
+def analyse_soak(directory: str, warmup: float = 120.0, memory_growth_mb_per_hour: float = 20.0,
+                 latency_growth: float = 0.25, min_samples: int = MIN_TREND_SAMPLES) -> dict:
+    """
+    Fit a trend line through the samples of each process after the warm up, and check the memory and the latency
+    of the stages are not growing beyond the thresholds. Writes the report to '<directory>/soak.json'.
+
+    :param warmup: Samples before this many seconds are left out, the time for the windows and caches to fill.
+    :param memory_growth_mb_per_hour: The most the resident memory of a process may grow by.
+    :param latency_growth: The most the mean latency of a stage may grow by over the run, as a fraction of its starting value.
+    :param min_samples: The number of samples after the warm up needed to fit a trend.
+    :return: The report, 'passed' is False if any process or stage is over its threshold, or a process has too few
+        samples for a trend, as nothing was checked for it.
+    """
+    report = {'passed': True, 'memory': {}, 'objects': {}, 'latency': {}, 'queues': {}, 'warnings': []}
+    for path in sorted(glob.glob(os.path.join(directory, f"*{SAMPLES_SUFFIX}"))):
+        name = os.path.basename(path)[:-len(SAMPLES_SUFFIX)]
+        samples = [sample for sample in read_samples(path) if sample['elapsedSec'] >= warmup]
+        if len(samples) < min_samples:
+            report['warnings'].append(f"{name}: only {len(samples)} samples after the {warmup:g}s warm up, no trend, inconclusive")
+            report['passed'] = False
+            continue
+        times = [sample['elapsedSec'] for sample in samples]
+        duration = times[-1] - times[0]
+
+        slope, start = trend(times, [sample['rssBytes'] for sample in samples])
+        growth = slope * 3600 / 1e6
+        passed = growth <= memory_growth_mb_per_hour
+        report['memory'][name] = {'startMb': start / 1e6, 'endMb': samples[-1]['rssBytes'] / 1e6,
+                                  'growthMbPerHour': growth, 'passed': passed}
+        report['passed'] &= passed
+
+        # The types with the most new objects between the first and the last sample, of the types in both
+        first, last = samples[0]['types'], samples[-1]['types']
+        growing = sorted(((last[t] - first[t], t) for t in set(first) & set(last)), reverse=True)[:GROWING_TYPES_COUNT]
+        report['objects'][name] = {'start': samples[0]['objects'], 'end': samples[-1]['objects'],
+                                   'growingTypes': {t: count for count, t in growing if count > 0}}
+
+        for stage in sorted({stage for sample in samples for stage in sample.get('latency', {})}):
+            points = [(sample['elapsedSec'], sample['latency'][stage]['meanMs']) for sample in samples if stage in sample.get('latency', {})]
+            if len(points) < min_samples:
+                continue
+            slope, start = trend(*zip(*points))
+            relative_growth = slope * duration / start if start > 0 else 0.0
+            passed = relative_growth <= latency_growth
+            report['latency'][stage] = {'startMeanMs': start, 'endMeanMs': start + slope * duration,
+                                        'growth': relative_growth, 'passed': passed}
+            report['passed'] &= passed
+
+        for queue_name in sorted({queue_name for sample in samples for queue_name in sample.get('queues', {})}):
+            depths = [sample['queues'][queue_name] for sample in samples if queue_name in sample.get('queues', {})]
+            report['queues'][queue_name] = {'maxDepth': max(depths), 'lastDepth': depths[-1]}
+
+    with open(os.path.join(directory, REPORT_FILE), 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+def print_soak_report(report: dict):
+    for name, memory in report['memory'].items():
+        print(f"  {name:<40} memory {memory['startMb']:8.1f}MB -> {memory['endMb']:8.1f}MB, {memory['growthMbPerHour']:+8.1f}MB/h"
+              f"{'' if memory['passed'] else '  FAILED'}")
+        growing = report['objects'][name]['growingTypes']
+        if growing:
+            print(f"  {'':<40} growing objects: " + ', '.join(f"{t} +{count}" for t, count in growing.items()))
+    for stage, latency in report['latency'].items():
+        print(f"  {stage:<40} mean latency {latency['startMeanMs']:8.2f}ms -> {latency['endMeanMs']:8.2f}ms, {latency['growth'] * 100:+6.1f}%"
+              f"{'' if latency['passed'] else '  FAILED'}")
+    for queue_name, depths in report['queues'].items():
+        print(f"  queue {queue_name:<34} max depth {depths['maxDepth']}, last depth {depths['lastDepth']}")
+    for warning in report['warnings']:
+        print(f"  {warning}")
+    print(f"Soak test {'passed' if report['passed'] else 'FAILED'}")
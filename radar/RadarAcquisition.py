@@ -0,0 +1,268 @@
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from radar.configuration.RadarConfiguration import RadarConfiguration
+from radar.configuration.RunType import RunType
+from radar.configuration.AcquisitionMode import AcquisitionMode
+from radar.dataparsing.td_textdata_parser import read_columns
+from radar.dataparsing.fd_textdata_parser import read_fd_columns
+from radar.dataparsing.ht_textdata_parser import read_ht_columns
+from radar.radarprocessing.get_td_sensor_data import get_td_data_voltage
+from radar.radarprocessing.get_fd_sensor_data import get_fd_spectrum_from_radar
+from radar.radarprocessing.TDData import TDData
+from radar.radarprocessing.FDData import FDData
+from radar.radarprocessing.HTData import HTData, HT_COLUMNS, HT_MAX_TARGETS
+from pipeline.SharedRing import SharedRing
+from tracking.clock import monotonic_timestamp
+from pipeline.instrumentation import observe
+
+# The number of frames of the synthetic scene of a SIMULATED run, they are generated once then looped
+SIMULATED_LOOP_FRAMES = 500
+
+# The prefix of the recorded files of the FD and HT acquisition modes, the files of the TD mode are the other .txt files of the folder
+RECORDED_FILE_PREFIXES = {AcquisitionMode.FD: 'FD_', AcquisitionMode.HT: 'HT_'}
+
+# A raw TD frame in the shared memory ring, the timestamp is in ns of the monotonic clock
+RAW_FRAME_DTYPE = np.dtype([('timestamp', np.int64), ('td_data', np.float64, (1024, 4))])
+# The spectra of a frame of the FD acquisition mode in the shared memory ring
+FD_FRAME_DTYPE = np.dtype([('timestamp', np.int64), ('fd_data', np.complex128, (4, 512))])
+# The targets of a frame of the HT acquisition mode, the first 'num_targets' rows are used
+HT_FRAME_DTYPE = np.dtype([('timestamp', np.int64), ('num_targets', np.int32), ('targets', np.float64, (HT_MAX_TARGETS, len(HT_COLUMNS)))])
+FRAME_DTYPES = {AcquisitionMode.TD: RAW_FRAME_DTYPE, AcquisitionMode.FD: FD_FRAME_DTYPE, AcquisitionMode.HT: HT_FRAME_DTYPE}
+
+def create_raw_frame_ring(capacity: int = 32, acquisition_mode: AcquisitionMode = AcquisitionMode.TD) -> SharedRing:
+    """
+    Create the shared memory ring the acquisition process writes the raw TD frames, or the frames of the FD and HT modes, into.
+    """
+    return SharedRing(FRAME_DTYPES[acquisition_mode], capacity)
+
+def td_data_from_frame(frame) -> TDData:
+    """
+    TDData of a frame of the ring, the data is a view of the shared memory and is only valid until the frame is released.
+    """
+    return TDData(frame['td_data'], pd.Timestamp(int(frame['timestamp'])))
+
+def record_from_frame(frame):
+    """
+    TDData, FDData or HTData of a frame of the ring, depending on the frames the ring holds. A view of the shared memory, as td_data_from_frame.
+    """
+    if 'fd_data' in frame.dtype.names:
+        return FDData(frame['fd_data'], pd.Timestamp(int(frame['timestamp'])))
+    if 'targets' in frame.dtype.names:
+        return HTData(frame['targets'][:frame['num_targets']], pd.Timestamp(int(frame['timestamp'])))
+    return td_data_from_frame(frame)
+
+class RadarAcquisition():
+    """
+    Reads the raw TD frames, from the radar module for a live run, from the files of a recorded run or from a synthetic scene.
+    In the FD acquisition mode the frames are FDData, the spectra computed by the radar, and in the HT mode HTData, the
+    targets of the Human Tracker of the radar.
+    """
+    def __init__(self, radar_configuration: RadarConfiguration, start_time: pd.Timestamp, output_dir: str = None):
+        """
+        :param radar_configuration: The radar configuration.
+        :param start_time: The time the run started.
+        :param output_dir: Folder the radar configuration report is written to, when the data is recorded.
+        """
+        self.config = radar_configuration
+        self.start_time = start_time
+        self.output_dir = output_dir
+        self.frame_count = 0
+
+        if self.config.run_type == RunType.LIVE:
+            self.radar_module = self.config.connect_get_radar_module()
+            if (not self.radar_module.connected):
+                print("Radar module is NOT connected. Exiting.")
+                sys.exit("Could not connect to radar module. Please check the connection, or disable the radar with the '--skip-radar' flag.")
+            self.bin_size_meters = self.radar_module.sysParams.tic / 1000000
+            if self.config.acquisition_mode == AcquisitionMode.HT:
+                print("Setting up the Human Tracker of the radar, it measures the background of the scene first.")
+                self.config.configure_human_tracker(self.radar_module)
+
+    def frames(self, stop_event):
+        """
+        Generator of the TD (or FD, HT) frames, until the stop event is set or all the files of a recorded run are read.
+        """
+        # If this is a rerun, read the data from the folder until it's completed
+        if self.config.run_type == RunType.RERUN:
+            yield from self.frames_from_folder(stop_event)
+
+        # If this is a live run, keep reading the data from the radar until the stop event is set
+        elif self.config.run_type == RunType.LIVE:
+            yield from self.live_frames(stop_event)
+        
+        elif self.config.run_type == RunType.SIMULATED:
+            yield from self.simulated_frames(stop_event)
+
+    def live_frames(self, stop_event):
+        """
+        Read the TD frames from the radar module until the stop event is set.
+        """
+        if self.config.record_data:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.export_radar_config_to_file(self.output_dir)
+
+        while not stop_event.is_set():
+            voltage_data = self.read_live_frame()
+            if voltage_data is None:
+                # There was likely an error - reset error code, try again
+                self.radar_module.error = False
+                continue
+            self.frame_count += 1
+            yield voltage_data
+
+    def read_live_frame(self):
+        """
+        A frame from the radar module, of the acquisition mode of the configuration. None if there was an error.
+        """
+        if self.config.acquisition_mode == AcquisitionMode.FD:
+            return get_fd_spectrum_from_radar(self.config, self.radar_module)
+        if self.config.acquisition_mode == AcquisitionMode.HT:
+            self.radar_module.HtMeasurement(print_debug=False)
+            return None if self.radar_module.error else HTData.from_ht_targets(self.radar_module.HT_Targets)
+        return get_td_data_voltage(self.radar_module)
+
+    def frames_from_folder(self, stop_event=None):
+        """
+        Read the TD frames from the folder specified in the configuration, or the FD or HT frames in those acquisition modes.
+        With 'replay_loop' set the folder is replayed from the start again, until the stop event is set.
+        """
+        directory_to_process = self.config.source_path
+        print(f"Processing prerecorded radar data from folder {directory_to_process}.")
+
+        # List all files in the directory
+        files = os.listdir(directory_to_process)
+
+        # Filter the files based on the naming convention, and sort them
+        prefix = RECORDED_FILE_PREFIXES.get(self.config.acquisition_mode)
+        if prefix is not None:
+            txt_files = [f for f in files if f.endswith('.txt') and f.startswith(prefix)]
+        else:
+            txt_files = [f for f in files if f.endswith('.txt') and not f.startswith(tuple(RECORDED_FILE_PREFIXES.values()))]
+        txt_files.sort()
+        read_file = {AcquisitionMode.FD: read_fd_columns, AcquisitionMode.HT: read_ht_columns}.get(self.config.acquisition_mode, read_columns)
+        if self.config.replay_loop:
+            txt_files = itertools.cycle(txt_files)
+
+        # Process each file one by one
+        for file_name in txt_files:
+            if stop_event is not None and stop_event.is_set():
+                break
+            file_path = os.path.join(directory_to_process, file_name)
+            new_td_data = read_file(file_path)
+
+            # Simulate the timestamp as the current time to we can use the real-time windowing.
+            # Add a delay between processing since we expect it to take roughly 0.08 seconds to get the radar data
+            new_td_data.timestamp = monotonic_timestamp()
+            self.frame_count += 1
+            yield new_td_data
+            if self.config.replay_interval_sec:
+                time.sleep(self.config.replay_interval_sec)
+
+        print("Completed all processing of radar data from the folder.")
+    
+    def simulated_frames(self, stop_event=None):
+        """
+        The TD frames of a synthetic scene of random moving targets with some static clutter, at the replay interval.
+        The frames are generated once, and looped until the stop event is set.
+        """
+        from radar.simulation.FmcwSceneGenerator import FmcwSceneGenerator, RadarScene
+        
+        scene = RadarScene.random(self.config.simulated_targets, clutter_count=20, seed=0)
+        frame_interval_sec = self.config.replay_interval_sec or 0.08
+        if self.config.acquisition_mode == AcquisitionMode.HT:
+            # Stand in for the Human Tracker of the radar with the true positions of the targets
+            targets = scene.targets[:HT_MAX_TARGETS]
+            frames = [np.array([(i, 1, frame + 1, 1, abs(target.range_m + target.velocity_mps * frame * frame_interval_sec), target.angle_deg)
+                                for i, target in enumerate(targets)]) for frame in range(SIMULATED_LOOP_FRAMES)]
+            record_type = HTData
+        else:
+            generator = FmcwSceneGenerator(scene, self.config, frame_interval_sec=frame_interval_sec)
+            frames = [td_data.td_data for td_data in generator.frames(SIMULATED_LOOP_FRAMES)]
+            record_type = TDData
+        if self.config.acquisition_mode == AcquisitionMode.FD:
+            # Stand in for the radar with the spectra of the host FFT
+            from radar.radarprocessing.RadarDataWindow import RadarDataWindow
+            radar_window = RadarDataWindow(self.config.cfar_params, self.start_time, capacity=0)
+            frames = [radar_window.compute_fft(td_data) for td_data in frames]
+            record_type = FDData
+        print(f"Processing a simulated scene of {self.config.simulated_targets} targets, looped every {len(frames)} frames.")
+        
+        for data in itertools.cycle(frames):
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.frame_count += 1
+            # The CFAR applies its gain to the spectra in place, each loop gets its own copy
+            yield record_type(data.copy() if record_type is FDData else data, monotonic_timestamp())
+            if self.config.replay_interval_sec:
+                time.sleep(self.config.replay_interval_sec)
+
+    def acquire_to_ring(self, stop_event, ring: SharedRing):
+        """
+        Write the TD (or FD, HT) frames into the shared memory ring until the stop event is set.
+        The acquisition never waits on the processing, if the ring is full the frame is dropped and counted by the ring.
+        The exception is a recorded or simulated run replayed as fast as possible, which waits for a free slot so every frame is processed.
+        """
+        wait_for_slot = self.config.run_type != RunType.LIVE and not self.config.replay_interval_sec
+        last_timestamp = None
+        for td_data in self.frames(stop_event):
+            # The time between frames, to check the acquisition stays steady
+            if last_timestamp is not None:
+                observe('radar_acquisition_interval', (td_data.timestamp - last_timestamp).total_seconds())
+            last_timestamp = td_data.timestamp
+            
+            while wait_for_slot and len(ring) >= ring.capacity and not stop_event.is_set():
+                time.sleep(0.001)
+            slot = ring.reserve()
+            if slot is None:
+                continue
+            slot['timestamp'] = td_data.timestamp.value
+            if isinstance(td_data, FDData):
+                slot['fd_data'][...] = td_data.fd_data
+            elif isinstance(td_data, HTData):
+                num_targets = min(len(td_data.targets), HT_MAX_TARGETS)
+                slot['num_targets'] = num_targets
+                slot['targets'][:num_targets] = td_data.targets[:num_targets]
+            else:
+                slot['td_data'][...] = td_data.td_data
+            ring.commit()
+        print(f"Radar acquisition finished: {self.frame_count} frames, {ring.dropped} dropped with the ring full.")
+
+    def export_radar_config_to_file(self, output_dir, output_file="RadarConfigurationReport.txt"):
+        """
+        Exports the radar configuration settings to a text file in a formatted structure.
+
+        Args:
+            output_file (str): The name of the file to write the radar configuration report.
+        """
+        current_date = self.start_time.strftime("%Y-%m-%d")
+        start_time = self.start_time.now().strftime("%H:%M:%S.%f")[:-3]
+        sysParmas = self.radar_module.sysParams
+         # Format the bin size to three decimal points
+        formatted_bin_size_mm = f"{(self.bin_size_meters*1000):.3f}"
+
+        report_content = (
+            f"Date:\t{current_date}\n"
+            f"Start Time:\t{start_time}\n"
+            f"Interface:\tEthernet\n"
+            f"Start-Frequency [MHz]:\t{self.config.minimum_frequency_mhz}\n"
+            f"Stop-Frequency [MHz]:\t{self.config.maximum_frequency_mhz}\n"
+            f"Ramp Time [ms]:\t{self.config.ramp_time_fmcw_chirp}\n"
+            f"Attenuation [dB]:\t{sysParmas.atten}\n"
+            f"Bin Size [mm]:\t{formatted_bin_size_mm}\n"
+            f"Number of Samples:\t1024\n"
+            f"Bin Size [Hz]:\t{sysParmas.freq_bin}\n"
+            f"Zero Pad Factor:\t{sysParmas.zero_pad}\n"
+            f"Normalization:\t{sysParmas.norm}\n"
+            f"Active Channels:\tI1, Q1, I2, Q2\n"
+        )
+
+        # Write the report to the specified output file
+        file_to_write = os.path.join(output_dir, output_file)
+        with open(file_to_write, 'w') as file:
+            file.write(report_content)
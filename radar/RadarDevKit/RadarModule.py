@@ -187,13 +187,14 @@ class RadarModule():
         
     '--------------------------------------------------------------------------------------------'
     # function to get the Human Tracker parameters
-    def GetHtParams(self):
+    def GetHtParams(self, print_debug=True):
         # do nothing if not connected or an error has occurred
         if not self.connected or self.error:
             return
         
-        print('========================')
-        print('GetHtParams')
+        if print_debug:
+            print('========================')
+            print('GetHtParams')
 
         # execute the respective command ID
         try:
@@ -208,13 +209,14 @@ class RadarModule():
     '--------------------------------------------------------------------------------------------'
     # function to set the Human Tracker parameters
     # Note that the Radar Module will perform some initial measurements, so it will be waited some time
-    def SetHtParams(self):
+    def SetHtParams(self, print_debug=True):
         # do nothing if not connected or an error has occurred
         if not self.connected or self.error:
             return
         
-        print('========================')
-        print('SetHtParams')
+        if print_debug:
+            print('========================')
+            print('SetHtParams')
 
         # execute the respective command ID
         try:
@@ -226,13 +228,15 @@ class RadarModule():
     
     '--------------------------------------------------------------------------------------------'
     # function that triggers a Human Tracker measurement
-    def HtMeasurement(self):
+    # set 'print_debug' to False when it is called for every measurement
+    def HtMeasurement(self, print_debug=True):
         # do nothing if not connected or an error has occurred
         if not self.connected or self.error:
             return
         
-        print('========================')
-        print('HtMeasurement')
+        if print_debug:
+            print('========================')
+            print('HtMeasurement')
 
         # execute the respective command ID
         try:
@@ -0,0 +1,18 @@
+from enum import Enum
+
+class AcquisitionMode(Enum):
+    """
+    Enumeration of the data the radar is acquired as.
+
+    Attributes
+    ----------
+    TD : int
+        The raw time domain data is acquired, the FFT is computed on the host. Needed for the movement mask.
+    FD : int
+        The spectra computed by the radar are acquired, the host only runs the CFAR and the detection extraction.
+    HT : int
+        The targets found by the Human Tracker of the radar are acquired, and turned straight into detections.
+    """
+    TD = 1
+    FD = 2
+    HT = 3
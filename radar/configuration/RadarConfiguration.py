@@ -3,6 +3,7 @@ import os
 from constants import SPEED_LIGHT
 from radar.configuration.CFARType import CfarType
 from radar.configuration.RunType import RunType
+from radar.configuration.AcquisitionMode import AcquisitionMode
 from radar.configuration.CFARParams import CFARParams
 
 # Radar dev kit imports
@@ -26,6 +27,12 @@ class RadarConfiguration:
         cfar_params (CFARParams): An instance of the CFARParams class containing CFAR parameters.
         run_type (RunType): Enum value representing the type of run.
         source_path (str): The path to the folder where the data is read from.
+        replay_interval_sec (float): Time in seconds between the frames replayed from the source folder, 0 replays them as fast as they are read.
+        replay_loop (bool): Whether to replay the source folder from the start again once all of it is read, until the run is stopped.
+        simulated_targets (int): The number of moving targets of the synthetic scene of the SIMULATED run type.
+        acquisition_mode (AcquisitionMode): Enum value of the data acquired from the radar, raw TD data, the spectra or the Human Tracker targets computed by the radar.
+        fft_data_type (int): The layout of the spectra sent by the radar, 0 magnitudes, 1 magnitude/phase, 2 real/imaginary, 3 magnitude/object angle.
+        ht_params (dict): The parameters of the Human Tracker of the radar for the HT acquisition mode, by their name in HtParams.
         record_data (bool): Whether to record the data.
         output_path (str): The path to the folder where the data is recorded.
         processing_window (int): The number of results to keep in the processing window.
@@ -62,6 +69,24 @@ class RadarConfiguration:
             },
             'run': 'LIVE',
             'sourcePath': '/data/radar/',
+            'replayIntervalSec': 0.08,
+            'replayLoop': False,
+            'simulatedTargets': 10,
+            'acquisitionMode': 'TD',
+            'fftDataType': 1,
+            'htParams': {
+                'nRefPulses': 50,
+                'timeInterval': 50,
+                'nTargets': 5,
+                'backgrFilter': 32,
+                'threshFilter': 100,
+                'overThreshold': 30,
+                'minDistance': 0,
+                'minSeparation': 5,
+                'enableTracker': 1,
+                'maxRangeShift': 5,
+                'maxLostDetect': 3
+            },
             'recordData': True,
             'recordDataPath': '/output',
             'processingWindow': 200,
@@ -118,7 +143,14 @@ class RadarConfiguration:
                     # Run configuration
                     run_type_str = config.get('run', self.defaults['run'])
                     self.source_path = config.get('sourcePath', self.defaults['sourcePath'])
+                    self.replay_interval_sec = config.get('replayIntervalSec', self.defaults['replayIntervalSec'])
+                    self.replay_loop = config.get('replayLoop', self.defaults['replayLoop'])
+                    self.simulated_targets = config.get('simulatedTargets', self.defaults['simulatedTargets'])
                     self.run_type = RunType[run_type_str] if run_type_str in RunType.__members__ else RunType.LIVE
+                    acquisition_mode_str = config.get('acquisitionMode', self.defaults['acquisitionMode'])
+                    self.acquisition_mode = AcquisitionMode[acquisition_mode_str] if acquisition_mode_str in AcquisitionMode.__members__ else AcquisitionMode.TD
+                    self.fft_data_type = config.get('fftDataType', self.defaults['fftDataType'])
+                    self.ht_params = {**self.defaults['htParams'], **(config.get('htParams') or {})}
                     self.record_data = config.get('recordData', self.defaults['recordData'])
                     self.output_path = config.get('recordDataPath', self.defaults['recordDataPath'])
                     self.processing_window = config.get('processingWindow', self.defaults['processingWindow'])
@@ -163,6 +195,12 @@ class RadarConfiguration:
         # Run configuration
         self.run_type = RunType[self.defaults['run']]
         self.source_path = self.defaults['sourcePath']
+        self.replay_interval_sec = self.defaults['replayIntervalSec']
+        self.replay_loop = self.defaults['replayLoop']
+        self.simulated_targets = self.defaults['simulatedTargets']
+        self.acquisition_mode = AcquisitionMode[self.defaults['acquisitionMode']]
+        self.fft_data_type = self.defaults['fftDataType']
+        self.ht_params = dict(self.defaults['htParams'])
         self.record_data = self.defaults['recordData']
         self.output_path = self.defaults['recordDataPath']
         self.processing_window = self.defaults['processingWindow']
@@ -181,13 +219,22 @@ class RadarConfiguration:
         updatedSysParmas.atten = self.attenuation
         updatedSysParmas.active_RX_ch = 15
         updatedSysParmas.freq_points = 512
-        # Not using FFT_data, but configure it incase it's used in the future
-        updatedSysParmas.FFT_data_type = 1
+        # The layout of the spectra of the FD acquisition mode
+        updatedSysParmas.FFT_data_type = self.fft_data_type
         
         return GetRadarModule(updatedRadarParams=updatedSysParmas,
                               updatedEthernetConfig=self.ethernet_params, 
                               printSettings=self.print_settings)
 
+    def configure_human_tracker(self, radar_module: RadarModule):
+        """
+        Send the Human Tracker parameters to the radar module, for the HT acquisition mode.
+        The radar measures the background of the scene ('nRefPulses' measurements) before this returns.
+        """
+        for name, value in self.ht_params.items():
+            setattr(radar_module.htParams, name, value)
+        radar_module.SetHtParams(print_debug=self.print_settings)
+
     def __str__(self):
         """
         Returns a string representation of the radar configuration.
@@ -203,6 +250,12 @@ class RadarConfiguration:
                 f"  {self.cfar_params}\n"
                 f"Run Type: {self.run_type}\n"
                 f"Source Data Path: {self.source_path}\n"
+                f"Replay Interval: {self.replay_interval_sec}s\n"
+                f"Replay Loop: {self.replay_loop}\n"
+                f"Simulated Targets: {self.simulated_targets}\n"
+                f"Acquisition Mode: {self.acquisition_mode}\n"
+                f"FFT Data Type: {self.fft_data_type}\n"
+                f"Human Tracker Params: {self.ht_params}\n"
                 f"Record Data: {self.record_data}\n"
                 f"Record Data Path: {self.output_path}\n"
                 f"Processing Window: {self.processing_window}\n"
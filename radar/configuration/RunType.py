@@ -12,6 +12,9 @@ class RunType(Enum):
         The program processes data in real-time without recording it.
     RERUN : ints
         The program reads and processes data from a pre-recorded sample file. Requires an existing `DataFormat` for reading the data.
+    SIMULATED : int
+        The program processes synthetic data of a scene of moving targets, without a radar or a recording.
     """
     LIVE = 1
-    RERUN = 2
\ No newline at end of file
+    RERUN = 2
+    SIMULATED = 3
\ No newline at end of file
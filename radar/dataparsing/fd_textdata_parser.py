@@ -0,0 +1,22 @@
+import numpy as np
+
+from radar.dataparsing.td_textdata_parser import extract_timestamp_from_filename
+from radar.radarprocessing.FDData import FDData, FD_FILE_COLUMNS
+
+def read_fd_columns(file_path) -> FDData:
+    """
+    Read an FD file recorded by FDData.print_data_to_file, the spectra computed by the radar.
+    """
+    with open(file_path, 'r') as file:
+        # Skip lines until the delimiter line is found, then the column names
+        for line in file:
+            if line.strip() == '=======================================================':
+                break
+        file.readline()
+        columns = np.loadtxt(file, delimiter='\t', ndmin=2)
+    
+    if columns.shape[1] != len(FD_FILE_COLUMNS):
+        raise ValueError(f"Expected {len(FD_FILE_COLUMNS)} columns in {file_path}, found {columns.shape[1]}")
+    
+    fd_data = (columns[:, 0::2] + 1j * columns[:, 1::2]).T
+    return FDData(fd_data, timestamp=extract_timestamp_from_filename(file_path))
@@ -0,0 +1,20 @@
+import numpy as np
+
+from radar.dataparsing.td_textdata_parser import extract_timestamp_from_filename
+from radar.radarprocessing.HTData import HTData, HT_COLUMNS
+
+def read_ht_columns(file_path) -> HTData:
+    """
+    Read an HT file recorded by HTData.print_data_to_file, the targets of the Human Tracker of the radar.
+    """
+    with open(file_path, 'r') as file:
+        # Skip lines until the delimiter line is found, then the column names
+        for line in file:
+            if line.strip() == '=======================================================':
+                break
+        file.readline()
+        # A frame often has no targets, so the rows are read as they are rather than with np.loadtxt, which warns on no data
+        rows = [line.split('\t') for line in file if line.strip()]
+    
+    targets = np.array(rows, dtype=float).reshape(-1, len(HT_COLUMNS))
+    return HTData(targets, timestamp=extract_timestamp_from_filename(file_path))
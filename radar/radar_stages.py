@@ -0,0 +1,150 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from pipeline.StageGraph import Stage, StageGraph
+from pipeline.LoadController import LoadKnobs, MOVEMENT_MASK_EVERY
+from radar.radarprocessing.RadarDataWindow import RadarDataWindow
+from radar.radarprocessing.FDData import FDData
+from tracking.TraceContext import TraceContext, DSP_OUT, ENQUEUED
+from tracking.clock import monotonic_seconds
+
+# The radar processing stages, after the TD data is acquired. The spectra of the FD acquisition mode skip the fft and movement mask stages
+FFT_STAGE = 'fft'
+CFAR_STAGE = 'cfar'
+MOVEMENT_MASK_STAGE = 'movementMask'
+EXTRACTION_STAGE = 'extraction'
+RADAR_STAGES = (FFT_STAGE, CFAR_STAGE, MOVEMENT_MASK_STAGE, EXTRACTION_STAGE)
+
+class RadarFrame():
+    """
+    A radar record passing through the processing stages, each stage fills in its result.
+
+    td_data -> np array (1024, 4) [I1, Q1, I2, Q2] (all in Volts), None for the spectra of the FD acquisition mode
+    record_fft -> np array (4, 512) [I1, Q1, I2, Q2] (in frequency domain), from the fft stage or the radar
+    detection_vector -> np array (512, 8), from the cfar stage, as in the RadarDataWindow detection_records
+    movement_distances -> distances with movement, from the movement mask stage. None if there are not enough records yet.
+    detections -> DetectionsAtTime, from the extraction stage
+    trace -> TraceContext of the frame, handed on to the detections
+    """
+    def __init__(self, td_data, copy: bool = False):
+        """
+        :param td_data: The raw TD record, or the FDData spectra computed by the radar.
+        :param copy: If True the data is copied, for data that is only valid until the frame is processed (a view of a shared memory ring).
+        """
+        self.timestamp = td_data.timestamp
+        self.td_data = None
+        self.record_fft = None
+        if isinstance(td_data, FDData):
+            self.record_fft = np.array(td_data.fd_data) if copy else td_data.fd_data
+        else:
+            self.td_data = np.array(td_data.td_data) if copy else td_data.td_data
+        self.received = time.perf_counter() # To measure the processing latency, the clock is shared by the processes
+        self.detection_vector = None
+        self.movement_distances = None
+        self.detections = None
+        self.trace = TraceContext.start(monotonic_seconds(td_data.timestamp))
+
+def fft_stage(window_args: dict):
+    """
+    Calculate the FFT of the TD record.
+    """
+    radar_window = RadarDataWindow(**window_args)
+    def process(frame: RadarFrame) -> RadarFrame:
+        if frame.record_fft is None:
+            frame.record_fft = radar_window.compute_fft(frame.td_data)
+        return frame
+    return process
+
+def cfar_stage(window_args: dict):
+    """
+    Find the detections and their angles in the FFT with the CFAR.
+    """
+    radar_window = RadarDataWindow(**window_args)
+    def process(frame: RadarFrame) -> RadarFrame:
+        frame.detection_vector = radar_window.detect_targets(frame.record_fft)
+        return frame
+    return process
+
+def movement_mask_stage(window_args: dict, load_knobs: LoadKnobs = None):
+    """
+    Find the distances with movement from the spectrogram of the last records.
+    The stage keeps the last records, and like the RadarDataWindow only recalculates the distances every
+    'movementMaskEvery' records.
+    """
+    radar_window = RadarDataWindow(**window_args)
+    raw_records = deque(maxlen=radar_window.spectrogram_num_elements)
+    last_timestamp = None
+    def process(frame: RadarFrame) -> RadarFrame:
+        nonlocal last_timestamp
+        if frame.td_data is None:
+            return frame
+        raw_records.append(frame.td_data)
+        radar_window.records_since_movement += 1
+        if last_timestamp is not None:
+            radar_window.total_time += (frame.timestamp - last_timestamp).total_seconds()
+            radar_window.total_time_entries += 1
+        last_timestamp = frame.timestamp
+
+        if load_knobs is not None:
+            radar_window.movement_mask_every = load_knobs.get(MOVEMENT_MASK_EVERY, 1)
+        if radar_window.movement_mask and len(raw_records) >= radar_window.spectrogram_num_elements:
+            if radar_window.movement_distances is None or radar_window.records_since_movement >= radar_window.movement_mask_every:
+                radar_window.movement_distances = radar_window.calculate_movement_distances(raw_records, radar_window.total_time / radar_window.total_time_entries)
+                radar_window.records_since_movement = 0
+            frame.movement_distances = radar_window.movement_distances
+        return frame
+    return process
+
+def extraction_stage(window_args: dict, load_knobs: LoadKnobs = None):
+    """
+    Combine the detections of both receivers, keeping the ones with movement, into the DetectionsAtTime for the tracker.
+    """
+    radar_window = RadarDataWindow(**window_args)
+    def process(frame: RadarFrame) -> RadarFrame:
+        def movement_mask(distances):
+            # The spectra computed by the radar have no raw data for the movement mask
+            if not radar_window.movement_mask or frame.td_data is None:
+                return np.arange(len(distances))
+            if frame.movement_distances is None:
+                return np.full(len(distances), False, dtype=bool)
+            return radar_window.get_indexes_with_movement(distances, frame.movement_distances)
+
+        frame.detections = radar_window.combined_detections_xy(frame.detection_vector, frame.timestamp, movement_mask)
+        frame.trace.mark(DSP_OUT)
+        frame.detections.trace = frame.trace
+        if load_knobs is not None:
+            load_knobs.record_latency('radar', time.perf_counter() - frame.received)
+        return frame
+    return process
+
+def publish_detections(radar_data_queue, frame: RadarFrame):
+    """
+    Sink of the graph, push the detections of the frame to the queue of the tracker.
+    """
+    if radar_data_queue is not None:
+        frame.trace.mark(ENQUEUED)
+        radar_data_queue.put(frame.detections)
+
+def build_radar_stage_graph(window_args: dict, placements: dict, capacity: int = 4, policy: str = 'block',
+                            block_timeout: float = 1.0, load_knobs: LoadKnobs = None) -> StageGraph:
+    """
+    Create the graph of the radar processing stages, from the TD data to the detections.
+
+    :param window_args: The arguments of the RadarDataWindow each stage uses for its settings.
+    :param placements: Map of the stage name to its placement, 'inline', 'thread' or 'process'. Missing stages are inline.
+    :param capacity: The capacity of the channels between the workers.
+    :param policy: What to do when a channel is full.
+    :param block_timeout: With the 'block' policy, how long in seconds to wait for space before dropping the frame.
+    :param load_knobs: Optional run time settings, the movement mask stage reads its rate from them and the latency is recorded.
+    """
+    factories = {
+        FFT_STAGE: (fft_stage, (window_args,)),
+        CFAR_STAGE: (cfar_stage, (window_args,)),
+        MOVEMENT_MASK_STAGE: (movement_mask_stage, (window_args, load_knobs)),
+        EXTRACTION_STAGE: (extraction_stage, (window_args, load_knobs)),
+    }
+    stages = [Stage(name, factory, args, placements.get(name, 'inline'), output_type=RadarFrame)
+              for name, (factory, args) in factories.items()]
+    return StageGraph(stages, capacity, policy, block_timeout, name="Radar")
@@ -7,38 +7,50 @@ from datetime import datetime
 
 import multiprocessing as mp
 import time
+from collections import deque
 
 from constants import RADAR_DETECTION_TYPE
 from tracking.DetectionsAtTime import DetectionDetails, DetectionsAtTime
 from radar.cfar import get_range_bin_for_indexs
 from radar.configuration.RunType import RunType
+from radar.configuration.AcquisitionMode import AcquisitionMode
+from tracking.clock import monotonic_timestamp, monotonic_seconds
+from tracking.TraceContext import TraceContext, DSP_OUT, ENQUEUED
+from pipeline.LoadController import LoadKnobs, RADAR_DECIMATION, MOVEMENT_MASK_EVERY
 
 from radar.configuration.RadarConfiguration import RadarConfiguration
 
 from radar.radarprocessing.FDDataMatrix import FDSignalType
 from radar.radarprocessing.RadarDataWindow import RadarDataWindow
-from radar.dataparsing.td_textdata_parser import read_columns
-
-from radar.radarprocessing.get_td_sensor_data import get_td_data_voltage
+from radar.radarprocessing.FDData import FDData
+from radar.radarprocessing.HTData import HTData
+from radar.RadarAcquisition import RadarAcquisition, record_from_frame
+from pipeline.SharedRing import SharedRing
+from pipeline.instrumentation import timed, observe
+from radar.radar_stages import RadarFrame, build_radar_stage_graph, publish_detections
+from functools import partial
 
 class RadarTracking():
     def __init__(self, 
                  radar_configuration: RadarConfiguration,
                  start_time: pd.Timestamp = pd.Timestamp.now(),
-                 radar_data_queue: mp.Queue = None):
+                 radar_data_queue: mp.Queue = None,
+                 load_knobs: LoadKnobs = None,
+                 stage_config: dict = None,
+                 raw_frame_ring: SharedRing = None):
         
         self.config = radar_configuration
         self.radar_data_queue = radar_data_queue
+        self.load_knobs = load_knobs # Optional run time settings to shed load when the system is overloaded
+        self.frame_count = 0
         self.start_time = start_time
         # output directory will be the given folder, with a timestamp and 'radar' appended to it
         self.output_dir = os.path.join(self.config.output_path, self.start_time.strftime('%Y-%m-%d_%H-%M-%S'), 'radar')
         
-        if self.config.run_type == RunType.LIVE:
-            self.radar_module = self.config.connect_get_radar_module()
-            if (not self.radar_module.connected):
-                print("Radar module is NOT connected. Exiting.")
-                sys.exit("Could not connect to radar module. Please check the connection, or disable the radar with the '--skip-radar' flag.")
-            self.bin_size_meters = self.radar_module.sysParams.tic / 1000000
+        # With a raw frame ring the frames are acquired by a separate process, so a slow processing step never delays the next frame
+        self.raw_frame_ring = raw_frame_ring
+        self.acquisition = RadarAcquisition(self.config, self.start_time, self.output_dir) if raw_frame_ring is None else None
+        self.acquisition_lags = deque(maxlen=10000) # Seconds from a frame being acquired to its processing starting
         
         self.radar_window = RadarDataWindow(cfar_params=self.config.cfar_params, 
                                             start_time=self.start_time,
@@ -46,115 +58,150 @@ class RadarTracking():
                                             f_c=self.config.f_c,
                                             capacity=self.config.processing_window,
                                             run_velocity_measurements=False)
+        # The spectra computed by the radar replace the host FFT, without the raw data the movement mask can't be used
+        if self.config.acquisition_mode == AcquisitionMode.FD:
+            self.radar_window.movement_mask = False
+            print("Radar FD acquisition mode: processing the spectra computed by the radar, the movement mask is disabled.")
+        elif self.config.acquisition_mode == AcquisitionMode.HT:
+            print("Radar HT acquisition mode: the targets of the Human Tracker of the radar are the detections, there is no processing on the host.")
         self.count_between_processing = 5
+        
+        # Optionally run the processing as a graph of stages, each placed inline, in a thread or in a process
+        # The targets of the HT acquisition mode need no processing, so have no stages
+        self.stage_graph = None
+        if stage_config is not None and stage_config['enabled'] and self.config.acquisition_mode != AcquisitionMode.HT:
+            window_args = {'cfar_params': self.config.cfar_params, 
+                           'start_time': self.start_time,
+                           'bin_size': self.config.bin_size_meters,
+                           'f_c': self.config.f_c,
+                           'capacity': self.config.processing_window}
+            self.stage_graph = build_radar_stage_graph(window_args, stage_config['placement'], 
+                                                       capacity=stage_config['capacity'],
+                                                       policy=stage_config['policy'],
+                                                       block_timeout=stage_config['blockTimeoutSec'],
+                                                       load_knobs=self.load_knobs)
+            print(self.stage_graph)
 
     def object_tracking(self, stop_event):
-        # If this is a rerun, read the data from the folder until it's completed
-        if self.config.run_type == RunType.RERUN:
-            self.process_data_from_folder()
-
-        # If this is a live run, keep reading the data from the radar until the stop event is set
-        elif self.config.run_type == RunType.LIVE:
-            self.process_live_data(stop_event)
+        if self.stage_graph is not None:
+            self.stage_graph.start(sink=partial(publish_detections, self.radar_data_queue), stop_event=stop_event)
         
-    def process_live_data(self, stop_event):
+        try:
+            if self.raw_frame_ring is not None:
+                self.process_ring_data(stop_event)
+            else:
+                self.process_acquired_data(stop_event)
+        finally:
+            # Let the stages finish the frames they hold
+            if self.stage_graph is not None:
+                self.stage_graph.stop()
+    
+    def process_acquired_data(self, stop_event):
         """
-        Process the radar data from the radar module until the stop event is set.
+        Acquire and process the radar data in this process, until the stop event is set or the recorded run is completed.
         """
-        if self.config.record_data:
-            print(f"Running radar tracking on live data. Recording raw results to folder: {self.output_dir}")
-            os.makedirs(self.output_dir, exist_ok=True)
-            self.export_radar_config_to_file(self.output_dir)
-        else:
-            print("Running radar tracking on live data. Not recording results.")
-            
-        while not stop_event.is_set():
-            voltage_data = get_td_data_voltage(self.radar_module)
-            if voltage_data is None:
-                # There was likely an error - reset error code, try again
-                self.radar_module.error = False
-                continue
-                 
-            if self.config.record_data:
-                voltage_data.print_data_to_file(self.output_dir)
+        record_data = self.config.record_data and self.config.run_type == RunType.LIVE
+        if self.config.run_type == RunType.LIVE:
+            if record_data:
+                print(f"Running radar tracking on live data. Recording raw results to folder: {self.output_dir}")
+            else:
+                print("Running radar tracking on live data. Not recording results.")
             
-            self.process_time_domain_data(voltage_data)
+        for record in self.acquisition.frames(stop_event):
+            if record_data:
+                record.print_data_to_file(self.output_dir)
             
-    def process_data_from_folder(self):
+            self.process_record(record)
+    
+    def process_ring_data(self, stop_event):
         """
-        Process the radar data from the folder specified in the configuration.
+        Process the radar data the acquisition process writes into the shared memory ring, until the stop event is set.
+        The frames are read in place from the shared memory, and released once they are processed.
         """
-        directory_to_process = self.config.source_path
-        print(f"Processing prerecorded radar data from folder {directory_to_process}.")
-        
-        # List all files in the directory
-        files = os.listdir(directory_to_process)
+        record_data = self.config.record_data and self.config.run_type == RunType.LIVE
+        print(f"Running radar tracking on the frames of the acquisition process.{' Recording raw results to folder: ' + self.output_dir if record_data else ''}")
         
-        # Filter the files based on the naming convention, and sort them
-        txt_files = [f for f in files if f.endswith('.txt')]
-        txt_files.sort()
-        
-        # Process each file one by one
-        for file_name in txt_files:
-            file_path = os.path.join(directory_to_process, file_name)
-            new_td_data = read_columns(file_path)
-            
-            # Simulate the timestamp as the current time to we can use the real-time windowing.
-            # Add a 0.08 second delay between processing since we expect it to take roughly that long to get the radar data
-            new_td_data.timestamp = pd.Timestamp.now()
-            self.process_time_domain_data(new_td_data)
-            time.sleep(0.08)
-            
-        print("Completed all processing of radar data from the folder.")
-            
-    def process_time_domain_data(self, td_data):
-        # Add the raw TD record to the radar window
-        self.radar_window.add_raw_record(td_data)
-        # Call method to process the latest data
-        self.radar_window.process_data()
+        while not stop_event.is_set():
+            if not self.raw_frame_ring.wait(timeout=0.1):
+                continue
+            frames = self.raw_frame_ring.read()
+            for frame in frames:
+                record = record_from_frame(frame)
+                self.record_acquisition_lag(record.timestamp)
+                if record_data:
+                    record.print_data_to_file(self.output_dir)
+                
+                self.process_record(record)
+            self.raw_frame_ring.release(len(frames))
         
-        # detections = self.radar_window.get_most_recent_detections_split_xy()
-        detections = self.radar_window.get_detections_combined_xy()
-        self.send_object_tracks_to_queue(detectionsAtTime=detections) # Send the object tracks to the queue
+        self.print_acquisition_lag()
     
-    def export_radar_config_to_file(self, output_dir, output_file="RadarConfigurationReport.txt"):
+    def record_acquisition_lag(self, timestamp: pd.Timestamp):
         """
-        Exports the radar configuration settings to a text file in a formatted structure.
-
-        Args:
-            output_file (str): The name of the file to write the radar configuration report.
+        Record the time between the frame being acquired and its processing starting.
         """
-        current_date = self.start_time.strftime("%Y-%m-%d")
-        start_time = self.start_time.now().strftime("%H:%M:%S.%f")[:-3]
-        sysParmas = self.radar_module.sysParams
-         # Format the bin size to three decimal points
-        formatted_bin_size_mm = f"{(self.bin_size_meters*1000):.3f}"
-
-        report_content = (
-            f"Date:\t{current_date}\n"
-            f"Start Time:\t{start_time}\n"
-            f"Interface:\tEthernet\n"
-            f"Start-Frequency [MHz]:\t{self.config.minimum_frequency_mhz}\n"
-            f"Stop-Frequency [MHz]:\t{self.config.maximum_frequency_mhz}\n"
-            f"Ramp Time [ms]:\t{self.config.ramp_time_fmcw_chirp}\n"
-            f"Attenuation [dB]:\t{sysParmas.atten}\n"
-            f"Bin Size [mm]:\t{formatted_bin_size_mm}\n"
-            f"Number of Samples:\t1024\n"
-            f"Bin Size [Hz]:\t{sysParmas.freq_bin}\n"
-            f"Zero Pad Factor:\t{sysParmas.zero_pad}\n"
-            f"Normalization:\t{sysParmas.norm}\n"
-            f"Active Channels:\tI1, Q1, I2, Q2\n"
-        )
+        lag = (monotonic_timestamp() - timestamp).total_seconds()
+        self.acquisition_lags.append(lag)
+        observe('radar_acquisition_lag', lag)
+        if len(self.acquisition_lags) % 500 == 0:
+            self.print_acquisition_lag()
+    
+    def print_acquisition_lag(self):
+        if not self.acquisition_lags:
+            return
+        lags_ms = np.array(self.acquisition_lags) * 1000
+        print(f"Radar acquisition lag over {len(lags_ms)} frames: median {np.median(lags_ms):.1f}ms, "
+              f"95th percentile {np.percentile(lags_ms, 95):.1f}ms, max {lags_ms.max():.1f}ms, "
+              f"{self.raw_frame_ring.dropped} frames dropped with the ring full")
+            
+    @timed('radar_frame')
+    def process_record(self, record):
+        """
+        Find the detections of a record, the raw TDData or the FDData spectra computed by the radar, and send them to the queue.
+        The HTData targets of the Human Tracker of the radar are sent as they are.
+        """
+        self.frame_count += 1
+        if self.load_knobs is not None:
+            # Under load only process 1 of every 'radarDecimation' frames
+            if self.frame_count % self.load_knobs.get(RADAR_DECIMATION, 1) != 0:
+                return
+            self.radar_window.movement_mask_every = self.load_knobs.get(MOVEMENT_MASK_EVERY, 1)
         
-        # Write the report to the specified output file
-        file_to_write = os.path.join(output_dir, output_file)
-        with open(file_to_write, 'w') as file:
-            file.write(report_content)
+        # Frames of the shared memory ring are only valid until they are released, anything kept past this frame is copied
+        copy = self.raw_frame_ring is not None
+        if self.stage_graph is not None:
+            self.stage_graph.put(RadarFrame(record, copy=copy))
+            return
+        start_time = time.perf_counter()
+        trace = TraceContext.start(monotonic_seconds(record.timestamp))
+        
+        if isinstance(record, HTData):
+            # The targets found by the radar are already the detections
+            detections = record.to_detections()
+        else:
+            # Add the record to the radar window, the spectra of the radar skip the FFT
+            if isinstance(record, FDData):
+                self.radar_window.add_fft_record(record, copy=copy)
+            else:
+                self.radar_window.add_raw_record(record, copy=copy)
+            # Call method to process the latest data
+            self.radar_window.process_data()
             
+            # detections = self.radar_window.get_most_recent_detections_split_xy()
+            detections = self.radar_window.get_detections_combined_xy()
+        trace.mark(DSP_OUT)
+        detections.trace = trace
+        self.send_object_tracks_to_queue(detectionsAtTime=detections) # Send the object tracks to the queue
+        
+        if self.load_knobs is not None:
+            self.load_knobs.record_latency('radar', time.perf_counter() - start_time)
+    
     def send_object_tracks_to_queue(self, detectionsAtTime: DetectionsAtTime):
         """
         Push the detections to the Queue
         """
         if self.radar_data_queue is not None:
+            if detectionsAtTime.trace is not None:
+                detectionsAtTime.trace.mark(ENQUEUED)
             self.radar_data_queue.put(detectionsAtTime)
     
\ No newline at end of file
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import os
+
+from tracking.clock import monotonic_timestamp
+
+# The columns of a recorded FD file, the real and imaginary parts of each channel
+FD_FILE_COLUMNS = ["I1 Re", "I1 Im", "Q1 Re", "Q1 Im", "I2 Re", "I2 Im", "Q2 Re", "Q2 Im"]
+
+class FDData():
+    def __init__(self, fd_data, timestamp = None):
+        """
+        Initialize the FDData with the spectra computed by the radar and an optional timestamp of when it was recorded.
+        If no timestamp is provided, the current time is used.
+        
+        Parameters:
+            fd_data (np.ndarray): The complex spectra of the channels. [4x512] Matrix Containing --> 
+            I1, Q1, I2, Q2, in the form of the FFT of the TD data computed by the RadarDataWindow
+            timestamp (time.time, optional): The timestamp for the data.
+        """
+        self.fd_data = fd_data
+        self.timestamp = timestamp if timestamp else monotonic_timestamp()
+        
+    def __str__(self):
+        return f"Batch Timestamp: {self.timestamp}\nMatrices Data: {self.fd_data.shape}"
+    
+    def print_data_to_file(self, folder_location: str):
+        # Format the timestamp to a safe and standard file name format
+        timestamp_str = self.timestamp.strftime('%Y-%m-%d_%H-%M-%S.%f')[:-3]
+        file_name = f"FD_{timestamp_str}.txt"
+        file_path = os.path.join(folder_location, file_name)
+        
+        # Create a pandas DataFrame, the real and imaginary parts of each channel side by side
+        columns = np.empty((self.fd_data.shape[1], 8))
+        columns[:, 0::2] = self.fd_data.real.T
+        columns[:, 1::2] = self.fd_data.imag.T
+        df = pd.DataFrame(columns, columns=FD_FILE_COLUMNS)
+
+        # Create a header for the file
+        header = (
+            "Frequency Domain Samples computed by the radar:\t[Re, Im]\n"
+            "=======================================================\n"
+            + "\t".join(f"<{column}>" for column in FD_FILE_COLUMNS) + "\n\n"
+        )
+
+        # Write header and DataFrame to a .txt file
+        with open(file_path, "w") as file:
+            file.write(header)  # Write the header to the file
+            df.to_csv(file, sep='\t', index=False, header=False, float_format="%.6g")
@@ -2,6 +2,8 @@ from enum import Enum
 import pandas as pd
 import os
 
+from tracking.clock import monotonic_timestamp
+
 class FDDataMatrix():
     def __init__(self, fd_data, timestamp = None):
         """
@@ -9,12 +11,12 @@ class FDDataMatrix():
         If no timestamp is provided, the current time is used.
         
         Parameters:
-            fd_data (np.ndarray): The numerical data for the matrix. [512 x 7] Matrix Containing --> 
-            [I1, Q1 [dBm], I2[dBm], Q1 [dBm], Rx1 Phase [Rad], Rx2 Phase [Rad], Estimated View Angle [Deg]]
+            fd_data (np.ndarray): The numerical data for the matrix. [512 x 8] Matrix Containing --> 
+            [I1 [dBm], Q1 [dBm], I2 [dBm], Q2 [dBm], Rx1 Phase [Rad], Rx2 Phase [Rad], Phase Diff [Rad], Estimated View Angle [Deg]]
             timestamp (time.time, optional): The timestamp for the data.
         """
         self.fd_data = fd_data
-        self.timestamp = timestamp if timestamp else pd.Timestamp.now()
+        self.timestamp = timestamp if timestamp else monotonic_timestamp()
         
     def __str__(self):
         """
@@ -33,10 +35,10 @@ class FDDataMatrix():
         # Full path to the file
         full_path = os.path.join(folder_location, file_name)
         
-        column_headers = ['I1 [dBm]', 'Q1 [dBm]', 'I2 [dBm]', 'Q2 [dBm]', 'Rx1 Phase [Rad]', 'Rx2 Phase [Rad]', 'View Ang. [Deg]']
+        column_headers = ['I1 [dBm]', 'Q1 [dBm]', 'I2 [dBm]', 'Q2 [dBm]', 'Rx1 Phase [Rad]', 'Rx2 Phase [Rad]', 'Phase Diff [Rad]', 'View Ang. [Deg]']
         
         # Convert the numpy array to a DataFrame for easy CSV writing
-        df = pd.DataFrame(self.fd_data.reshape(-1, 7), columns=column_headers)  # Reshape to a 2D array if necessary
+        df = pd.DataFrame(self.fd_data.reshape(-1, len(column_headers)), columns=column_headers)  # Reshape to a 2D array if necessary
         df.to_csv(full_path, index=False)
         
         print(f"Data written to {full_path}")
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import os
+
+from constants import RADAR_DETECTION_TYPE
+from tracking.clock import monotonic_timestamp
+from tracking.DetectionBatch import DetectionBatch
+from tracking.DetectionsAtTime import DetectionsAtTime
+
+# The columns of the targets, and of a recorded HT file
+HT_COLUMNS = ["ID", "Tracked", "Count", "Level", "Distance [m]", "Angle [deg]"]
+HT_DISTANCE = 4
+HT_ANGLE = 5
+# The most targets the Human Tracker of the radar reports (nTargets is 1-10)
+HT_MAX_TARGETS = 10
+
+class HTData():
+    def __init__(self, targets, timestamp = None):
+        """
+        Initialize the HTData with the targets found by the Human Tracker of the radar and an optional timestamp of when they were measured.
+        If no timestamp is provided, the current time is used.
+        
+        Parameters:
+            targets (np.ndarray): The targets. [N x 6] Matrix Containing --> 
+            ID, Tracked, Count, Level, Distance [m], Angle [deg]
+            timestamp (time.time, optional): The timestamp for the data.
+        """
+        self.targets = np.asarray(targets, dtype=float).reshape(-1, len(HT_COLUMNS))
+        self.timestamp = timestamp if timestamp else monotonic_timestamp()
+    
+    @classmethod
+    def from_ht_targets(cls, ht_targets, timestamp = None) -> 'HTData':
+        """
+        The targets of the HtTargets of the radar module, as received by HtMeasurement.
+        """
+        return cls(np.column_stack((ht_targets.id, ht_targets.tracked, ht_targets.count,
+                                    ht_targets.level, ht_targets.dist, ht_targets.angle)), timestamp)
+        
+    def __str__(self):
+        return f"Batch Timestamp: {self.timestamp}\nTargets: {len(self.targets)}"
+    
+    def to_detections(self) -> DetectionsAtTime:
+        """
+        The targets as radar detections, converted from their distance and angle to x and y.
+        """
+        distances = self.targets[:, HT_DISTANCE]
+        angles = np.radians(self.targets[:, HT_ANGLE])
+        detections = DetectionBatch.from_xy(distances * np.cos(angles), distances * np.sin(angles), "Rx1")
+        return DetectionsAtTime(self.timestamp, RADAR_DETECTION_TYPE, detections)
+    
+    def print_data_to_file(self, folder_location: str):
+        # Format the timestamp to a safe and standard file name format
+        timestamp_str = self.timestamp.strftime('%Y-%m-%d_%H-%M-%S.%f')[:-3]
+        file_name = f"HT_{timestamp_str}.txt"
+        file_path = os.path.join(folder_location, file_name)
+        
+        # Create a pandas DataFrame
+        df = pd.DataFrame(self.targets, columns=HT_COLUMNS)
+
+        # Create a header for the file
+        header = (
+            "Targets of the Human Tracker of the radar:\t[m, deg]\n"
+            "=======================================================\n"
+            + "\t".join(f"<{column}>" for column in HT_COLUMNS) + "\n\n"
+        )
+
+        # Write header and DataFrame to a .txt file
+        with open(file_path, "w") as file:
+            file.write(header)  # Write the header to the file
+            df.to_csv(file, sep='\t', index=False, header=False, float_format="%.4f")
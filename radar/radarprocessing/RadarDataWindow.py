@@ -1,21 +1,25 @@
 from collections import deque
-from tracking.DetectionsAtTime import DetectionDetails, DetectionsAtTime
+from tracking.DetectionsAtTime import DetectionsAtTime
+from tracking.DetectionBatch import DetectionBatch
 from radar.cfar import ca_cfar_detector, cfar_ca_full, cfar_single, cfar_required_cells
 from radar.radarprocessing.FDDataMatrix import FDSignalType
 from radar.configuration.CFARParams import CFARParams
 from radar.radarprocessing.TDData import TDData
+from radar.radarprocessing.FDData import FDData
 from scipy.signal import spectrogram
 
 import numpy as np
 import pandas as pd
 from datetime import timedelta
 from constants import RADAR_DETECTION_TYPE, SPEED_LIGHT, DIST_BETWEEN_ANTENNAS
+from tracking.clock import monotonic_timestamp
+from pipeline.instrumentation import timed
 
 class RadarDataWindow():
     """
     timestamps -> timestamp of when each record was recorded
-    raw_records -> np array (1024, 4) [I1, Q1, I2, Q2] (all in Volts)
-    records_fft -> np array (512, 4) [I1, Q1, I2, Q2] (in frequency domain)
+    raw_records -> np array (1024, 4) [I1, Q1, I2, Q2] (all in Volts), none for the records added as spectra
+    records_fft -> np array (4, 512) [I1, Q1, I2, Q2] (in frequency domain)
     detection_records -> np array (512, 8) [Rx1_amp, Rx1_Threshold, Rx1 Detection, Rx1 Angle, Rx2_amp, Rx2_Threshold, Rx2 Detection, Rx2 Angle]
     velocity_records -> np array (512, 2) [frequency, velocity]s
     """
@@ -59,6 +63,9 @@ class RadarDataWindow():
         self.spectrogram_cfar = CFARParams(num_guard=2, num_train=5, threshold=2.8)
         self.spectrogram_num_elements = 5
         self.distance_grace_multiplier = 1.2
+        self.movement_mask_every = 1 # Recalculate the movement distances every N records, can be raised when the system is overloaded
+        self.movement_distances = None
+        self.records_since_movement = 0
         
         # Window to apply window, optionally can use a kaiser window as well
         # beta = 6.5  # Adjust this to control sidelobe levels vs. main lobe width
@@ -68,26 +75,51 @@ class RadarDataWindow():
         self.total_time = 0
         self.total_time_entries = 0
 
-    def add_raw_record(self, record : TDData):
+    def add_raw_record(self, record : TDData, copy : bool = False):
         """
         Add a record to the deque.
         Ensure the deque doesn't exceed the capacity set
+        If copy is True the window keeps a copy of the raw data, for data that is only valid until the record is processed.
         """
         self.timestamps.append(record.timestamp)
-        self.raw_records.append(record.td_data)
+        self.raw_records.append(record.td_data.copy() if copy else record.td_data)
+        self.records_since_movement += 1
         
         # Calculate the difference between the current record coming in and the previous record
         if len(self.raw_records) > 1:
-            self.diff_records.append(record.td_data - self.raw_records[-1])
+            self.diff_records.append(record.td_data - self.raw_records[-2])
             dif = record.timestamp - self.timestamps[-2]
             self.total_time += dif.total_seconds()
             self.total_time_entries += 1
         
+        self.records_fft.append(self.compute_fft(record.td_data))
+        self.remove_old_records()
+    
+    def add_fft_record(self, record : FDData, copy : bool = False):
+        """
+        Add the spectra of a record computed by the radar, in place of the FFT of a raw record.
+        There is no raw record, so the movement mask, which needs them for its spectrogram, can't be used.
+        The CFAR applies its gain to the spectra in place, if copy is True the window keeps a copy instead.
+        """
+        self.timestamps.append(record.timestamp)
+        if len(self.timestamps) > 1:
+            dif = record.timestamp - self.timestamps[-2]
+            self.total_time += dif.total_seconds()
+            self.total_time_entries += 1
+        
+        self.records_fft.append(np.array(record.fd_data) if copy else record.fd_data)
+        self.remove_old_records()
+    
+    @timed('radar_fft')
+    def compute_fft(self, td_data):
+        """
+        Calculate the FFT of a raw TD record (1024, 4), returns the first half of the spectrum (4, 512) [I1, Q1, I2, Q2]
+        """
         # Apply the Hanning window to each channel before FFT
-        I1_windowed = record.td_data[:, 0] * self.window
-        Q1_windowed = record.td_data[:, 1] * self.window
-        I2_windowed = record.td_data[:, 2] * self.window
-        Q2_windowed = record.td_data[:, 3] * self.window
+        I1_windowed = td_data[:, 0] * self.window
+        Q1_windowed = td_data[:, 1] * self.window
+        I2_windowed = td_data[:, 2] * self.window
+        Q2_windowed = td_data[:, 3] * self.window
         
         # Calculate the FFT of the record
         I1_fft = np.fft.fft(I1_windowed)[:512]
@@ -95,33 +127,45 @@ class RadarDataWindow():
         I2_fft = np.fft.fft(I2_windowed)[:512]
         Q2_fft = np.fft.fft(Q2_windowed)[:512]
         
-        self.records_fft.append(np.array([I1_fft, Q1_fft, I2_fft, Q2_fft]))
-        self.remove_old_records()
+        return np.array([I1_fft, Q1_fft, I2_fft, Q2_fft])
     
     def remove_old_records(self):
         # Remove records based on capacity if capacity is specified
-        if self.capacity and len(self.raw_records) == self.capacity:
-            self.timestamps.popleft()
-            self.raw_records.popleft()
-            self.records_fft.popleft()
-            self.detection_records.popleft()
-            # self.movement_records.popleft()
+        if self.capacity and len(self.timestamps) == self.capacity:
+            self.remove_oldest_record()
         
         # Remove records based on time window if duration is specified
         elif self.duration:
-            current_time = pd.Timestamp.now().replace(microsecond=0)
+            current_time = monotonic_timestamp()
             while self.timestamps and (current_time - self.timestamps[0] > self.duration):
-                self.timestamps.popleft()
-                self.raw_records.popleft()
-                self.records_fft.popleft()
-                self.detection_records.popleft()
-                # self.movement_records.popleft()
+                self.remove_oldest_record()
+        
+        # A difference for each record after the first, the oldest are dropped with their records
+        while self.diff_records and len(self.diff_records) >= len(self.raw_records):
+            self.diff_records.popleft()
+    
+    def remove_oldest_record(self):
+        self.timestamps.popleft()
+        # The records added as spectra have no raw record
+        if len(self.raw_records) > len(self.timestamps):
+            self.raw_records.popleft()
+        self.records_fft.popleft()
+        self.detection_records.popleft()
+        # self.movement_records.popleft()
     
     def process_data(self):
         """
         Process the data in the window (potentially multiple records eventually, with micro doppler??)
         """
-        I1_fft, Q1_fft, I2_fft, Q2_fft = self.records_fft[-1]
+        self.detection_records.append(self.detect_targets(self.records_fft[-1]))
+    
+    @timed('radar_cfar')
+    def detect_targets(self, record_fft):
+        """
+        Run the CFAR detection on the FFT of a record (4, 512), the SFC gain is applied to the record in place.
+        Returns the detection vector (512, 8) [Rx1_amp, Rx1_Threshold, Rx1 Detection, Rx1 Angle, Rx2_amp, Rx2_Threshold, Rx2 Detection, Rx2 Angle]
+        """
+        I1_fft, Q1_fft, I2_fft, Q2_fft = record_fft
         angles = self.calculate_angles(I1_fft, Q1_fft, I2_fft, Q2_fft)
 
         I1_fft *= self.SFC_gain
@@ -152,7 +196,7 @@ class RadarDataWindow():
         cfar_detection_Rx2, cfar_threshold_Rx2, _ = cfar_ca_full(Rx2_amp, self.cfar_params.num_train, self.cfar_params.num_guard, self.cfar_params.threshold)
         
         detection_vector = np.column_stack((Rx1_amp, cfar_threshold_Rx1, cfar_detection_Rx1, angles, Rx2_amp, cfar_threshold_Rx2, cfar_detection_Rx2, angles))
-        self.detection_records.append(detection_vector)
+        return detection_vector
         
     def get_latest_detection(self):
         return self.detection_records[-1]
@@ -175,7 +219,6 @@ class RadarDataWindow():
         Determine the most recent detections at the certain time.
         By default returns the most recent detections, but an index can be specified to return detections at a different time.
         """
-        detections = []
         timestamps = self.timestamps[-1]
         _, _, cfar_detection_Rx1, angles, _, _, cfar_detection_Rx2, _ = self.detection_records[index].T
         
@@ -205,12 +248,8 @@ class RadarDataWindow():
         x_Rx2 = detected_distances_Rx2 * np.cos(np.radians(detected_angles_Rx2))
         y_Rx2 = detected_distances_Rx2 * np.sin(np.radians(detected_angles_Rx2))
 
-        for x, y in zip(x_Rx1, y_Rx1):
-            detections.append(DetectionDetails("Rx1", [x, 0.2, y, 0.2]))
-    
-        # Add detection details for Rx2
-        for x, y in zip(x_Rx2, y_Rx2):
-            detections.append(DetectionDetails("Rx2", [x, 0.2, y, 0.2]))
+        # Add detection details for Rx1 and Rx2
+        detections = DetectionBatch.from_xy(x_Rx1, y_Rx1, "Rx1") + DetectionBatch.from_xy(x_Rx2, y_Rx2, "Rx2")
         
         return DetectionsAtTime(timestamps, RADAR_DETECTION_TYPE, detections)
     
@@ -219,9 +258,17 @@ class RadarDataWindow():
         Determine the most recent detections at the certain time
         By default returns the most recent detections, but an index can be specified to return detections at a different time.
         """
-        detections = []
-        timestamps = self.timestamps[-1]
-        _, _, cfar_detection_Rx1, angles, _, _, cfar_detection_Rx2, _ = self.detection_records[index].T
+        # Update the movement distances first, so they are timed as their own stage rather than as part of the extraction
+        if self.movement_mask and len(self.raw_records) >= self.spectrogram_num_elements:
+            self.get_movement_distances()
+        return self.combined_detections_xy(self.detection_records[index], self.timestamps[-1], self.get_indexes_with_movement_only_Rx1)
+    
+    @timed('radar_extraction')
+    def combined_detections_xy(self, detection_vector, timestamps, movement_mask) -> DetectionsAtTime:
+        """
+        Find the detections of either receiver in a detection vector, keeping the ones selected by the movement mask function.
+        """
+        _, _, cfar_detection_Rx1, angles, _, _, cfar_detection_Rx2, _ = detection_vector.T
         
         # Ensure the CFAR detection arrays are boolean
         cfar_detection_Rx1 = cfar_detection_Rx1.astype(bool)
@@ -236,7 +283,7 @@ class RadarDataWindow():
         detected_distances_combined = combined_indexes_with_detections * self.bin_size
         
         # Mask detections, that have movement found in them
-        mask = self.get_indexes_with_movement_only_Rx1(detected_distances_combined)
+        mask = movement_mask(detected_distances_combined)
         detected_distances_combined = detected_distances_combined[mask]
         detected_angles_combined = detected_angles_combined[mask]
         
@@ -245,12 +292,67 @@ class RadarDataWindow():
         y_combined = detected_distances_combined * np.sin(np.radians(detected_angles_combined))
         
         # Add detection details for combined detections
-        for x, y in zip(x_combined, y_combined):
-            detections.append(DetectionDetails("Rx1", [x, 0.2, y, 0.2]))
+        detections = DetectionBatch.from_xy(x_combined, y_combined, "Rx1")
         
         return DetectionsAtTime(timestamps, RADAR_DETECTION_TYPE, detections)
 
     
+    def get_movement_distances(self):
+        """
+        Distances with movement, found from the spectrogram of the last records.
+        Only recalculated every 'movement_mask_every' records, in between the last distances are reused.
+        """
+        if self.movement_distances is None or self.records_since_movement >= self.movement_mask_every:
+            self.movement_distances = self.calculate_movement_distances()
+            self.records_since_movement = 0
+        return self.movement_distances
+    
+    @timed('radar_movement_mask')
+    def calculate_movement_distances(self, raw_records=None, avg_sample_time_sec=None):
+        """
+        Find the distances with movement from the spectrogram of the last 'spectrogram_num_elements' records.
+        By default the records and the average time between them are taken from the window.
+        """
+        if raw_records is None:
+            raw_records = self.raw_records
+        Rxs1 = []
+
+        # Loop through the last spectrogram_num_elements of the deque
+        for i in range(self.spectrogram_num_elements):
+            record_index = -1 - i
+            I1, Q1, I2, Q2 = raw_records[record_index].T
+            Rx1 = I1 + 1j * Q1
+            Rxs1.append(Rx1)
+
+        if avg_sample_time_sec is None:
+            avg_sample_time_sec = self.total_time / self.total_time_entries
+        if avg_sample_time_sec == 0:
+            avg_sample_time_sec = 0.241 # This is the normal avg time between entries
+
+        # Convert Rxs1 to an array if needed
+        Rxs = np.array(Rxs1)
+        Fs = 1024/avg_sample_time_sec
+
+        f1, t1, Sxx1 = spectrogram(Rxs.flatten(), fs=Fs, nperseg=1024, noverlap=512)
+        # self.movement_records.append(np.array([f1, t1, Sxx1])) # For now, this isn't used so no point in adding it
+
+        avg_power1 = np.mean(np.abs(Sxx1), axis=1)
+        cfar_mask, _, _= ca_cfar_detector(avg_power1, 
+                                          self.spectrogram_cfar.num_train, 
+                                          self.spectrogram_cfar.num_guard, 
+                                          self.spectrogram_cfar.threshold)
+
+        cfar_mask[0] = cfar_mask[1] = 0
+        # Highlight detected peaks with CFAR
+        detected_freqs = f1[cfar_mask == 1]
+        detected_freqs_hz = detected_freqs  # Detected beat frequencies in Hz
+
+        # Convert the beat frequencies to range (distance), subtract
+        m_w = ( (self.f_c - 24e9) * 2 / avg_sample_time_sec)
+        ranges = (SPEED_LIGHT * detected_freqs_hz) / (2 * m_w)
+        distances_with_doppler = abs(ranges)
+        return distances_with_doppler
+    
     def get_indexes_with_movement_only_Rx1(self, current_detections_and_distances):
         
         # If the mask shouldn't be applied, just return here
@@ -258,50 +360,19 @@ class RadarDataWindow():
             return np.arange(len(current_detections_and_distances))
         
         if (len(self.raw_records) >= self.spectrogram_num_elements):
-        
-            Rxs1 = []
-
-            # Loop through the last spectrogram_num_elements of the deque
-            for i in range(self.spectrogram_num_elements):
-                record_index = -1 - i
-                I1, Q1, I2, Q2 = self.raw_records[record_index].T
-                Rx1 = I1 + 1j * Q1
-                Rxs1.append(Rx1)
-
-            avg_sample_time_sec = self.total_time / self.total_time_entries
-            if avg_sample_time_sec == 0:
-                avg_sample_time_sec = 0.241 # This is the normal avg time between entries
-
-            # Convert Rxs1 to an array if needed
-            Rxs = np.array(Rxs1)
-            Fs = 1024/avg_sample_time_sec
-            
-            f1, t1, Sxx1 = spectrogram(Rxs.flatten(), fs=Fs, nperseg=1024, noverlap=512)
-            # self.movement_records.append(np.array([f1, t1, Sxx1])) # For now, this isn't used so no point in adding it
-            
-            avg_power1 = np.mean(np.abs(Sxx1), axis=1)
-            cfar_mask, _, _= ca_cfar_detector(avg_power1, 
-                                              self.spectrogram_cfar.num_train, 
-                                              self.spectrogram_cfar.num_guard, 
-                                              self.spectrogram_cfar.threshold)
-            
-            cfar_mask[0] = cfar_mask[1] = 0
-            # Highlight detected peaks with CFAR
-            detected_freqs = f1[cfar_mask == 1]
-            detected_freqs_hz = detected_freqs  # Detected beat frequencies in Hz
-
-            # Convert the beat frequencies to range (distance), subtract
-            m_w = ( (self.f_c - 24e9) * 2 / avg_sample_time_sec)
-            ranges = (SPEED_LIGHT * detected_freqs_hz) / (2 * m_w)
-            distances_with_doppler = abs(ranges)
-            
-            diffs = np.abs(current_detections_and_distances[:, np.newaxis] - distances_with_doppler)
-            
-            mask_dif_size = self.bin_size * self.distance_grace_multiplier
-            mask = np.any(diffs <= mask_dif_size, axis=1)
-            
-            # Return indexes of current detections within 1.2 of the bin size
-            indexes = np.where(mask)[0]
-            return indexes
+            return self.get_indexes_with_movement(current_detections_and_distances, self.get_movement_distances())
         else:
-            return np.full(len(current_detections_and_distances), False, dtype=bool)
\ No newline at end of file
+            return np.full(len(current_detections_and_distances), False, dtype=bool)
+    
+    def get_indexes_with_movement(self, current_detections_and_distances, distances_with_doppler):
+        """
+        Indexes of the detections within the grace distance of a distance with movement.
+        """
+        diffs = np.abs(current_detections_and_distances[:, np.newaxis] - distances_with_doppler)
+        
+        mask_dif_size = self.bin_size * self.distance_grace_multiplier
+        mask = np.any(diffs <= mask_dif_size, axis=1)
+        
+        # Return indexes of current detections within 1.2 of the bin size
+        indexes = np.where(mask)[0]
+        return indexes
\ No newline at end of file
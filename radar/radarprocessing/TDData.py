@@ -2,6 +2,8 @@ from enum import Enum
 import pandas as pd
 import os
 
+from tracking.clock import monotonic_timestamp
+
 class TDData():
     def __init__(self, td_data, timestamp = None):
         """
@@ -14,7 +16,7 @@ class TDData():
             timestamp (time.time, optional): The timestamp for the data.
         """
         self.td_data = td_data
-        self.timestamp = timestamp if timestamp else pd.Timestamp.now()
+        self.timestamp = timestamp if timestamp else monotonic_timestamp()
         
     def __str__(self):
         """
@@ -1,4 +1,5 @@
 from radar.radarprocessing.FDDataMatrix import FDDataMatrix
+from radar.radarprocessing.FDData import FDData
 from radar.RadarDevKit.RadarModule import RadarModule, GetRadarModule
 from radar.RadarDevKit.ConfigClasses import SysParams
 from constants import SPEED_LIGHT, DIST_BETWEEN_ANTENNAS
@@ -9,6 +10,14 @@ import numpy as np
 
 from radar.radarprocessing import TDData
 
+FD_MAX_CHANNELS = 4  # I1, Q1, I2, Q2
+FD_FULL_SCALE = 2.**21  # The magnitude of a full scale signal, for the conversion to dBm
+MIN_DBM = -60  # [dBm]
+# The IQ25 refers to a specific precision that is kept and used for the RADIAN angle representation of the data
+# The explicit conversion below is given in the appendix
+IQ25_FULL_SCALE = 2.**25
+IQ25_TO_DEGREES = 180 / (IQ25_FULL_SCALE * np.pi)
+
 def get_td_data_voltage(radar_module: RadarModule, ramp_type: str = "UP-Ramp") -> TDData:
     """
     Get the TD in units of Voltage.
@@ -43,6 +52,90 @@ def get_td_data_voltage_T(radar_module: RadarModule, ramp_type: str = "UP-Ramp")
     """
     return get_td_data_voltage(radar_module, ramp_type).T
     
+def magnitude_to_dbm(magnitudes: np.ndarray) -> np.ndarray:
+    """
+    Convert the FD magnitudes of the radar to dBm, the conversion of the amplitude is given in the appendix of the manual.
+    The bins with no magnitude (zero or less) are set to MIN_DBM.
+    """
+    magnitudes = np.asarray(magnitudes, dtype=float)
+    dbm = np.full(magnitudes.shape, MIN_DBM, dtype=float)
+    valid = magnitudes > 0
+    np.log10(magnitudes / FD_FULL_SCALE, out=dbm, where=valid)
+    np.multiply(dbm, 20, out=dbm, where=valid)
+    return dbm
+
+def fd_channels(values: np.ndarray, active_rx_channels: int, num_samples: int) -> np.ndarray:
+    """
+    Spread the values of the active channels, sent one channel after the other, to the rows of a (4, num_samples)
+    array [I1, Q1, I2, Q2]. The rows of the inactive channels are zero.
+    """
+    active = [ch for ch in range(FD_MAX_CHANNELS) if active_rx_channels & (1 << ch)]
+    channels = np.zeros((FD_MAX_CHANNELS, num_samples), dtype=values.dtype)
+    channels[active] = values[:len(active) * num_samples].reshape(len(active), num_samples)
+    return channels
+
+def decode_fd_data(data, fft_data_type: int, active_rx_channels: int, num_samples: int) -> tuple:
+    """
+    Decode the FD data of the radar, for each FFT_data_type, without a loop over the samples.
+    The pairs of the interleaved layouts are split with strided views of the data.
+
+    :param data: The values received, FD_Data.data.
+    :param fft_data_type: 0 -> only magnitudes, 1 -> magnitude + phase, 2 -> real + imaginary, 3 -> magnitude + object angle
+    :param active_rx_channels: The bit mask of the active channels, sysParams.active_RX_ch.
+    :param num_samples: The number of samples of each channel, FD_Data.nSamples.
+    :return: The magnitudes in dBm (4, num_samples) [I1, Q1, I2, Q2], and the second values of the pairs (4, num_samples):
+        the raw IQ25 phases for type 1, the complex spectrum for type 2, the raw IQ25 object angles for type 3, None for type 0.
+    """
+    values = np.asarray(data, dtype=float)
+    if fft_data_type == 0:
+        magnitudes, second = values, None
+    elif fft_data_type == 2:
+        real, imaginary = values[0::2], values[1::2]
+        magnitudes = np.hypot(real, imaginary)
+        second = fd_channels(real + 1j * imaginary, active_rx_channels, num_samples)
+    elif fft_data_type in (1, 3):
+        magnitudes = values[0::2]
+        second = fd_channels(values[1::2], active_rx_channels, num_samples)
+    else:
+        raise ValueError(f"Unknown FFT data type {fft_data_type}")
+    return fd_channels(magnitude_to_dbm(magnitudes), active_rx_channels, num_samples), second
+
+def fd_spectrum(data, fft_data_type: int, active_rx_channels: int, num_samples: int, fc: float) -> np.ndarray:
+    """
+    The complex spectra (4, num_samples) [I1, Q1, I2, Q2] of the FD data of the radar, in the form of the FFT of the TD data
+    computed by the RadarDataWindow, for its CFAR and angles.
+    The real/imaginary layout is the spectrum itself, and magnitude/phase is turned back into complex values. The magnitude
+    only and magnitude/object angle layouts have no phase per channel, so the phase between the receivers is made up from the
+    object angle of the first channel (zero with magnitudes only), for the angles of the window to give the angle of the radar.
+
+    :param fc: The center frequency in Hz, to turn the object angles into phase differences.
+    """
+    values = np.asarray(data, dtype=float)
+    if fft_data_type == 2:  # real/imaginary
+        return fd_channels(values[0::2] + 1j * values[1::2], active_rx_channels, num_samples)
+    if fft_data_type == 1:  # magnitudes/phase
+        return fd_channels(values[0::2] * np.exp(1j * values[1::2] / IQ25_FULL_SCALE), active_rx_channels, num_samples)
+    
+    if fft_data_type == 0:  # only magnitudes
+        return fd_channels(values, active_rx_channels, num_samples).astype(complex)
+    if fft_data_type == 3:  # magnitudes/object angle
+        magnitudes = fd_channels(values[0::2], active_rx_channels, num_samples).astype(complex)
+        angles = fd_channels(values[1::2], active_rx_channels, num_samples)[0] / IQ25_FULL_SCALE
+        phase_differences = 2 * np.pi * DIST_BETWEEN_ANTENNAS * np.sin(angles) * fc / SPEED_LIGHT
+        # The angles of the window are from the phase of Rx1 relative to Rx2
+        magnitudes[2:] *= np.exp(-1j * phase_differences)
+        return magnitudes
+    raise ValueError(f"Unknown FFT data type {fft_data_type}")
+
+def view_angle_degrees(fc, phase_differences):
+    """
+    The view angle in degrees of the phase differences between the receivers, in radians.
+    """
+    sin_alpha = (phase_differences * SPEED_LIGHT) / (2 * np.pi * fc * DIST_BETWEEN_ANTENNAS)
+    # Ensure sin_alpha is within the valid range for arcsin
+    sin_alpha = np.clip(sin_alpha, -1, 1)
+    return np.degrees(np.arcsin(sin_alpha))
+
 def calculate_phase_data_and_view_angle(fc, raw_phase_data_iq25):
     
     max_iq25 = 2**25
@@ -78,161 +171,52 @@ def calculate_phase_data_and_view_angle(fc, raw_phase_data_iq25):
     phase_differences_unwrapped = np.unwrap([phase_differences])[0]
 
     # Calculate the view angle
-    sin_alpha = (phase_differences_unwrapped * SPEED_LIGHT) / (2 * np.pi * fc * DIST_BETWEEN_ANTENNAS)
-    
-    # Ensure sin_alpha is within the valid range for arcsin
-    sin_alpha = np.clip(sin_alpha, -1, 1)
-        
-    alpha = np.arcsin(sin_alpha)
-    alpha_degrees = np.degrees(alpha)  # Convert from radians to degrees
+    alpha_degrees = view_angle_degrees(fc, phase_differences_unwrapped)
     
     # An array of measured data - [Rx1 Phase [Rad], Rx2 Phase [Rad], Phase_Diff, Estimated View Angle [Deg]] (512 x 4)
     return np.vstack((phase1, phase2, phase_differences_unwrapped, alpha_degrees)).T
 
 def get_FD_data_angle(radarModule: RadarModule, radarParams: SysParams):
-    fc = (radarParams.minFreq*(10**6)) + (radarParams.manualBW / 2)*(10**6) # Central frequency in Hz - Conversion from Mhz to Hz
-    
-    if radarModule.sysParams.FFT_data_type == 3:  # magnitudes/object angle
-        fd_data = radarModule.FD_Data.data      
-        mag_data = [fd_data[n] for n in range(0, len(fd_data), 2)]
-        angle_data_iq25 = np.array([fd_data[n] for n in range(1, len(fd_data), 2)])
-        angle_data_iq25 = np.array(angle_data_iq25)
-    else:
+    """
+    The magnitudes in dBm and the object angles in degrees of the channels (8, nSamples), for FFT_data_type 3, None for the other types.
+    """
+    if radarModule.sysParams.FFT_data_type != 3:  # magnitudes/object angle
         return None
     
-    angle_data_deg = angle_data_iq25 * (180 / (2**25 * np.pi))
-    
-    # Convert to dBm
-    min_dbm = -60  # [dBm]
-    for n in range(len(mag_data)):
-        try:
-            # Conversion of the amplitude to relative frequency per milivolt is given in Appendix and used below
-            mag_data[n] = 20 * np.log10(mag_data[n] / 2.**21)
-        except:
-            mag_data[n] = min_dbm
-            
-    fd_data = []
-    angle_data = []
-    n = 0
-    for ch in range(4):  # maximum possible channels = 4
-        if radarModule.sysParams.active_RX_ch & (1 << ch):
-            ind1 = n * radarModule.FD_Data.nSamples
-            ind2 = ind1 + radarModule.FD_Data.nSamples
-            n += 1
-            fd_data.append(mag_data[ind1:ind2])
-            angle_data.append(angle_data_deg[ind1:ind2])
-        else:
-            fd_data.append([0] * radarModule.FD_Data.nSamples)
-    
-    fd_data = np.array(fd_data)
-    
-    # print(fd_data.shape)
-    angle_data = np.array(angle_data)
-    # print(angle_data.shape)
-    # print("----")
-    return np.vstack((fd_data, angle_data))
+    mag_data, angle_data_iq25 = decode_fd_data(radarModule.FD_Data.data, 3, radarModule.sysParams.active_RX_ch, radarModule.FD_Data.nSamples)
+    return np.vstack((mag_data, angle_data_iq25 * IQ25_TO_DEGREES))
 
 def get_FD_data(radarModule: RadarModule, radarParams: SysParams):
-    fc = (radarParams.minFreq*(10**6)) + (radarParams.manualBW / 2)*(10**6) # Central frequency in Hz - Conversion from Mhz to Hz
-    
-    # Process the FD data based on the data type
-    if radarModule.sysParams.FFT_data_type == 0:  # only magnitudes were transmitted
-        fd_data = radarModule.FD_Data.data
-        mag_data = radarModule.FD_Data.data
-    elif radarModule.sysParams.FFT_data_type == 2:  # real/imaginary 
-        comp_data = [complex(float(radarModule.FD_Data.data[n]), float(radarModule.FD_Data.data[n + 1])) for n in range(0, len(radarModule.FD_Data.data), 2)]
-        mag_data = np.abs(comp_data)
-    elif radarModule.sysParams.FFT_data_type == 3:  # magnitudes/object angle
-        fd_data = radarModule.FD_Data.data      
-        mag_data = [fd_data[n] for n in range(0, len(fd_data), 2)]
-        angle_data_iq25 = np.array([fd_data[n] for n in range(1, len(fd_data), 2)])
-        
-    elif radarModule.sysParams.FFT_data_type == 1: # magnitudes/phase [I1, I1 Phase, Q1, Q1 Phase, I2, I2 Phase, ...]
-        # Central frequency to go from phase to angles
-        fd_data = radarModule.FD_Data.data
-        mag_data = [fd_data[n] for n in range(0, len(fd_data), 2)]
-        raw_phase_data_iq25 = np.array([fd_data[n] for n in range(1, len(fd_data), 2)])
-    
-    # Convert to dBm
-    min_dbm = -60  # [dBm]
-    for n in range(len(mag_data)):
-        try:
-            # Conversion of the amplitude to relative frequency per milivolt is given in Appendix and used below
-            mag_data[n] = 20 * np.log10(mag_data[n] / 2.**21)
-        except:
-            mag_data[n] = min_dbm
-            
-    fd_data = []
-    n = 0
-    for ch in range(4):  # maximum possible channels = 4
-        if radarModule.sysParams.active_RX_ch & (1 << ch):
-            ind1 = n * radarModule.FD_Data.nSamples
-            ind2 = ind1 + radarModule.FD_Data.nSamples
-            n += 1
-            fd_data.append(mag_data[ind1:ind2])
-        else:
-            fd_data.append([0] * radarModule.FD_Data.nSamples)
-    
-    mag_data = np.array(mag_data)
-    fd_data = np.array(fd_data)
-    
-    return fd_data
+    """
+    The magnitudes in dBm of the channels (4, nSamples) [I1, Q1, I2, Q2], for any FFT_data_type.
+    """
+    mag_data, _ = decode_fd_data(radarModule.FD_Data.data, radarModule.sysParams.FFT_data_type,
+                                 radarModule.sysParams.active_RX_ch, radarModule.FD_Data.nSamples)
+    return mag_data
 
 # Get the FD data from the Radar
 def get_FD_data_phase_data(radarModule: RadarModule, radarParams: SysParams) -> FDDataMatrix:
-
+    """
+    The FD data with the phases and the view angle, for any FFT_data_type. The columns the data type has no data for are NaN.
+    """
     fc = (radarParams.minFreq*(10**6)) + (radarParams.manualBW / 2)*(10**6) # Central frequency in Hz - Conversion from Mhz to Hz
+    fft_data_type = radarModule.sysParams.FFT_data_type
+    mag_data, second = decode_fd_data(radarModule.FD_Data.data, fft_data_type, radarModule.sysParams.active_RX_ch, radarModule.FD_Data.nSamples)
     
-    # Process the FD data based on the data type
-    if radarModule.sysParams.FFT_data_type == 0:  # only magnitudes were transmitted
-        fd_data = radarModule.FD_Data.data
-        mag_data = radarModule.FD_Data.data
-    elif radarModule.sysParams.FFT_data_type == 2:  # real/imaginary 
-        comp_data = [complex(float(radarModule.FD_Data.data[n]), float(radarModule.FD_Data.data[n + 1])) for n in range(0, len(radarModule.FD_Data.data), 2)]
-        mag_data = np.abs(comp_data)
-    elif radarModule.sysParams.FFT_data_type == 3:  # magnitudes/object angle
-        fd_data = radarModule.FD_Data.data      
-        mag_data = [fd_data[n] for n in range(0, len(fd_data), 2)]
-        angle_data_iq25 = np.array([fd_data[n] for n in range(1, len(fd_data), 2)])
-        
-        # The IQ25 refers to a specific precision that is kept and used for the RADIAN angle representation of the data
-        # The explicit conversion below is given in the appendix
-        angle_data_deg = angle_data_iq25 * (180 / (2**25 * np.pi))
-        
-    elif radarModule.sysParams.FFT_data_type == 1: # magnitudes/phase [I1, I1 Phase, Q1, Q1 Phase, I2, I2 Phase, ...]
-        # Central frequency to go from phase to angles
-        fd_data = radarModule.FD_Data.data
-        mag_data = [fd_data[n] for n in range(0, len(fd_data), 2)]
-        raw_phase_data_iq25 = np.array([fd_data[n] for n in range(1, len(fd_data), 2)])
-        
-        # An array of measured data - [Rx1 Phase [Rad], Rx2 Phase [Rad], Phase_Diff, Estimated View Angle [Deg]] (512x4)
-        phase_data = calculate_phase_data_and_view_angle(fc, raw_phase_data_iq25)
+    # [Rx1 Phase [Rad], Rx2 Phase [Rad], Phase_Diff, Estimated View Angle [Deg]] (nSamples x 4)
+    phase_data = np.full((mag_data.shape[1], 4), np.nan)
+    if fft_data_type == 1:  # magnitudes/phase [I1, I1 Phase, Q1, Q1 Phase, I2, I2 Phase, ...]
+        phase_data = calculate_phase_data_and_view_angle(fc, second.ravel())
+    elif fft_data_type == 2:  # real/imaginary, the phases of the I channels of the receivers
+        phase_data[:, 0] = np.angle(second[0])
+        phase_data[:, 1] = np.angle(second[2])
+        phase_data[:, 2] = np.angle(second[0] * np.conj(second[2]))
+        phase_data[:, 3] = view_angle_degrees(fc, phase_data[:, 2])
+    elif fft_data_type == 3:  # magnitudes/object angle, of the first channel
+        phase_data[:, 3] = second[0] * IQ25_TO_DEGREES
     
-    # Convert to dBm
-    min_dbm = -60  # [dBm]
-    for n in range(len(mag_data)):
-        try:
-            # Conversion of the amplitude to relative frequency per milivolt is given in Appendix and used below
-            mag_data[n] = 20 * np.log10(mag_data[n] / 2.**21)
-        except:
-            mag_data[n] = min_dbm
-            
-    fd_data = []
-    n = 0
-    for ch in range(4):  # maximum possible channels = 4
-        if radarModule.sysParams.active_RX_ch & (1 << ch):
-            ind1 = n * radarModule.FD_Data.nSamples
-            ind2 = ind1 + radarModule.FD_Data.nSamples
-            n += 1
-            fd_data.append(mag_data[ind1:ind2])
-        else:
-            fd_data.append([0] * radarModule.FD_Data.nSamples)
-    
-    mag_data = np.array(mag_data)
-    fd_data = np.array(fd_data).T
-    
-    # Create the FDDataMatrix of measured data with a timestamp - [512, 7] => [I1, Q1, I2, Q2, Rx1 Phase, Rx2 Phase, Estimated View Angle]
-    return FDDataMatrix(np.hstack((fd_data, phase_data)))
+    # Create the FDDataMatrix of measured data with a timestamp - [512, 8] => [I1, Q1, I2, Q2, Rx1 Phase, Rx2 Phase, Phase Diff, Estimated View Angle]
+    return FDDataMatrix(np.hstack((mag_data.T, phase_data)))
 
 def get_fd_data_with_angles_from_radar(radar_config : RadarConfiguration, 
                                        radar_module: RadarModule,
@@ -260,6 +244,19 @@ def get_fd_data_from_radar(radar_config : RadarConfiguration,
     
     return fd_data
 
+def get_fd_spectrum_from_radar(radar_config : RadarConfiguration,
+                               radar_module: RadarModule,
+                               ramp_type: str = "UP-Ramp") -> FDData:
+    """
+    The spectra computed by the radar, for the FD acquisition mode. None if there was an error receiving them.
+    """
+    radar_module.GetFdData(ramp_type)
+    if radar_module.error:
+        return None
+    spectrum = fd_spectrum(radar_module.FD_Data.data, radar_module.sysParams.FFT_data_type, radar_module.sysParams.active_RX_ch,
+                           radar_module.FD_Data.nSamples, radar_config.f_c)
+    return FDData(spectrum)
+
 if __name__ == "__main__":  
     radar_config = RadarConfiguration()
     module = radar_config.connect_get_radar_module
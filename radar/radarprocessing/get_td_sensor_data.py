@@ -2,6 +2,7 @@ from radar.radarprocessing.TDData import TDData
 from radar.RadarDevKit.RadarModule import RadarModule
 from constants import SPEED_LIGHT, DIST_BETWEEN_ANTENNAS
 from radar.configuration.RunType import RunType
+from tracking.clock import monotonic_timestamp
 
 import numpy as np
 import pandas as pd
@@ -11,7 +12,7 @@ def get_td_data_raw(radar_module: RadarModule, ramp_type: str = "UP-Ramp") -> TD
     Get the TD in the raw absolute value format
     """
     radar_module.GetTdData(measurement=ramp_type)
-    time = pd.Timestamp.now().replace(microsecond=0)
+    time = monotonic_timestamp()
     n_samples = 1024
     
     td_data = []
@@ -43,7 +44,7 @@ def get_td_data_voltage(radar_module: RadarModule, ramp_type: str = "UP-Ramp") -
     if radar_module.error:
         return None
     
-    time = pd.Timestamp.now()
+    time = monotonic_timestamp()
     n_samples = 1024
     
     td_data = []
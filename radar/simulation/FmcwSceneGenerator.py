@@ -0,0 +1,191 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import SPEED_LIGHT, DIST_BETWEEN_ANTENNAS
+from radar.configuration.RadarConfiguration import RadarConfiguration
+from radar.radarprocessing.TDData import TDData
+
+class PointTarget():
+    """
+    A point target of a scene, moving in a straight line away from (positive velocity) or towards the radar.
+    """
+    def __init__(self, range_m: float, angle_deg: float = 0.0, velocity_mps: float = 0.0, rcs_m2: float = 1.0):
+        """
+        :param range_m: Range of the target at the start of the scene, in meters.
+        :param angle_deg: Angle of arrival, in degrees from the boresight of the radar, positive towards +y.
+        :param velocity_mps: Radial velocity in m/s, positive moving away from the radar.
+        :param rcs_m2: Radar cross section in m^2.
+        """
+        self.range_m = range_m
+        self.angle_deg = angle_deg
+        self.velocity_mps = velocity_mps
+        self.rcs_m2 = rcs_m2
+
+    def __repr__(self):
+        return f"PointTarget(range={self.range_m:.1f}m, angle={self.angle_deg:.1f}deg, velocity={self.velocity_mps:.1f}m/s, rcs={self.rcs_m2:g}m2)"
+
+class RadarScene():
+    """
+    The point targets seen by the radar, and the noise and clutter around them.
+
+    The noise is white gaussian noise on each channel. The clutter is a set of static point scatterers
+    (ground, buildings, vegetation) at random ranges and angles, with exponentially distributed RCS.
+    """
+    def __init__(self, targets: list = None, noise_volts: float = 0.002, clutter_count: int = 0,
+                 clutter_rcs_m2: float = 0.5, clutter_max_range_m: float = 100.0, seed: int = None):
+        """
+        :param targets: The PointTargets of the scene.
+        :param noise_volts: Standard deviation of the noise of each channel, in volts.
+        :param clutter_count: The number of static clutter scatterers.
+        :param clutter_rcs_m2: The mean RCS of a clutter scatterer, in m^2.
+        :param clutter_max_range_m: The clutter is spread from 1m to this range.
+        :param seed: Seed of the random noise and clutter, for a repeatable scene.
+        """
+        self.targets = list(targets) if targets is not None else []
+        self.noise_volts = noise_volts
+        self.rng = np.random.default_rng(seed)
+
+        self.clutter = [PointTarget(range_m, angle_deg, 0.0, rcs_m2) for range_m, angle_deg, rcs_m2 in zip(
+            self.rng.uniform(1.0, clutter_max_range_m, clutter_count),
+            self.rng.uniform(-90, 90, clutter_count),
+            self.rng.exponential(clutter_rcs_m2, clutter_count))]
+
+    @classmethod
+    def random(cls, num_targets: int, max_range_m: float = 90.0, max_velocity_mps: float = 15.0, rcs_m2: tuple = (0.01, 1.0),
+               seed: int = None, **kwargs) -> 'RadarScene':
+        """
+        A scene of targets at random ranges, angles (+-60 degrees), velocities and RCS.
+
+        :param rcs_m2: (min, max) of the RCS of the targets, drawn log-uniformly.
+        :param kwargs: The noise and clutter settings of the scene.
+        """
+        rng = np.random.default_rng(seed)
+        targets = [PointTarget(range_m, angle_deg, velocity_mps, rcs) for range_m, angle_deg, velocity_mps, rcs in zip(
+            rng.uniform(2.0, max_range_m, num_targets),
+            rng.uniform(-60, 60, num_targets),
+            rng.uniform(-max_velocity_mps, max_velocity_mps, num_targets),
+            np.exp(rng.uniform(np.log(rcs_m2[0]), np.log(rcs_m2[1]), num_targets)))]
+        return cls(targets, seed=None if seed is None else seed + 1, **kwargs)
+
+    def scatterers(self) -> tuple:
+        """
+        The ranges, angles (deg), velocities and RCS of the targets and the clutter, as arrays.
+        """
+        scatterers = self.targets + self.clutter
+        return tuple(np.array([getattr(s, name) for s in scatterers], dtype=float)
+                     for name in ('range_m', 'angle_deg', 'velocity_mps', 'rcs_m2'))
+
+class FmcwSceneGenerator():
+    """
+    Turns a RadarScene into the TD frames (1024, 4) [I1, Q1, I2, Q2] of the radar, as recorded by the radar module.
+
+    Each scatterer adds a beat tone to both receivers, with the ramp parameters of the radar configuration:
+    - the beat frequency is set by the range (2 * slope * range / c) and the doppler shift (2 * velocity * f_c / c)
+    - the phase is set by the range at the start of the ramp, so it turns between the frames as the target moves
+    - the phase between the receivers is set by the angle (2 * pi * d * sin(angle) * f_c / c)
+    - the amplitude falls with range^2 (the radar equation, for the voltage) and rises with sqrt(RCS)
+
+    The frames are generated in batches, vectorized across the frames and the scatterers of the batch.
+    """
+    def __init__(self, scene: RadarScene, radar_config: RadarConfiguration = None, frame_interval_sec: float = 0.08,
+                 reference_amplitude_volts: float = 5.0, start_time: pd.Timestamp = None, num_samples: int = 1024):
+        """
+        :param scene: The scene to generate the frames of.
+        :param radar_config: The radar configuration, for the frequencies and the ramp time. The defaults if None.
+        :param frame_interval_sec: The time between two frames.
+        :param reference_amplitude_volts: The amplitude of the tone of a 1m^2 target at 1m.
+        :param start_time: Timestamp of the first frame, now by default.
+        :param num_samples: The number of samples of a ramp.
+        """
+        radar_config = radar_config if radar_config is not None else RadarConfiguration(config_path='')
+        self.scene = scene
+        self.frame_interval_sec = frame_interval_sec
+        self.reference_amplitude_volts = reference_amplitude_volts
+        self.start_time = start_time if start_time is not None else pd.Timestamp.now()
+        self.num_samples = num_samples
+
+        self.start_frequency = radar_config.minimum_frequency_mhz * 1e6
+        self.bandwidth = (radar_config.maximum_frequency_mhz - radar_config.minimum_frequency_mhz) * 1e6
+        self.ramp_time = radar_config.ramp_time_fmcw_chirp / 1000  # The ramp time is in ms
+        self.f_c = radar_config.f_c
+        self.frames_generated = 0
+
+    def generate(self, first_frame: int, num_frames: int) -> np.ndarray:
+        """
+        The TD data of the frames first_frame to first_frame + num_frames - 1, as an array (num_frames, 1024, 4).
+        """
+        ranges, angles, velocities, rcs = self.scene.scatterers()
+        samples = np.arange(self.num_samples)
+        times = (first_frame + np.arange(num_frames)) * self.frame_interval_sec
+
+        # (frames, scatterers)
+        frame_ranges = np.abs(ranges + np.outer(times, velocities))
+        beat_frequency = 2 * self.bandwidth / self.ramp_time * frame_ranges / SPEED_LIGHT + 2 * velocities * self.f_c / SPEED_LIGHT
+        cycles_per_sample = beat_frequency * self.ramp_time / self.num_samples
+        start_phase = 4 * np.pi * self.start_frequency * frame_ranges / SPEED_LIGHT
+        amplitude = self.reference_amplitude_volts * np.sqrt(rcs) / np.maximum(frame_ranges, 1.0) ** 2
+        receiver_phase = 2 * np.pi * DIST_BETWEEN_ANTENNAS * np.sin(np.radians(angles)) * self.f_c / SPEED_LIGHT
+
+        # (frames, scatterers, samples), summed over the scatterers
+        phase = 2 * np.pi * cycles_per_sample[:, :, np.newaxis] * samples + start_phase[:, :, np.newaxis]
+        tones = amplitude[:, :, np.newaxis] * np.exp(1j * phase)
+        rx1 = tones.sum(axis=1)
+        rx2 = (tones * np.exp(-1j * receiver_phase)[np.newaxis, :, np.newaxis]).sum(axis=1)
+
+        td_data = np.stack((rx1.real, rx1.imag, rx2.real, rx2.imag), axis=-1)
+        if self.scene.noise_volts:
+            td_data += self.scene.rng.normal(0, self.scene.noise_volts, td_data.shape)
+        return td_data
+
+    def frames(self, num_frames: int = None, batch_size: int = 8, realtime: bool = False, stop_event=None):
+        """
+        Generator of the TDData frames of the scene, continuing from the last frame generated.
+
+        :param num_frames: The number of frames, None for no end.
+        :param batch_size: The number of frames generated at once. Larger is faster, but takes (batch_size * scatterers * 16KB) of memory.
+        :param realtime: If True, the frames are yielded at the frame interval, to load the pipeline as the radar does.
+        :param stop_event: Optional event to stop the frames.
+        """
+        end = None if num_frames is None else self.frames_generated + num_frames
+        next_frame_time = time.monotonic()
+        while (end is None or self.frames_generated < end) and not (stop_event is not None and stop_event.is_set()):
+            count = batch_size if end is None else min(batch_size, end - self.frames_generated)
+            batch = self.generate(self.frames_generated, count)
+            for td_data in batch:
+                timestamp = self.start_time + pd.Timedelta(seconds=self.frames_generated * self.frame_interval_sec)
+                self.frames_generated += 1
+                if realtime:
+                    time.sleep(max(0.0, next_frame_time - time.monotonic()))
+                    next_frame_time += self.frame_interval_sec
+                yield TDData(td_data, timestamp)
+
+    def write_recording(self, folder: str, num_frames: int) -> str:
+        """
+        Write the frames in the format of a recorded run, a 'TD_<timestamp>.txt' file per frame, which the
+        radar can replay with '--radar-from-file --radar-source <folder>'.
+        """
+        os.makedirs(folder, exist_ok=True)
+        for td_data in self.frames(num_frames):
+            td_data.print_data_to_file(folder)
+        return folder
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic radar recording of random targets')
+    parser.add_argument('folder', type=str, help='folder to write the TD files to')
+    parser.add_argument('--radar-config', type=str, default='/configuration/RadarConfig.yaml', help='radar configuration file path')
+    parser.add_argument('--targets', type=int, default=5, help='number of targets')
+    parser.add_argument('--frames', type=int, default=500, help='number of frames')
+    parser.add_argument('--noise', type=float, default=0.002, help='standard deviation of the noise in volts')
+    parser.add_argument('--clutter', type=int, default=20, help='number of static clutter scatterers')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the scene, for a repeatable recording')
+    args = parser.parse_args()
+
+    scene = RadarScene.random(args.targets, noise_volts=args.noise, clutter_count=args.clutter, seed=args.seed)
+    print('\n'.join(str(target) for target in scene.targets))
+    generator = FmcwSceneGenerator(scene, RadarConfiguration(config_path=args.radar_config))
+    generator.write_recording(args.folder, args.frames)
+    print(f"Wrote {args.frames} frames to {args.folder}")
@@ -0,0 +1,121 @@
+import multiprocessing as mp
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from constants import RADAR_DETECTION_TYPE, IMAGE_DETECTION_TYPE
+from pipeline.SharedDetectionQueue import SharedDetectionQueue
+from pipeline.SharedRing import SharedRing
+from tracking.DetectionBatch import DetectionBatch
+from tracking.DetectionsAtTime import DetectionsAtTime
+
+# A record large enough to span several cache lines, every value of the payload is the sequence number
+PAYLOAD_SIZE = 256
+RECORD_DTYPE = np.dtype([('sequence', np.int64), ('payload', np.int64, (PAYLOAD_SIZE,)), ('check', np.int64)])
+
+def produce(ring: SharedRing, num_records: int):
+    """
+    Write the records in order, waiting for a free slot whenever the ring is full instead of dropping.
+    """
+    for sequence in range(num_records):
+        while (slot := ring.reserve()) is None:
+            time.sleep(0)
+        slot['sequence'] = sequence
+        slot['payload'] = sequence
+        slot['check'] = sequence
+        ring.commit()
+    ring.close()
+
+def consume(ring: SharedRing, num_records: int, results):
+    """
+    Read the records in batches of varying size, and report the first torn or out of order record.
+    """
+    rng = np.random.default_rng(0)
+    expected = 0
+    error = None
+    while expected < num_records and error is None:
+        if not ring.wait(timeout=10):
+            error = f"timed out waiting for record {expected}"
+            break
+        records = ring.read(int(rng.integers(1, 8)))
+        for record in records:
+            sequence = int(record['sequence'])
+            if sequence != expected:
+                error = f"record {sequence} read, expected {expected}"
+                break
+            if not (record['payload'] == sequence).all() or int(record['check']) != sequence:
+                error = f"record {sequence} is torn"
+                break
+            expected += 1
+        ring.release(len(records))
+    results.put((expected, error))
+    ring.close()
+
+def test_records_are_not_torn_across_processes():
+    num_records = 20000
+    ring = SharedRing(RECORD_DTYPE, capacity=8)
+    results = mp.Queue()
+    consumer = mp.Process(target=consume, args=(ring, num_records, results))
+    producer = mp.Process(target=produce, args=(ring, num_records))
+    consumer.start()
+    producer.start()
+    try:
+        received, error = results.get(timeout=60)
+    finally:
+        producer.join(timeout=10)
+        consumer.join(timeout=10)
+        ring.close()
+        ring.unlink()
+    assert error is None, error
+    assert received == num_records
+
+def test_full_ring_drops_the_new_record():
+    ring = SharedRing(RECORD_DTYPE, capacity=4)
+    try:
+        for sequence in range(6):
+            record = np.zeros((), dtype=RECORD_DTYPE)
+            record['sequence'] = sequence
+            ring.put(record)
+        assert ring.dropped == 2
+        assert ring.high_water == 4
+        assert [int(record['sequence']) for record in ring.read()] == [0, 1, 2, 3]
+
+        ring.release(2)
+        assert ring.put(record)
+        assert ring.get(timeout=1)['sequence'] == 2
+    finally:
+        ring.close()
+        ring.unlink()
+
+def test_release_of_unread_records_is_an_error():
+    ring = SharedRing(RECORD_DTYPE, capacity=4)
+    try:
+        assert not ring.wait(timeout=0.01)
+        try:
+            ring.release(1)
+            assert False, "released a record that was never read"
+        except ValueError:
+            pass
+    finally:
+        ring.close()
+        ring.unlink()
+
+def test_detection_timestamps_round_trip_in_a_non_utc_time_zone(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/Toronto')
+    time.tzset()
+    queue = SharedDetectionQueue(capacity=4)
+    try:
+        # The radar stamps its frames with naive pd.Timestamps, the video with naive datetimes
+        radar_time = pd.Timestamp('2024-06-01 16:17:18.123456789')
+        video_time = datetime(2024, 6, 1, 16, 17, 18, 250000)
+        queue.put(DetectionsAtTime(radar_time, RADAR_DETECTION_TYPE, DetectionBatch.from_xy([1.0], [2.0], 'Rx1')))
+        queue.put(DetectionsAtTime(video_time, IMAGE_DETECTION_TYPE, DetectionBatch.from_xy([3.0], [4.0], 'person')))
+        assert queue.get(timeout=1).timestamp == radar_time
+        assert queue.get(timeout=1).timestamp == video_time
+    finally:
+        queue.close()
+        queue.unlink()
+        monkeypatch.undo()
+        time.tzset()
@@ -1,6 +1,9 @@
-import multiprocessing as mp
 import time
-import torch
+process_start = time.perf_counter() # Start of the main process, for the startup report
+
+import multiprocessing as mp
+import os
+import sys
 import pandas as pd
 
 from datetime import datetime, timedelta
@@ -8,13 +11,25 @@ from datetime import datetime, timedelta
 from video.VideoConfiguration import VideoConfiguration
 from tracking.TrackingConfiguration import TrackingConfiguration
 
-from cli_arguments import define_argument_parser, update_radar_config, update_video_config, update_tracking_config
+from cli_arguments import define_argument_parser, update_radar_config, update_video_config, update_tracking_config, update_pipeline_config, run_folder
 
-# Different tracking programs
-from tracking.ObjectTrackingGmPhd import get_object_tracking_gm_phd
+# The sensor and tracking subsystems are only imported by the process that runs them, so their heavy
+# dependencies (torch, ultralytics, stonesoup, sklearn, plotly) are not loaded by every process
 from radar.configuration.RadarConfiguration import RadarConfiguration
-from radar.radar_tracking import RadarTracking
-from video.object_tracking_yolo_v8 import track_objects
+from pipeline.StartupTimer import StartupTimer
+from pipeline.SharedDetectionQueue import SharedDetectionQueue
+from pipeline.SharedRing import SharedRing
+from pipeline.FusionScheduler import FusionScheduler
+from pipeline.BoundedChannel import BoundedChannel, KEEP_LATEST
+from pipeline.PipelineConfiguration import PipelineConfiguration
+from pipeline.LoadController import LoadKnobs, LoadController, TRACKER_BATCH_TIME
+from pipeline.process_settings import run_with_process_settings
+from pipeline.benchmark import wait_for_replay_end, write_benchmark_report
+from pipeline.soak import SoakSampler, PipelineSampler, MAIN_SAMPLES, analyse_soak, print_soak_report
+from pipeline.instrumentation import observe, start_instrumentation, stop_instrumentation, serve_metrics
+from tracking.clock import monotonic_now
+from tracking.TraceContext import TraceRecorder, TRACKER_IN, TRACK_OUT
+from constants import RADAR_DETECTION_TYPE, IMAGE_DETECTION_TYPE
 
 from datetime import datetime, timedelta
 import time
@@ -23,120 +38,115 @@ import multiprocessing as mp
 import queue
 from datetime import datetime, timedelta
 
-def radar_tracking_task(stop_event, config: RadarConfiguration, start_time: pd.Timestamp, radar_data_queue: mp.Queue):
-    radar_tracking = RadarTracking(config, start_time, radar_data_queue)
+def video_tracking_task(stop_event, video_config: VideoConfiguration, start_time: pd.Timestamp, image_data_queue: mp.Queue, load_knobs: LoadKnobs = None, instrumentation_config: dict = None):
+    start_instrumentation(instrumentation_config, 'video')
+    startup_timer = StartupTimer()
+    with startup_timer.step('import video'):
+        import torch
+        from video.object_tracking_yolo_v8 import track_objects
+    startup_timer.report()
+    
+    with torch.no_grad():
+        track_objects(stop_event, video_config, start_time, image_data_queue, load_knobs)
+    stop_instrumentation()
+
+def radar_tracking_task(stop_event, config: RadarConfiguration, start_time: pd.Timestamp, radar_data_queue: mp.Queue, load_knobs: LoadKnobs = None, stage_config: dict = None, raw_frame_ring: SharedRing = None, instrumentation_config: dict = None):
+    start_instrumentation(instrumentation_config, 'radar')
+    startup_timer = StartupTimer()
+    with startup_timer.step('import radar'):
+        from radar.radar_tracking import RadarTracking
+    with startup_timer.step('setup'):
+        radar_tracking = RadarTracking(config, start_time, radar_data_queue, load_knobs, stage_config, raw_frame_ring)
+    startup_timer.report()
+    
     radar_tracking.object_tracking(stop_event)
+    if raw_frame_ring is not None:
+        raw_frame_ring.close()
+    stop_instrumentation()
 
+def radar_acquisition_task(stop_event, config: RadarConfiguration, start_time: pd.Timestamp, raw_frame_ring: SharedRing, instrumentation_config: dict = None):
+    start_instrumentation(instrumentation_config, 'radarAcquisition')
+    startup_timer = StartupTimer()
+    with startup_timer.step('import radar'):
+        from radar.RadarAcquisition import RadarAcquisition
+    with startup_timer.step('connect'):
+        radar_acquisition = RadarAcquisition(config, start_time, os.path.join(config.output_path, start_time.strftime('%Y-%m-%d_%H-%M-%S'), 'radar'))
+    startup_timer.report()
+    
+    radar_acquisition.acquire_to_ring(stop_event, raw_frame_ring)
+    raw_frame_ring.close()
+    stop_instrumentation()
 
-def process_queues(stop_event, tracker, image_data_queue, radar_data_queue, batching_time=0.2):
+def tracking_task(stop_event, start_time: pd.Timestamp, tracking_config: TrackingConfiguration, image_data_queue, radar_data_queue, batching_time=0.2, load_knobs: LoadKnobs = None, load_controller_config: dict = None, tracing_config: dict = None, instrumentation_config: dict = None):
+    """
+    Build the tracker in the tracking process, so only this process loads the tracker's dependencies, and feed it the detections.
+    """
+    start_instrumentation(instrumentation_config, 'tracking')
+    startup_timer = StartupTimer()
+    with startup_timer.step('import and build tracker'):
+        from tracking.object_tracker import get_object_tracker
+        tracker = get_object_tracker(start_time, tracking_config)
+    startup_timer.report()
     
-    count = 1
-    last_print_time = datetime.now()
-    last_remove_tracks_time = datetime.now()
-    time_window = timedelta(seconds=batching_time)  # Define the window
-    max_wait_time = 0.14  # Wax wait time to check data in the queue (just less than half the batching time)
+    trace_recorder = None
+    if tracing_config is not None and tracing_config['enabled']:
+        trace_recorder = TraceRecorder(tracing_config['maxSamples'], tracing_config['printUpdates'])
+    process_queues(stop_event, tracker, image_data_queue, radar_data_queue, batching_time, load_knobs, load_controller_config, trace_recorder)
+    if trace_recorder is not None:
+        trace_recorder.print_summary()
+        # Set by the benchmark mode, to read back the latencies once the run is over
+        if tracing_config.get('reportPath'):
+            trace_recorder.write_summary(tracing_config['reportPath'])
+    stop_instrumentation()
 
-    last_batch_time = None
 
-    # Buffers to store data for the next processing loop
-    image_buffer = []
-    radar_buffer = []
+def process_queues(stop_event, tracker, image_data_queue, radar_data_queue, batching_time=0.2, load_knobs: LoadKnobs = None, load_controller_config: dict = None, trace_recorder: TraceRecorder = None):
+    """
+    Feed the detections from the sensor queues to the tracker, in time order.
+    Data is held for up to 'batching_time' seconds waiting for older data from the other sensor.
+    If load_knobs are given, a load controller adjusts them to keep the pipeline within its latency budget.
+    If a trace_recorder is given, the end to end latency of every tracker update is recorded.
+    """
+    scheduler = FusionScheduler({IMAGE_DETECTION_TYPE: image_data_queue, RADAR_DETECTION_TYPE: radar_data_queue}, lateness=batching_time)
+    scheduler.start()
+    
+    load_controller = None
+    if load_knobs is not None:
+        load_controller = LoadController(load_knobs, 
+                                         channels=[image_data_queue, radar_data_queue],
+                                         latency_budget=load_controller_config['latencyBudgetSec'],
+                                         low_watermark=load_controller_config['lowWatermark'],
+                                         interval=load_controller_config['intervalSec'])
+        load_controller.start()
+    
+    last_print_time = datetime.now()
+    last_remove_tracks_time = datetime.now()
 
     while not stop_event.is_set():
-        processed_anything = False
-        image_detections_in_window = []
-        radar_detections_in_window = []
-
-        # Define a batch time window for collecting data
-        if last_batch_time is None:
-            last_batch_time = datetime.now()
-
-        batch_window_end = last_batch_time + time_window  # Set the upper limit for the current batch window
-
-        # Fetch all image data within the batch window
-        try:
-            # Process buffered image data from the previous loop
-            for detectionsAtTime in image_buffer:
-                image_timestamp = detectionsAtTime.timestamp
-                if image_timestamp <= batch_window_end:
-                    image_detections_in_window.append(detectionsAtTime)
-                else:
-                    # Keep the data for the next loop
-                    break
-
-            image_buffer = [d for d in image_buffer if d.timestamp > batch_window_end]
-
-            # Process new data from the queue
-            while image_data_queue is not None and not image_data_queue.empty():
-                detectionsAtTime = image_data_queue.get(timeout=max_wait_time)
-                image_timestamp = detectionsAtTime.timestamp
-                
-                if image_timestamp <= batch_window_end:
-                    image_detections_in_window.append(detectionsAtTime)
-                else:
-                    # Buffer data for the next loop
-                    image_buffer.append(detectionsAtTime)
-                    break
-
-        except queue.Empty:
-            pass
-
-        # Fetch all radar data within the batch window
-        try:
-            # Process buffered radar data from the previous loop
-            for detectionsAtTime in radar_buffer:
-                radar_timestamp = detectionsAtTime.timestamp
-                if radar_timestamp <= batch_window_end:
-                    radar_detections_in_window.append(detectionsAtTime)
-                else:
-                    # Keep the data for the next loop
-                    break
-
-            radar_buffer = [d for d in radar_buffer if d.timestamp > batch_window_end]
-
-            # Process new data from the queue
-            while radar_data_queue is not None and not radar_data_queue.empty():
-                detectionsAtTime = radar_data_queue.get(timeout=max_wait_time)
-                radar_timestamp = detectionsAtTime.timestamp
-                
-                if radar_timestamp <= batch_window_end:
-                    radar_detections_in_window.append(detectionsAtTime)
-                else:
-                    # Buffer data for the next loop
-                    radar_buffer.append(detectionsAtTime)
-                    break
-
-        except queue.Empty:
-            pass
-
-        # Process both image and radar data if available within the time window
-        if image_detections_in_window and radar_detections_in_window:
-            combined_timestamp = max(
-                image_detections_in_window[-1].timestamp, radar_detections_in_window[-1].timestamp
-            )
-            combined_detections = (
-                image_detections_in_window[-1].detections + radar_detections_in_window[-1].detections
-            )
-            tracker.update_tracks(combined_detections, combined_timestamp, type="combined")
+        # Under load, merge the detections close in time into a single tracker update
+        batch_window = load_knobs.get(TRACKER_BATCH_TIME, 0.0) if load_knobs is not None else 0.0
+        batch = scheduler.get_batch(timeout=0.5, window=batch_window)
+        if batch:
+            # Time from the detection to it reaching the tracker, through the sensor queue and the fusion scheduler
+            received = monotonic_now()
+            for detectionsAtTime in batch:
+                observe(f'queue_transit_{detectionsAtTime.type}', (received - detectionsAtTime.timestamp).total_seconds())
             
-        elif image_detections_in_window:
-            image_timestamp = image_detections_in_window[-1].timestamp
-            image_detections = image_detections_in_window[-1].detections
-            tracker.update_tracks(image_detections, image_timestamp, type="image_only")
-
-        elif radar_detections_in_window:
-            radar_timestamp = radar_detections_in_window[-1].timestamp
-            radar_detections = radar_detections_in_window[-1].detections
-            tracker.update_tracks(radar_detections, radar_timestamp, type="radar_only")
-        else:
-            last_batch_time = datetime.now()  # Set the start of the next batch window
+            update_start = time.perf_counter()
+            trace_batch(batch, TRACKER_IN)
+            detections = batch[0].detections
+            for detectionsAtTime in batch[1:]:
+                detections = detections + detectionsAtTime.detections
+            tracker.update_tracks(detections, batch[-1].timestamp, type=batch[-1].type)
+            trace_batch(batch, TRACK_OUT, trace_recorder)
+            update_time = time.perf_counter() - update_start
+            observe('tracker_update', update_time)
             
-            time.sleep(0.01) # Small sleep to avoid busy waiting
-            continue
+            if load_knobs is not None:
+                load_knobs.record_latency('tracker', update_time)
+                load_knobs.record_latency('endToEnd', (monotonic_now() - batch[0].timestamp).total_seconds())
         
-        count += 1
         current_time = datetime.now()
-        last_batch_time = current_time  # Set the start of the next batch window
         # Print current tracks approx every 5 seconds
         if (current_time - last_print_time).total_seconds() >= 5:
             
@@ -149,11 +159,36 @@ def process_queues(stop_event, tracker, image_data_queue, radar_data_queue, batc
                 last_remove_tracks_time = current_time
 
             tracker.print_current_tracks(remove_tracks=remove, interval=interval)
+            print(f"Fusion: {scheduler.stats()}")
+            if load_knobs is not None:
+                print(f"Load: {load_knobs.values()}, latency: {load_knobs.latencies()}")
             last_print_time = current_time
 
+    # Track the data that was still held back
+    if load_controller is not None:
+        load_controller.stop()
+    scheduler.stop()
+    for detectionsAtTime in scheduler.flush():
+        trace_batch([detectionsAtTime], TRACKER_IN)
+        tracker.update_tracks(detectionsAtTime.detections, detectionsAtTime.timestamp, type=detectionsAtTime.type)
+        trace_batch([detectionsAtTime], TRACK_OUT, trace_recorder)
+    print(f"Fusion: {scheduler.stats()}")
+
     tracker.show_tracks_plot()
     tracker.print_current_tracks(remove_tracks=True, interval=batching_time*2)
             
+def trace_batch(batch, point: str, trace_recorder: TraceRecorder = None):
+    """
+    Mark the detections of a tracker update as passing the trace point, all at the same time.
+    If a trace recorder is given, record their traces.
+    """
+    now = time.monotonic()
+    for detectionsAtTime in batch:
+        if detectionsAtTime.trace is not None:
+            detectionsAtTime.trace.mark(point, now)
+        if trace_recorder is not None:
+            trace_recorder.record(detectionsAtTime)
+            
 def plot_data(plot_queue: mp.Queue, stop_event):
     while not stop_event.is_set():
         while plot_queue is not None and not plot_queue.empty():
@@ -164,6 +199,7 @@ def plot_data(plot_queue: mp.Queue, stop_event):
                 pass
 
 if __name__ == '__main__':
+    startup_timer = StartupTimer("Main", start=process_start)
     start_time = pd.Timestamp.now()
     parser = define_argument_parser()
     parser.set_defaults(download=True)
@@ -176,16 +212,41 @@ if __name__ == '__main__':
     radar_data_queue = None
     image_data_queue = None
     plot_data_queue = None
+    raw_frame_ring = None
+    source_processes = [] # The processes that read the recordings, in benchmark mode
+    replay_start = time.monotonic()
+    
+    pipeline_config = PipelineConfiguration(config_path=args.pipeline_config)
+    pipeline_config = update_pipeline_config(pipeline_config, args, start_time) # Update the process scheduling and profiling with the command line arguments
+    processes = pipeline_config.processes
+    
+    def create_data_queue(channel_name):
+        # Bounded channels, so the tracker sheds old frames instead of falling behind
+        channel = pipeline_config.channels[channel_name]
+        # Shared memory avoids pickling every frame of detections between the processes
+        if args.shared_memory_queue:
+            return SharedDetectionQueue(max_detections=args.shared_memory_max_detections, capacity=channel['capacity'], keep_latest=channel['policy'] == KEEP_LATEST)
+        return BoundedChannel(channel['capacity'], channel['policy'], pipeline_config.blockTimeoutSec, name=channel_name)
+    
+    # Latency histograms of each stage, written to file by each process
+    instrumentation_config = pipeline_config.instrumentation
+    if instrumentation_config['enabled'] and instrumentation_config['prometheusPort']:
+        serve_metrics(instrumentation_config['directory'], instrumentation_config['prometheusPort'])
+    
+    # Run time settings the load controller turns to keep within the latency budget
+    load_knobs = None
+    if pipeline_config.loadController['enabled']:
+        load_knobs = LoadKnobs(pipeline_config.loadController['knobs'])
       
     # Create the video tracking configuration, process, queue to move data
     if not args.skip_video:
         video_config = VideoConfiguration(config_path=args.video_config)
         video_config = update_video_config(video_config, args) # Update the video configuration with the command line arguments
         
-        image_data_queue = mp.Queue()
-        with torch.no_grad():
-            video_proc = mp.Process(name="Video Data Coll.", target=track_objects, args=(stop_event, video_config, start_time, image_data_queue))
-            video_proc.start()  
+        image_data_queue = create_data_queue('image')
+        video_proc = mp.Process(name="Video Data Coll.", target=run_with_process_settings, args=(processes['video'], video_tracking_task, stop_event, video_config, start_time, image_data_queue, load_knobs, instrumentation_config))
+        video_proc.start()  
+        source_processes.append(video_proc)
     
     # Create the radar tracking configuration, process, queue to move data if not disabled
     if not args.skip_radar:
@@ -194,36 +255,101 @@ if __name__ == '__main__':
         radar_config = RadarConfiguration(config_path=args.radar_config)
         radar_config = update_radar_config(radar_config, args) # Update the radar configuration with the command line arguments
         
-        radar_data_queue = mp.Queue()
-        radar_proc = mp.Process(name="Radar Data Coll.", target=radar_tracking_task, args=(stop_event, radar_config, start_time, radar_data_queue))
+        radar_data_queue = create_data_queue('radar')
+        
+        # Optionally acquire the radar frames in their own process, handing them over through shared memory
+        if pipeline_config.radarAcquisition['separateProcess']:
+            from radar.RadarAcquisition import create_raw_frame_ring
+            raw_frame_ring = create_raw_frame_ring(pipeline_config.radarAcquisition['ringCapacity'], radar_config.acquisition_mode)
+            acquisition_proc = mp.Process(name="Radar Acquisition", target=run_with_process_settings, args=(processes['radarAcquisition'], radar_acquisition_task, stop_event, radar_config, start_time, raw_frame_ring, instrumentation_config))
+            acquisition_proc.start()
+        
+        radar_proc = mp.Process(name="Radar Data Coll.", target=run_with_process_settings, args=(processes['radar'], radar_tracking_task, stop_event, radar_config, start_time, radar_data_queue, load_knobs, pipeline_config.radarStages, raw_frame_ring, instrumentation_config))
         radar_proc.start()
+        source_processes.append(acquisition_proc if raw_frame_ring is not None else radar_proc)
       
     # Create the object tracking configuration, process, queue to move data
     if not args.skip_tracking:
-        tracking_config = TrackingConfiguration()
+        tracking_config = TrackingConfiguration(config_path=args.tracking_config)
         tracking_config = update_tracking_config(tracking_config, args) # Update the video configuration with the command line arguments
         tracking_config.max_track_distance = radar_config.bin_size_meters * 512 # Override the max distance based on radar range
-        tracker = get_object_tracking_gm_phd(start_time, tracking_config)
         
-        # Queue process to handle incoming data
-        tracking_proc = mp.Process(name="Tracking", target=process_queues, args=(stop_event, tracker, image_data_queue, radar_data_queue, args.batching_time))
+        # Queue process to handle incoming data, the tracker is built by the process
+        tracking_proc = mp.Process(name="Tracking", target=run_with_process_settings, args=(processes['tracking'], tracking_task, stop_event, start_time, tracking_config, image_data_queue, radar_data_queue, args.batching_time, load_knobs, pipeline_config.loadController, pipeline_config.tracing, instrumentation_config))
         tracking_proc.start()
-        
+    
+    startup_timer.report()
+    
+    replay_duration = None
+    soak_sampler = None
+    soak_passed = True
     try:
-        while True:
-            user_input = input("Type 'q' and hit ENTER to quit:\n")
-            if user_input.lower() == 'q':
-                stop_event.set()
-                break
+        if args.benchmark:
+            # Run until the recordings are replayed and processed, instead of waiting for the user
+            print("Benchmark: replaying the recordings as fast as possible.")
+            settle_time = args.batching_time + 1.0
+            wait_for_replay_end(stop_event, source_processes, [raw_frame_ring, image_data_queue, radar_data_queue], settle_time=settle_time)
+            # The report times the run from the trace, this is only used without one
+            replay_duration = time.monotonic() - replay_start - settle_time
+        elif pipeline_config.soak['enabled']:
+            # Run for the duration of the soak test, sampling the queues and the latency of the stages from this process
+            soak = pipeline_config.soak
+            soak_sampler = SoakSampler(soak['directory'], MAIN_SAMPLES, soak['intervalSec'], soak['topObjectTypes'],
+                                       PipelineSampler({'rawFrames': raw_frame_ring, 'image': image_data_queue, 'radar': radar_data_queue},
+                                                       instrumentation_config['directory']))
+            soak_sampler.start()
+            print(f"Soak test: running for {soak['durationSec']:g} seconds, samples every {soak['intervalSec']:g} seconds to {soak['directory']}. Ctrl+C to stop early.")
+            stop_event.wait(soak['durationSec'])
+            stop_event.set()
+        else:
+            while True:
+                user_input = input("Type 'q' and hit ENTER to quit:\n")
+                if user_input.lower() == 'q':
+                    stop_event.set()
+                    break
     except KeyboardInterrupt:
         stop_event.set()
     finally:
         if not args.skip_radar:
             radar_proc.join()
+            if raw_frame_ring is not None:
+                acquisition_proc.join()
         if not args.skip_video:
             video_proc.join()
         if not args.skip_tracking:
             tracking_proc.join()
+        
+        # Only a replay that ran to its end is reported
+        if replay_duration is not None:
+            benchmark_settings = {'label': args.benchmark_label,
+                                  'radarSource': None if args.skip_radar else radar_config.source_path,
+                                  'videoSource': None if args.skip_video else video_config.videoSource,
+                                  'sharedMemoryQueue': args.shared_memory_queue,
+                                  'radarAcquisitionProcess': raw_frame_ring is not None,
+                                  'radarStages': pipeline_config.radarStages['enabled'],
+                                  'loadController': load_knobs is not None,
+                                  'activeFilter': None if args.skip_tracking else tracking_config.activeFilter}
+            write_benchmark_report(run_folder(args, start_time, 'benchmark'), replay_duration,
+                                   {'rawFrames': raw_frame_ring, 'image': image_data_queue, 'radar': radar_data_queue},
+                                   benchmark_settings)
+        
+        if soak_sampler is not None:
+            soak_sampler.stop()
+            soak = pipeline_config.soak
+            soak_report = analyse_soak(soak['directory'], soak['warmupSec'], soak['memoryGrowthMbPerHour'], soak['latencyGrowth'])
+            print_soak_report(soak_report)
+            soak_passed = soak_report['passed']
+        
+        # Free the shared memory once all the processes are finished with it
+        if raw_frame_ring is not None:
+            raw_frame_ring.close()
+            raw_frame_ring.unlink()
+        for data_queue in (image_data_queue, radar_data_queue):
+            if isinstance(data_queue, SharedDetectionQueue):
+                data_queue.close()
+                data_queue.unlink()
 
     duration = time.time() - start_time.timestamp()
     print(f"Tracking duration: {duration:.2f} seconds")
+    if not soak_passed:
+        sys.exit(1)
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+from stonesoup.base import Property
+from stonesoup.models.transition.linear import CombinedLinearGaussianTransitionModel
+
+
+class CachedCombinedLinearGaussianTransitionModel(CombinedLinearGaussianTransitionModel):
+    """
+    Combined linear Gaussian transition model that memoizes the transition matrix F(dt)
+    and the process noise covariance Q(dt) for each time step.
+
+    The Kalman predictor asks the transition model for F and Q on every predict of every
+    Gaussian component, but in steady state the time step only takes a handful of values.
+    The matrices are cached in a bounded LRU keyed by the time interval and shared across
+    components and updates. Cached matrices are read-only so a caller cannot corrupt the cache.
+
+    Only the time interval is used as the cache key, so this must only wrap models whose
+    matrices depend solely on the time interval (e.g. ConstantVelocity).
+
+    With full precision timestamps the time step jitters by a few milliseconds between updates,
+    so it is rounded to 'time_resolution' seconds and the matrices are built for the rounded step.
+    """
+    cache_size: int = Property(default=32, doc="Maximum number of time steps to keep in the cache.")
+    time_resolution: float = Property(default=None,
+                                      doc="Round the time step to this many seconds before caching, None or 0 disables rounding.")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._matrix_cache = OrderedDict()
+        self._covar_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def matrix(self, time_interval=None, **kwargs):
+        """
+        Transition matrix F for the time interval, built once per distinct interval.
+        """
+        return self._get_cached(self._matrix_cache, super().matrix, time_interval, **kwargs)
+
+    def covar(self, time_interval=None, **kwargs):
+        """
+        Process noise covariance Q for the time interval, built once per distinct interval.
+        """
+        return self._get_cached(self._covar_cache, super().covar, time_interval, **kwargs)
+
+    def clear_cache(self):
+        """
+        Remove all the cached matrices.
+        """
+        self._matrix_cache.clear()
+        self._covar_cache.clear()
+
+    def _get_cached(self, cache: OrderedDict, build, time_interval, **kwargs):
+        if time_interval is not None and self.time_resolution:
+            steps = round(time_interval.total_seconds() / self.time_resolution)
+            time_interval = timedelta(seconds=steps * self.time_resolution)
+        key = time_interval
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            self.cache_hits += 1
+            return value
+
+        self.cache_misses += 1
+        value = build(time_interval=time_interval, **kwargs)
+        value.flags.writeable = False
+        cache[key] = value
+        # Evict the least recently used time step once the cache is full
+        if len(cache) > max(self.cache_size, 1):
+            cache.popitem(last=False)
+        return value
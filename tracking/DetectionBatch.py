@@ -0,0 +1,121 @@
+from typing import List, Sequence, Union
+import numpy as np
+
+from tracking.DetectionsAtTime import DetectionDetails
+
+class DetectionBatch:
+    """
+    Columnar set of detections, stored as NumPy arrays instead of a list of DetectionDetails.
+
+    The producers fill the arrays in one go and the tracker reads the positions directly, without building
+    a Python object per detection. Iterating or indexing the batch still yields DetectionDetails, and
+    batches can be added to other batches or lists of DetectionDetails, so it can be used anywhere a
+    list of detections was used before.
+
+    Attributes:
+        data (np.ndarray): Nx4 array of the detections [x, x_v, y, y_v].
+        class_ids (np.ndarray): N indexes into class_names, the type of each detected object.
+        class_names (tuple): The object types (e.g., 'Rx1', 'person') referenced by class_ids.
+        scores (np.ndarray): N confidences of the detections.
+    """
+    def __init__(self, data: np.ndarray, class_ids: np.ndarray, class_names: Sequence[str], scores: np.ndarray = None):
+        self.data = np.asarray(data, dtype=float).reshape(-1, 4)
+        self.class_ids = np.asarray(class_ids, dtype=np.int32).reshape(-1)
+        self.class_names = tuple(class_names)
+        self.scores = np.ones(len(self.data)) if scores is None else np.asarray(scores, dtype=float).reshape(-1)
+
+    @classmethod
+    def from_xy(cls, x: np.ndarray, y: np.ndarray, obj_type: str, velocity: float = 0.2, scores: np.ndarray = None) -> 'DetectionBatch':
+        """
+        Create a batch of detections of a single object type from arrays of x and y positions.
+
+        :param x: The x positions of the detections.
+        :param y: The y positions of the detections.
+        :param obj_type: The type of the detected objects.
+        :param velocity: The value used for both velocities of every detection.
+        :param scores: Optional confidence of each detection.
+        """
+        x = np.asarray(x, dtype=float).reshape(-1)
+        data = np.empty((len(x), 4))
+        data[:, 0] = x
+        data[:, 1] = velocity
+        data[:, 2] = y
+        data[:, 3] = velocity
+        return cls(data, np.zeros(len(x), dtype=np.int32), (obj_type,), scores)
+
+    @classmethod
+    def from_details(cls, detections: List[DetectionDetails]) -> 'DetectionBatch':
+        """
+        Create a batch from a list of DetectionDetails.
+        """
+        if isinstance(detections, DetectionBatch):
+            return detections
+        class_names = {}
+        class_ids = [class_names.setdefault(detection.object, len(class_names)) for detection in detections]
+        data = [detection.data[:4] for detection in detections]
+        scores = [getattr(detection, 'score', 1.0) for detection in detections]
+        return cls(data, class_ids, list(class_names), scores)
+
+    @classmethod
+    def empty(cls) -> 'DetectionBatch':
+        return cls(np.empty((0, 4)), np.empty(0, dtype=np.int32), ())
+
+    @property
+    def xy(self) -> np.ndarray:
+        """
+        Nx2 array of the [x, y] positions of the detections.
+        """
+        return self.data[:, [0, 2]]
+
+    @property
+    def objects(self) -> List[str]:
+        """
+        The object type of each detection.
+        """
+        return [self.class_names[class_id] for class_id in self.class_ids]
+
+    def concatenate(self, other: Union['DetectionBatch', List[DetectionDetails]]) -> 'DetectionBatch':
+        """
+        A new batch with the detections of this batch followed by the other detections.
+        """
+        other = DetectionBatch.from_details(other)
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other
+
+        # Merge the class names, and remap the class ids of the other batch
+        class_names = list(self.class_names)
+        remap = np.empty(len(other.class_names), dtype=np.int32)
+        for i, name in enumerate(other.class_names):
+            if name not in class_names:
+                class_names.append(name)
+            remap[i] = class_names.index(name)
+
+        return DetectionBatch(np.concatenate([self.data, other.data]),
+                              np.concatenate([self.class_ids, remap[other.class_ids]]),
+                              class_names,
+                              np.concatenate([self.scores, other.scores]))
+
+    def __add__(self, other):
+        if isinstance(other, (DetectionBatch, list)):
+            return self.concatenate(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return DetectionBatch.from_details(other).concatenate(self)
+        return NotImplemented
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index: int) -> DetectionDetails:
+        return DetectionDetails(self.class_names[self.class_ids[index]], self.data[index].tolist(), float(self.scores[index]))
+
+    def __iter__(self):
+        for class_id, data, score in zip(self.class_ids, self.data.tolist(), self.scores.tolist()):
+            yield DetectionDetails(self.class_names[class_id], data, score)
+
+    def __repr__(self):
+        return f"DetectionBatch(detections={len(self)}, objects={self.class_names})"
@@ -2,15 +2,17 @@ from typing import List, Literal
 from datetime import datetime
 
 class DetectionDetails:
-    def __init__(self, obj_type: str, detection_data: List[float]):
+    def __init__(self, obj_type: str, detection_data: List[float], score: float = 1.0):
         """
         Initialize a single detection.
 
         :param obj_type: The type of the detected object (e.g., 'vehicle', 'bird').
         :param detection: A list containing [x, x_v, y, y_v] values as floats.
+        :param score: The confidence of the detection, 1.0 if the sensor doesn't provide one.
         """
         self.object = obj_type  # Store the type of the object
         self.data = detection_data  # Store the detection data [x, x_v, y, y_v]
+        self.score = score  # Store the confidence of the detection
 
     def __repr__(self):
         """
@@ -22,17 +24,19 @@ class DetectionDetails:
 
 
 class DetectionsAtTime:
-    def __init__(self, timestamp: datetime, data_type: Literal['radar', 'video'], detections: List[DetectionDetails]):
+    def __init__(self, timestamp: datetime, data_type: Literal['radar', 'video'], detections: List[DetectionDetails], trace=None):
         """
         Initialize the DetectionsAtTime object.
 
         :param timestamp: The time when the data was captured, as a datetime object.
         :param data_type: A string indicating the type of data, either 'radar' or 'video'.
-        :param detections: A list of Detection objects representing individual detections.
+        :param detections: A list of Detection objects representing individual detections, or a DetectionBatch.
+        :param trace: Optional TraceContext, the times the data passed each point of the pipeline.
         """
         self.timestamp = timestamp  # Store the timestamp of the data
         self.type = data_type  # Store the type of data ('radar' or 'video')
         self.detections = detections  # Store the list of Detection objects
+        self.trace = trace  # Store the latency trace of the data
 
     def __repr__(self):
         """
@@ -3,13 +3,9 @@ import os
 from typing import List
 import numpy as np
 
-import plotly.io as pio
-
 from tracking.DetectionsAtTime import DetectionDetails
-pio.renderers.default = 'browser'
 
-from stonesoup.models.transition.linear import CombinedLinearGaussianTransitionModel, \
-    ConstantVelocity
+from stonesoup.models.transition.linear import ConstantVelocity
 from stonesoup.models.measurement.linear import LinearGaussian
 from stonesoup.types.detection import Detection
 
@@ -21,10 +17,8 @@ from stonesoup.predictor.kalman import KalmanPredictor
 from stonesoup.updater.pointprocess import PHDUpdater
 
 # Used for clustering
-from sklearn.cluster import DBSCAN
+from tracking.clustering import cluster_measurements, cluster_measurements_only_on_x
 
-# plotting
-from stonesoup.plotter import AnimatedPlotterly
 from datetime import datetime, timedelta
 
 from stonesoup.mixturereducer.gaussianmixture import GaussianMixtureReducer
@@ -40,6 +34,10 @@ from stonesoup.types.array import CovarianceMatrix
 from collections import deque 
 
 from tracking.TrackingConfiguration import TrackingConfiguration
+from tracking.CachedTransitionModel import CachedCombinedLinearGaussianTransitionModel
+from tracking.TrackExpiryIndex import TrackExpiryIndex
+from tracking.clock import monotonic_now
+from pipeline.instrumentation import timed
 
 import pandas as pd
 
@@ -61,6 +59,7 @@ def get_object_tracking_gm_phd(start_time, tracking_config: TrackingConfiguratio
         track_tail_length=tracking_config.trackTailLength,
         tracking_meas_area=tracking_config.max_track_distance,
         max_deque_size=tracking_config.maxTrackQueueSize,
+        track_expiry_seconds=tracking_config.trackExpirySeconds,
         # Filter parameters
         birth_covar=tracking_config.birthCovariance,
         expected_velocity=tracking_config.expectedVelocity,
@@ -73,6 +72,12 @@ def get_object_tracking_gm_phd(start_time, tracking_config: TrackingConfiguratio
         merge_threshold=tracking_config.mergeThreshold,
         prune_threshold=tracking_config.pruneThreshold,
         state_threshold=tracking_config.stateThreshold,
+        transition_cache_size=tracking_config.transitionCacheSize,
+        transition_cache_resolution=tracking_config.transitionCacheResolution,
+        adaptive_birth=tracking_config.adaptiveBirth,
+        adaptive_birth_weight=tracking_config.adaptiveBirthWeight,
+        adaptive_birth_covar=tracking_config.adaptiveBirthCovariance,
+        adaptive_birth_gate=tracking_config.adaptiveBirthGate,
         show_plot=tracking_config.showTrackingPlot,
         # Saving tracking results
         saveTrackingResults=tracking_config.saveTrackingResults,
@@ -91,6 +96,7 @@ class ObjectTrackingGmPhd():
                  track_tail_length : float = 0.001,
                  tracking_meas_area : int =  150,
                  max_deque_size: int = 200,
+                 track_expiry_seconds: float = None,
                  birth_covar: int = 150,
                  expected_velocity: float=1,
                  noise_covar: list = [1, 1],
@@ -101,6 +107,12 @@ class ObjectTrackingGmPhd():
                  merge_threshold: float = 5, # Threshold Squared Mahalanobis distance
                  prune_threshold: float = 1E-8, # Threshold component weight
                  state_threshold: float = 0.25,
+                 transition_cache_size: int = 32,
+                 transition_cache_resolution: float = 0.01,
+                 adaptive_birth: bool = False,
+                 adaptive_birth_weight: float = 0.1,
+                 adaptive_birth_covar: float = 5,
+                 adaptive_birth_gate: float = 3, # Mahalanobis distance a detection must be from all components to seed a birth
                  show_plot: bool = False,
                  saveTrackingResults: bool = False,
                  outputDirectory: str = "/output"
@@ -114,8 +126,11 @@ class ObjectTrackingGmPhd():
         self.tracking_meas_area = tracking_meas_area
         self.show_plot = show_plot
         
-        self.transition_model = CombinedLinearGaussianTransitionModel([ConstantVelocity(expected_velocity),
-                                                                       ConstantVelocity(expected_velocity)])
+        # F(dt) and Q(dt) are cached per time step, since they're requested for every component on every predict
+        self.transition_model = CachedCombinedLinearGaussianTransitionModel([ConstantVelocity(expected_velocity),
+                                                                             ConstantVelocity(expected_velocity)],
+                                                                            cache_size=transition_cache_size,
+                                                                            time_resolution=transition_cache_resolution)
         
         self.measurement_model = LinearGaussian(ndim_state=4,
                                    mapping=(0, 2),
@@ -156,6 +171,12 @@ class ObjectTrackingGmPhd():
             timestamp=start_time
         )
         
+        # Adaptive birth - seed birth components only at detections that existing components do not explain
+        self.adaptive_birth = adaptive_birth
+        self.adaptive_birth_weight = adaptive_birth_weight
+        self.adaptive_birth_covar = CovarianceMatrix(np.diag([adaptive_birth_covar, 2, adaptive_birth_covar, 2]))**2
+        self.adaptive_birth_gate = adaptive_birth_gate
+        
         # GM PHD Tracker variables
         self.timesteps = deque(maxlen=max_deque_size)
         self.all_measurements = deque(maxlen=max_deque_size)
@@ -165,6 +186,10 @@ class ObjectTrackingGmPhd():
         self.tracks_by_time = deque(maxlen=max_deque_size)
         self.tracker_count = 0
         
+        # Tracks ordered by their last update, tracks not updated within 'track_expiry_seconds' are removed on each update
+        self.track_expiry = TrackExpiryIndex()
+        self.track_expiry_seconds = track_expiry_seconds
+        
         self.saveTrackingResults = saveTrackingResults
         self.save_dir = None
         
@@ -175,39 +200,12 @@ class ObjectTrackingGmPhd():
         
         
     def cluster_measurements(self, detections, eps, min_samples):
-        # Extract measurements (x, y) from detections
-        measurements = np.array([[detection.data[0], detection.data[2]] for detection in detections])
-
-        # Cluster the measurements using DBSCAN
-        clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(measurements)
-        labels = clustering.labels_
-
-        # Filter out noise points and calculate centroids for each cluster
-        centroids = np.array([measurements[labels == label].mean(axis=0) 
-                            for label in set(labels) if label != -1])
-
-        return centroids
+        return cluster_measurements(detections, eps, min_samples)
     
     def cluster_measurements_only_on_x(self, detections, eps, min_samples):
-        # Extract measurements (x, y) from detections
-        measurements = np.array([[detection.data[0], detection.data[2]] for detection in detections])
-        x_values = measurements[:, 0]  # Extract x values
-
-        # Cluster only on the x values using DBSCAN
-        clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(x_values.reshape(-1, 1))
-        labels = clustering.labels_
-
-        # Filter out noise points and calculate average y for each cluster
-        centroids = []
-        for label in set(labels):
-            if label != -1:  # Ignore noise points
-                cluster_indices = labels == label
-                cluster_x = x_values[cluster_indices].mean()  # Average x
-                cluster_y = measurements[cluster_indices, 1].mean()  # Average y
-                centroids.append([cluster_x, cluster_y])
-
-        return np.array(centroids)
+        return cluster_measurements_only_on_x(detections, eps, min_samples)
         
+    @timed('tracker_gmphd_update')
     def update_tracks(self, detections: List[DetectionDetails], timestamp: datetime, type: str = None, print_coord: bool = False):
         """
         detections: Nx4 array of detections, where N is the number of detections
@@ -218,8 +216,6 @@ class ObjectTrackingGmPhd():
         if (detections is None) or (len(detections) == 0):
             return
         
-        timestamp = timestamp.replace(microsecond=0)
-        
         # Get the measurements after they've been clustered
         # measurements = self.cluster_measurements(detections, self.cluster_distance, self.min_detections_to_cluster)
         measurements = self.cluster_measurements_only_on_x(detections, self.cluster_distance, self.min_detections_to_cluster)
@@ -241,13 +237,14 @@ class ObjectTrackingGmPhd():
 
         current_state = self.reduced_states
 
-        if detection_set:  # TODO remove this
-            time = timestamp
-        else:
-            time = self.start_time + timedelta(seconds=self.tracker_count)
+        # Always use the real measurement time, so the filter predicts with the actual time step
+        time = timestamp
         
-        self.birth_component.timestamp = time
-        current_state.add(self.birth_component)
+        if self.adaptive_birth:
+            current_state.update(self.get_adaptive_birth_components(measurements, time))
+        else:
+            self.birth_component.timestamp = time
+            current_state.add(self.birth_component)
         
         hypotheses = self.hypothesiser.hypothesise(current_state, detection_set, timestamp=time, order_by_detection=True)
         
@@ -273,6 +270,7 @@ class ObjectTrackingGmPhd():
 
                     if tag in track_tags:
                         track.append(reduced_state)
+                        self.track_expiry.touch(track, reduced_state.timestamp)
                         self.tracks_by_time[-1].append(reduced_state)  # Append to the current deque index
                         x_y = self.get_tracks_x_y(reduced_state)
                         if x_y is not None:
@@ -281,6 +279,7 @@ class ObjectTrackingGmPhd():
                 else:
                     new_track = Track(reduced_state)
                     self.tracks.add(new_track)
+                    self.track_expiry.touch(new_track, reduced_state.timestamp)
                     self.tracks_by_time[-1].append(reduced_state)
                     x_y = self.get_tracks_x_y(reduced_state)
                     if x_y is not None:
@@ -288,6 +287,10 @@ class ObjectTrackingGmPhd():
         
         self.tracker_count += 1
         
+        # Incrementally drop the tracks that have expired
+        if self.track_expiry_seconds:
+            self.remove_expired_tracks(timestamp - timedelta(seconds=self.track_expiry_seconds))
+        
         # Print all coordinate that were added to active tracks. Points not shown here, were not associated with a track!
         if print_coord and len(added_detect_to_print) > 0:
             # Create a formatted string with all coordinates on a single line
@@ -295,6 +298,42 @@ class ObjectTrackingGmPhd():
             # formatted_coords = ", ".join([f"(x: {coord[0]:.1f}, y: {coord[1]:.1f})" for coord in coordinates]) # Alternative formatting with x, y labels
             print(f"Detections associated to tracks: {formatted_coords}")
     
+    def get_adaptive_birth_components(self, measurements, timestamp: datetime):
+        """
+        Create birth components at the measurements that are not explained by any existing component.
+        A measurement is explained if it is within the 'adaptive_birth_gate' Mahalanobis distance of
+        the predicted measurement of an existing component.
+        measurements: Nx2 array of the clustered [x, y] measurements
+        timestamp: timestamp of the measurements
+        """
+        if len(measurements) == 0:
+            return []
+        
+        measurement_matrix = self.measurement_model.matrix()
+        measurement_covar = self.measurement_model.covar()
+        unexplained = np.ones(len(measurements), dtype=bool)
+        
+        for state in self.reduced_states:
+            if state.tag == 'birth':
+                continue
+            # The predictor caches predictions, so the hypothesiser re-uses this prediction
+            prediction = self.kalman_predictor.predict(state, timestamp=timestamp)
+            predicted_measurement = (measurement_matrix @ prediction.state_vector).ravel()
+            innovation_covar = measurement_matrix @ prediction.covar @ measurement_matrix.T + measurement_covar
+            
+            innovations = measurements - predicted_measurement
+            distances_sq = np.einsum('ij,ij->i', innovations, np.linalg.solve(innovation_covar, innovations.T).T)
+            unexplained &= distances_sq > self.adaptive_birth_gate**2
+            if not unexplained.any():
+                break
+        
+        return [TaggedWeightedGaussianState(state_vector=[x, 0, y, 0],
+                                            covar=self.adaptive_birth_covar,
+                                            weight=self.adaptive_birth_weight,
+                                            tag='birth',
+                                            timestamp=timestamp)
+                for x, y in measurements[unexplained]]
+    
     def get_tracks_x_y(self, state):
         """
         Get the x, y coordinates of the track to print
@@ -316,6 +355,11 @@ class ObjectTrackingGmPhd():
         if (len(self.timesteps) < 5):
             return None
         
+        # Plotly is only loaded when the plot is shown
+        import plotly.io as pio
+        from stonesoup.plotter import AnimatedPlotterly
+        pio.renderers.default = 'browser'
+        
         x_min, x_max, y_min, y_max = 0, self.tracking_meas_area, -self.tracking_meas_area, self.tracking_meas_area
         
         # Plot the tracks
@@ -335,31 +379,39 @@ class ObjectTrackingGmPhd():
             plotter.fig.show("browser")
             print("Done loading plot into the browser.")
     
+    def remove_expired_tracks(self, time_threshold: datetime):
+        """
+        Remove the tracks that have not been updated since the time threshold.
+        Uses the expiry index, so only the expired tracks are visited.
+        :param time_threshold: Tracks last updated before this time are removed.
+        """
+        expired_tracks = self.track_expiry.pop_expired(time_threshold)
+        self.tracks.difference_update(expired_tracks)
+        return expired_tracks
+    
     def find_tracks_remove_older_tracks(self, 
-                                        current_time: datetime = datetime.now(),
+                                        current_time: datetime = None,
                                         remove_tracks = False, 
                                         interval = 5):
         """
         Find current tracks within an interval, return them. 
         If remove_tracks is passed, remove older states
-        :param current_time: The current time to compare states against.
+        :param current_time: The current time to compare states against, defaults to now.
         :param remove_tracks: If True, remove states from older tracks that are older than the last 'interval' seconds.
         :param interval: The time interval in seconds for filtering states.
         """
+        if current_time is None:
+            current_time = monotonic_now()
+        
         # Define the time threshold for filtering states
         time_threshold = current_time - timedelta(seconds=interval)
         
-        # Iterate through each track in the set and collect tracks to remove
-        tracks_to_remove = {track for track in self.tracks if track.state.timestamp < time_threshold.replace(microsecond=0)}
-        
         # Remove the entire track if all states are too old
-        current_tracks = self.tracks - tracks_to_remove
-        
-        # Remove the states from the tracks if the flag is set
         if remove_tracks:
-            self.tracks = current_tracks
+            self.remove_expired_tracks(time_threshold)
+            return set(self.tracks)
         
-        return current_tracks
+        return {track for track in self.tracks if self.track_expiry.last_update(track) >= time_threshold}
     
     def print_current_tracks(self, 
                              current_time: datetime = None, 
@@ -372,7 +424,7 @@ class ObjectTrackingGmPhd():
         :param interval: The time interval in seconds for filtering states.
         """
         if current_time is None:
-            current_time = datetime.now()
+            current_time = monotonic_now()
         
         current_tracks = self.find_tracks_remove_older_tracks(current_time, remove_tracks=remove_tracks, interval=interval)
         print(f"There are currently {len(current_tracks)} tracks identified in the last {interval} seconds.")
@@ -0,0 +1,404 @@
+import os
+import itertools
+from collections import deque
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from tracking.DetectionsAtTime import DetectionDetails
+from tracking.TrackingConfiguration import TrackingConfiguration
+from tracking.clustering import cluster_measurements_only_on_x
+from tracking.TrackExpiryIndex import TrackExpiryIndex
+from tracking.clock import monotonic_now
+from pipeline.instrumentation import timed
+
+def get_object_tracking_gnn(start_time, tracking_config: TrackingConfiguration):
+    """
+    Get the object tracking GNN Kalman tracker based on the tracking configuration.
+
+    Args:
+        start_time (datetime): The start time of the tracking.
+        tracking_config (TrackingConfiguration): The tracking configuration.
+
+    Returns:
+        ObjectTrackingGnn: The object tracking GNN tracker.
+    """
+    return ObjectTrackingGnn(
+        start_time,
+        min_detections_to_cluster=tracking_config.minDetectionsToCluster,
+        cluster_distance=tracking_config.maxDistanceBetweenClusteredObjectsM,
+        track_tail_length=tracking_config.trackTailLength,
+        tracking_meas_area=tracking_config.max_track_distance,
+        max_deque_size=tracking_config.maxTrackQueueSize,
+        track_expiry_seconds=tracking_config.trackExpirySeconds,
+        # Filter parameters
+        expected_velocity=tracking_config.expectedVelocity,
+        noise_covar=[tracking_config.noiseCovarianceDistance, tracking_config.noiseCovarianceDistance],
+        initial_cov=[tracking_config.defaultCovarianceDistance, tracking_config.initialVelocityCovariance,
+                     tracking_config.defaultCovarianceDistance, tracking_config.initialVelocityCovariance],
+        gate_distance=tracking_config.gateDistance,
+        confirm_hits=tracking_config.confirmHits,
+        confirm_window=tracking_config.confirmWindow,
+        max_missed_updates=tracking_config.maxMissedUpdates,
+        transition_cache_resolution=tracking_config.transitionCacheResolution,
+        show_plot=tracking_config.showTrackingPlot,
+        # Saving tracking results
+        saveTrackingResults=tracking_config.saveTrackingResults,
+        outputDirectory=tracking_config.outputDirectory
+    )
+
+@lru_cache(maxsize=32)
+def constant_velocity_matrices(dt: float, noise_diff_coeff: float):
+    """
+    Transition matrix F and process noise covariance Q of a 2D constant velocity model
+    with the state [x, x_vel, y, y_vel]. Cached per time step, like the GM PHD transition model,
+    so dt should be rounded (quantise_time_step) for the cache to hit. The matrices are read-only.
+    """
+    f_axis = np.array([[1, dt], [0, 1]])
+    q_axis = np.array([[dt**3 / 3, dt**2 / 2], [dt**2 / 2, dt]]) * noise_diff_coeff
+    zeros = np.zeros((2, 2))
+    F = np.block([[f_axis, zeros], [zeros, f_axis]])
+    Q = np.block([[q_axis, zeros], [zeros, q_axis]])
+    F.flags.writeable = False
+    Q.flags.writeable = False
+    return F, Q
+
+def quantise_time_step(dt: float, resolution: float) -> float:
+    """
+    Round the time step to 'resolution' seconds, as the GM PHD transition model does, 0 or None disables rounding.
+    """
+    if not resolution:
+        return dt
+    return round(dt / resolution) * resolution
+
+
+class GnnTrack():
+    """
+    A single Kalman filtered track, with an M-of-N window of the recent update hits.
+    """
+    def __init__(self, track_id: int, state_vector, covar, timestamp: datetime, confirm_window: int, max_history: int):
+        self.id = track_id
+        self.state_vector = state_vector  # [x, x_vel, y, y_vel]
+        self.covar = covar
+        self.timestamp = timestamp
+        self.hits = deque([True], maxlen=confirm_window)
+        self.missed_updates = 0
+        self.confirmed = False
+        # History of (timestamp, x, y) used for plotting
+        self.history = deque([(timestamp, state_vector[0], state_vector[2])], maxlen=max_history)
+
+    def __repr__(self):
+        return f"GnnTrack(id={self.id}, confirmed={self.confirmed}, state={self.state_vector})"
+
+
+class ObjectTrackingGnn():
+    """
+    Global nearest neighbour multi-target Kalman tracker.
+
+    Detections are clustered, then assigned to the predicted tracks with the Hungarian algorithm,
+    gated by the Mahalanobis distance. Unassigned detections start tentative tracks, which are
+    confirmed once they have been updated in 'confirm_hits' of the last 'confirm_window' updates (M-of-N).
+    Tracks are deleted after 'max_missed_updates' consecutive updates without a detection.
+    This has the same interface as the GM PHD tracker, but is much cheaper under heavy clutter.
+    """
+    def __init__(self,
+                 start_time,
+                 min_detections_to_cluster: int = 1,
+                 cluster_distance: int = 2,
+                 track_tail_length : float = 0.001,
+                 tracking_meas_area : int =  150,
+                 max_deque_size: int = 200,
+                 track_expiry_seconds: float = None,
+                 expected_velocity: float = 1,
+                 noise_covar: list = [1, 1],
+                 initial_cov: list = [1, 2, 1, 2],
+                 gate_distance: float = 3, # Mahalanobis distance
+                 confirm_hits: int = 3,
+                 confirm_window: int = 5,
+                 max_missed_updates: int = 5,
+                 transition_cache_resolution: float = 0.01,
+                 show_plot: bool = False,
+                 saveTrackingResults: bool = False,
+                 outputDirectory: str = "/output"
+                 ):
+
+        self.start_time = start_time
+        self.min_detections_to_cluster = min_detections_to_cluster
+        self.cluster_distance = cluster_distance
+        self.track_tail_length = track_tail_length
+        self.tracking_meas_area = tracking_meas_area
+        self.max_deque_size = max_deque_size
+        self.show_plot = show_plot
+
+        # Filter parameters
+        self.expected_velocity = expected_velocity
+        self.measurement_covar = np.diag(noise_covar).astype(float)
+        self.initial_covar = np.diag(initial_cov).astype(float)**2
+        self.gate_distance = gate_distance
+        self.confirm_hits = confirm_hits
+        self.confirm_window = confirm_window
+        self.max_missed_updates = max_missed_updates
+        self.transition_cache_resolution = transition_cache_resolution
+
+        # GNN Tracker variables
+        self.tracks = set()
+        self.last_timestamp = None
+        self.track_ids = itertools.count()
+        self.timesteps = deque(maxlen=max_deque_size)
+        self.all_measurements = deque(maxlen=max_deque_size)
+        self.tracker_count = 0
+
+        # Tracks ordered by their last update, tracks not updated within 'track_expiry_seconds' are removed on each update
+        self.track_expiry = TrackExpiryIndex()
+        self.track_expiry_seconds = track_expiry_seconds
+
+        self.saveTrackingResults = saveTrackingResults
+        self.save_dir = None
+
+        # Create folder to save data if "saveTrackingResults" is set to True
+        if self.saveTrackingResults:
+            self.save_dir = os.path.join(outputDirectory, start_time.strftime('%Y-%m-%d_%H-%M-%S'), 'tracking')
+            os.makedirs(self.save_dir, exist_ok=True)
+
+    def cluster_measurements_only_on_x(self, detections, eps, min_samples):
+        return cluster_measurements_only_on_x(detections, eps, min_samples)
+
+    @timed('tracker_gnn_update')
+    def update_tracks(self, detections: List[DetectionDetails], timestamp: datetime, type: str = None, print_coord: bool = False):
+        """
+        detections: list of detections, each with the data [x, x_vel, y, y_vel]
+        timestamp: timestamp of the detections
+        print_coord: if True, print the coordinates of the detections added to tracks
+        """
+        # An update without detections still predicts the tracks and counts a miss for each of them
+        if (detections is None) or (len(detections) == 0):
+            measurements = np.empty((0, 2))
+        else:
+            measurements = self.cluster_measurements_only_on_x(detections, self.cluster_distance, self.min_detections_to_cluster)
+            measurements = measurements.reshape(-1, 2)
+
+        self.timesteps.append(timestamp)
+        self.all_measurements.append(measurements)
+
+        tracks = list(self.tracks)
+        if tracks:
+            self.predict(tracks, timestamp)
+        self.last_timestamp = timestamp
+
+        assignments, unassigned_tracks, unassigned_measurements = self.associate(tracks, measurements)
+
+        added_detect_to_print = []
+        for track_index, measurement_index in assignments:
+            track = tracks[track_index]
+            self.kalman_update(track, measurements[measurement_index])
+            track.timestamp = timestamp
+            self.track_expiry.touch(track, timestamp)
+            track.hits.append(True)
+            track.missed_updates = 0
+            track.history.append((timestamp, track.state_vector[0], track.state_vector[2]))
+            if not track.confirmed and sum(track.hits) >= self.confirm_hits:
+                track.confirmed = True
+            if track.confirmed:
+                added_detect_to_print.append((track.state_vector[0], track.state_vector[2]))
+
+        for track_index in unassigned_tracks:
+            track = tracks[track_index]
+            track.hits.append(False)
+            track.missed_updates += 1
+            # Tentative tracks are dropped as soon as they can no longer reach M hits in the N window
+            can_confirm = sum(track.hits) + (self.confirm_window - len(track.hits)) >= self.confirm_hits
+            if track.missed_updates >= self.max_missed_updates or (not track.confirmed and not can_confirm):
+                self.tracks.discard(track)
+                self.track_expiry.discard(track)
+
+        for measurement_index in unassigned_measurements:
+            x, y = measurements[measurement_index]
+            new_track = GnnTrack(next(self.track_ids), np.array([x, 0., y, 0.]), self.initial_covar.copy(), timestamp,
+                                 confirm_window=self.confirm_window, max_history=self.max_deque_size)
+            new_track.confirmed = self.confirm_hits <= 1
+            self.tracks.add(new_track)
+            self.track_expiry.touch(new_track, timestamp)
+
+        self.tracker_count += 1
+
+        # Incrementally drop the tracks that have expired
+        if self.track_expiry_seconds:
+            self.remove_expired_tracks(timestamp - timedelta(seconds=self.track_expiry_seconds))
+
+        # Print all coordinate that were added to active tracks. Points not shown here, were not associated with a track!
+        if print_coord and len(added_detect_to_print) > 0:
+            formatted_coords = ", ".join([f"({coord[0]:.1f}, {coord[1]:.1f})" for coord in added_detect_to_print])
+            print(f"Detections associated to tracks: {formatted_coords}")
+
+    def predict(self, tracks: List[GnnTrack], timestamp: datetime):
+        """
+        Predict all the tracks forward to the timestamp, all tracks are predicted at once.
+        """
+        dt = quantise_time_step(max((timestamp - self.last_timestamp).total_seconds(), 0.0), self.transition_cache_resolution)
+        F, Q = constant_velocity_matrices(dt, self.expected_velocity)
+
+        states = np.stack([track.state_vector for track in tracks])
+        covars = np.stack([track.covar for track in tracks])
+        states = states @ F.T
+        covars = F @ covars @ F.T + Q
+
+        for track, state, covar in zip(tracks, states, covars):
+            track.state_vector = state
+            track.covar = covar
+
+    def associate(self, tracks: List[GnnTrack], measurements):
+        """
+        Gated global nearest neighbour assignment of the measurements to the predicted tracks.
+        Returns the (track index, measurement index) pairs, the unassigned track indexes and the unassigned measurement indexes.
+        """
+        if len(tracks) == 0 or len(measurements) == 0:
+            return [], list(range(len(tracks))), list(range(len(measurements)))
+
+        states = np.stack([track.state_vector for track in tracks])
+        covars = np.stack([track.covar for track in tracks])
+
+        # Innovation covariance for each track, measuring [x, y]
+        innovation_covars = covars[:, [0, 2]][:, :, [0, 2]] + self.measurement_covar
+        inv_innovation_covars = np.linalg.inv(innovation_covars)
+
+        # Squared Mahalanobis distance between every track and measurement (tracks x measurements)
+        innovations = measurements[np.newaxis, :, :] - states[:, np.newaxis, [0, 2]]
+        distances_sq = np.einsum('tmi,tij,tmj->tm', innovations, inv_innovation_covars, innovations)
+
+        gate_sq = self.gate_distance**2
+        costs = np.where(distances_sq <= gate_sq, distances_sq, gate_sq * 1e3)
+        track_indexes, measurement_indexes = linear_sum_assignment(costs)
+
+        assignments = [(t, m) for t, m in zip(track_indexes, measurement_indexes) if distances_sq[t, m] <= gate_sq]
+        assigned_tracks = {t for t, _ in assignments}
+        assigned_measurements = {m for _, m in assignments}
+        unassigned_tracks = [t for t in range(len(tracks)) if t not in assigned_tracks]
+        unassigned_measurements = [m for m in range(len(measurements)) if m not in assigned_measurements]
+        return assignments, unassigned_tracks, unassigned_measurements
+
+    def kalman_update(self, track: GnnTrack, measurement):
+        """
+        Kalman update of a single track with the [x, y] measurement.
+        """
+        covar_xy = track.covar[:, [0, 2]]
+        innovation_covar = covar_xy[[0, 2]] + self.measurement_covar
+        kalman_gain = covar_xy @ np.linalg.inv(innovation_covar)
+        innovation = measurement - track.state_vector[[0, 2]]
+
+        track.state_vector = track.state_vector + kalman_gain @ innovation
+        track.covar = track.covar - kalman_gain @ covar_xy.T
+
+    def get_tracks_x_y(self, track: GnnTrack):
+        """
+        Get the x, y coordinates of the track to print
+        """
+        x = track.state_vector[0]
+        y = track.state_vector[2]
+        if abs(x) != 0 and abs(y) != 0:
+            return (x, y)
+        else:
+            return None
+
+    def show_tracks_plot(self):
+        # If the plot is not configured, return
+        if not self.show_plot:
+            return
+
+        if (len(self.timesteps) < 5):
+            return None
+
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        measurements = [m for m in self.all_measurements if len(m) > 0]
+        if measurements:
+            all_measurements = np.vstack(measurements)
+            fig.add_trace(go.Scatter(x=all_measurements[:, 0], y=all_measurements[:, 1], mode='markers',
+                                     marker=dict(color='red'), name='Detections After Clustering'))
+        for track in self.tracks:
+            if not track.confirmed:
+                continue
+            _, xs, ys = zip(*track.history)
+            fig.add_trace(go.Scatter(x=xs, y=ys, mode='lines+markers', name=f'Track {track.id}'))
+        fig.update_xaxes(range=[0, self.tracking_meas_area])
+        fig.update_yaxes(range=[-self.tracking_meas_area, self.tracking_meas_area])
+
+        # Save the plot to an HTML file if a save is desired
+        if self.saveTrackingResults:
+            fig.write_html(os.path.join(self.save_dir, "tracking_plot.html"))
+            print("GNN tracking plot saved to file.")
+
+        fig.show("browser")
+        print("Done loading plot into the browser.")
+
+    def remove_expired_tracks(self, time_threshold: datetime):
+        """
+        Remove the tracks that have not been updated since the time threshold.
+        Uses the expiry index, so only the expired tracks are visited.
+        :param time_threshold: Tracks last updated before this time are removed.
+        """
+        expired_tracks = self.track_expiry.pop_expired(time_threshold)
+        self.tracks.difference_update(expired_tracks)
+        return expired_tracks
+
+    def find_tracks_remove_older_tracks(self,
+                                        current_time: datetime = None,
+                                        remove_tracks = False,
+                                        interval = 5):
+        """
+        Find current confirmed tracks within an interval, return them.
+        If remove_tracks is passed, remove tracks that have not been updated within the interval.
+        :param current_time: The current time to compare tracks against.
+        :param remove_tracks: If True, remove tracks that are older than the last 'interval' seconds.
+        :param interval: The time interval in seconds for filtering tracks.
+        """
+        if current_time is None:
+            current_time = monotonic_now()
+        time_threshold = current_time - timedelta(seconds=interval)
+
+        if remove_tracks:
+            self.remove_expired_tracks(time_threshold)
+            current_tracks = self.tracks
+        else:
+            current_tracks = {track for track in self.tracks if track.timestamp >= time_threshold}
+
+        return {track for track in current_tracks if track.confirmed}
+
+    def print_current_tracks(self,
+                             current_time: datetime = None,
+                             remove_tracks = False,
+                             interval : int = 5):
+        """
+        Print the current tracks with their coordinates.
+        :param current_time: The current time to compare tracks against.
+        :param remove_tracks: If True, remove tracks that are older than the last 'interval' seconds.
+        :param interval: The time interval in seconds for filtering tracks.
+        """
+        if current_time is None:
+            current_time = monotonic_now()
+
+        current_tracks = self.find_tracks_remove_older_tracks(current_time, remove_tracks=remove_tracks, interval=interval)
+        print(f"There are currently {len(current_tracks)} tracks identified in the last {interval} seconds.")
+
+        formatted_coords = []
+        for track in current_tracks:
+            x_y = self.get_tracks_x_y(track)
+            if x_y is None:
+                continue
+            x, y = x_y
+            R = np.sqrt(x**2 + y**2)
+            Theta = np.degrees(np.arctan2(y, x))
+            formatted_coords.append(f"(R: {R:.1f}, θ: {Theta:.1f}, X: {x:.1f}, Y: {y:.1f})")
+
+        formatted_coords_str = ", ".join(formatted_coords)
+
+        # Print them to a file if the option is configured
+        if self.saveTrackingResults:
+            fileName = f"tracks-{current_time.strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+            with open(os.path.join(self.save_dir, fileName), "a") as f:
+                f.write(f"{formatted_coords_str}\n")
+
+        print(f"Coordinates of current tracks at {current_time.strftime('%Y-%m-%d_%H-%M-%S')}: {formatted_coords_str}")
@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from pipeline.instrumentation import observe
+
+# The points of the pipeline a frame is traced at, in order
+ACQUIRED = 'acquired'  # The sensor captured the frame (the radar ramp, the camera image)
+DSP_OUT = 'dspOut'  # The detections of the frame left the sensor processing
+ENQUEUED = 'enqueued'  # The detections were put in the queue to the tracking process
+DEQUEUED = 'dequeued'  # The tracking process took the detections from the queue
+TRACKER_IN = 'trackerIn'  # The tracker update with the detections started
+TRACK_OUT = 'trackOut'  # The tracks were updated
+TRACE_POINTS = (ACQUIRED, DSP_OUT, ENQUEUED, DEQUEUED, TRACKER_IN, TRACK_OUT)
+
+# The latency segments of a trace, as (name, from point, to point)
+TRACE_SEGMENTS = (
+    ('dsp', ACQUIRED, DSP_OUT),
+    ('publish', DSP_OUT, ENQUEUED),
+    ('queue', ENQUEUED, DEQUEUED),
+    ('fusion', DEQUEUED, TRACKER_IN),
+    ('tracker', TRACKER_IN, TRACK_OUT),
+    ('endToEnd', ACQUIRED, TRACK_OUT),
+)
+
+class TraceContext():
+    """
+    The times a frame passed each point of the pipeline, from the sensor to the track output.
+
+    The times are time.monotonic() seconds. The monotonic clock is shared by all the processes of the machine,
+    so the times marked by the sensor processes and by the tracking process can be compared directly.
+    Points the frame hasn't passed (yet) are NaN.
+    """
+    __slots__ = ('times',)
+
+    def __init__(self, times=None):
+        """
+        :param times: The time of each of the TRACE_POINTS, all NaN by default.
+        """
+        self.times = [float(t) for t in times] if times is not None else [math.nan] * len(TRACE_POINTS)
+
+    @classmethod
+    def start(cls, acquired: float = None) -> 'TraceContext':
+        """
+        A new trace, for a frame acquired at the time given (now by default).
+        """
+        trace = cls()
+        trace.mark(ACQUIRED, acquired)
+        return trace
+
+    def mark(self, point: str, t: float = None):
+        """
+        Record that the frame passed the point, now by default.
+        """
+        self.times[TRACE_POINTS.index(point)] = time.monotonic() if t is None else t
+
+    def get(self, point: str) -> float:
+        return self.times[TRACE_POINTS.index(point)]
+
+    def breakdown(self) -> dict:
+        """
+        The seconds spent in each segment, for the segments with both points marked.
+        """
+        segments = {}
+        for name, start, end in TRACE_SEGMENTS:
+            seconds = self.get(end) - self.get(start)
+            if not math.isnan(seconds):
+                segments[name] = seconds
+        return segments
+
+    def __repr__(self):
+        return f"TraceContext({', '.join(f'{name}={seconds * 1000:.2f}ms' for name, seconds in self.breakdown().items())})"
+
+class TraceRecorder():
+    """
+    Records the latency breakdown of every traced tracker update, and summarises it at shutdown.
+
+    Each segment is also recorded in the latency histograms of the instrumentation as 'trace_<sensor>_<segment>'.
+    """
+    def __init__(self, max_samples: int = 10000, print_updates: bool = False):
+        """
+        :param max_samples: The number of recent updates kept for the percentiles of each sensor.
+        :param print_updates: If True, print the breakdown of every tracker update.
+        """
+        self.max_samples = max_samples
+        self.print_updates = print_updates
+        self.samples = {}  # sensor type -> segment -> deque of seconds
+        self.untraced = 0
+        # The span of the traced frames, from the first frame acquired to the last track output
+        self.first_acquired = math.inf
+        self.last_track_out = -math.inf
+
+    def record(self, detections_at_time):
+        """
+        Record the trace of detections that have been through the tracker.
+        """
+        trace = getattr(detections_at_time, 'trace', None)
+        if trace is None:
+            self.untraced += 1
+            return
+        breakdown = trace.breakdown()
+        if not math.isnan(trace.get(ACQUIRED)):
+            self.first_acquired = min(self.first_acquired, trace.get(ACQUIRED))
+        if not math.isnan(trace.get(TRACK_OUT)):
+            self.last_track_out = max(self.last_track_out, trace.get(TRACK_OUT))
+        sensor_samples = self.samples.setdefault(detections_at_time.type, {})
+        for segment, seconds in breakdown.items():
+            sensor_samples.setdefault(segment, deque(maxlen=self.max_samples)).append(seconds)
+            observe(f'trace_{detections_at_time.type}_{segment}', seconds)
+        if self.print_updates:
+            print(f"Trace {detections_at_time.type} at {detections_at_time.timestamp}: "
+                  + ', '.join(f"{segment} {seconds * 1000:.1f}ms" for segment, seconds in breakdown.items()))
+
+    def summary(self) -> str:
+        """
+        The p50/p95/p99 of each segment, per sensor.
+        """
+        lines = []
+        for sensor, sensor_samples in sorted(self.samples.items()):
+            count = max(len(samples) for samples in sensor_samples.values())
+            lines.append(f"{sensor} ({count} updates):")
+            for segment, _, _ in TRACE_SEGMENTS:
+                samples = sensor_samples.get(segment)
+                if not samples:
+                    continue
+                p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+                lines.append(f"  {segment:<10} p50 {p50:8.1f}ms  p95 {p95:8.1f}ms  p99 {p99:8.1f}ms")
+        if self.untraced:
+            lines.append(f"{self.untraced} updates without a trace")
+        return '\n'.join(lines)
+
+    def span(self) -> float:
+        """
+        The seconds from the first frame acquired to the last track output, None if no trace has both.
+        """
+        span = self.last_track_out - self.first_acquired
+        return span if math.isfinite(span) else None
+
+    def summary_dict(self) -> dict:
+        """
+        The count, mean, p50/p95/p99 and max in ms of each segment, per sensor, and the span of the traced frames.
+        """
+        summary = {}
+        for sensor, sensor_samples in sorted(self.samples.items()):
+            for segment, samples in sensor_samples.items():
+                samples_ms = np.array(samples) * 1000
+                p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+                summary.setdefault(sensor, {})[segment] = {
+                    'count': len(samples_ms),
+                    'meanMs': float(samples_ms.mean()),
+                    'p50Ms': float(p50),
+                    'p95Ms': float(p95),
+                    'p99Ms': float(p99),
+                    'maxMs': float(samples_ms.max()),
+                }
+        return {'sensors': summary, 'untraced': self.untraced, 'spanSec': self.span(),
+                'firstAcquired': self.first_acquired if math.isfinite(self.first_acquired) else None,
+                'lastTrackOut': self.last_track_out if math.isfinite(self.last_track_out) else None}
+
+    def write_summary(self, path: str):
+        """
+        Write the summary of the segments to a JSON file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.summary_dict(), file, indent=2)
+
+    def print_summary(self):
+        if self.samples or self.untraced:
+            print(f"End to end latency:\n{self.summary()}")
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+from datetime import datetime
+
+class TrackExpiryIndex():
+    """
+    Index of tracks ordered by the time they were last updated, used to expire stale tracks
+    without scanning every track.
+
+    The index is a min-heap of (last update time, track) entries. Updating a track pushes a new
+    entry and leaves the old one in the heap, old entries are skipped when they are popped (lazy deletion).
+    Removing the expired tracks costs O(expired * log n).
+    """
+    def __init__(self):
+        self._heap = []
+        self._last_update = {}  # track -> time of the latest update
+        self._counter = itertools.count()  # Tie breaker, so tracks are never compared
+
+    def touch(self, track, timestamp: datetime):
+        """
+        Record that the track was updated at the timestamp.
+        """
+        self._last_update[track] = timestamp
+        heapq.heappush(self._heap, (timestamp, next(self._counter), track))
+
+        # Rebuild the heap if it is mostly old entries, so it doesn't grow without bound
+        if len(self._heap) > 4 * len(self._last_update) + 64:
+            self._compact()
+
+    def discard(self, track):
+        """
+        Remove the track from the index, if it is in it.
+        """
+        self._last_update.pop(track, None)
+
+    def last_update(self, track) -> datetime:
+        """
+        Time of the latest update of the track, or None if the track is not in the index.
+        """
+        return self._last_update.get(track)
+
+    def pop_expired(self, time_threshold: datetime) -> list:
+        """
+        Remove and return all the tracks that have not been updated since the time threshold.
+        """
+        expired = []
+        while self._heap and self._heap[0][0] < time_threshold:
+            timestamp, _, track = heapq.heappop(self._heap)
+            # Skip entries for tracks that have been updated since, or were already removed
+            if self._last_update.get(track) == timestamp:
+                del self._last_update[track]
+                expired.append(track)
+        return expired
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._last_update.get(entry[2]) == entry[0]]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._last_update)
+
+    def __contains__(self, track):
+        return track in self._last_update
@@ -40,13 +40,31 @@ class TrackingConfiguration:
                     'clusterRate': 7.0,
                     'mergeThreshold': 5,
                     'pruneThreshold': 1E-8,
-                    'stateThreshold': 0.25
+                    'stateThreshold': 0.25,
+                    'transitionCacheSize': 32,
+                    'transitionCacheResolution': 0.01,
+                    'adaptiveBirth': False,
+                    'adaptiveBirthWeight': 0.1,
+                    'adaptiveBirthCovariance': 5,
+                    'adaptiveBirthGate': 3
+                },
+                'gnn': {
+                    'expectedVelocity': 1,
+                    'noiseCovarianceDistance': 1,
+                    'defaultCovarianceDistance': 1,
+                    'initialVelocityCovariance': 2,
+                    'gateDistance': 3,
+                    'confirmHits': 3,
+                    'confirmWindow': 5,
+                    'maxMissedUpdates': 5,
+                    'transitionCacheResolution': 0.01
                 }
             },
             'minDetectionsToCluster': 1,
             'maxDistanceBetweenClusteredObjectsM': 2,
             'trackTailLength': 0.1,
             'maxTrackQueueSize': 200,
+            'trackExpirySeconds': 5,
             'showTrackingPlot': False,
             'saveTrackingResults': False,
             'outputDirectory': '/output'
@@ -77,6 +95,7 @@ class TrackingConfiguration:
                     self.maxDistanceBetweenClusteredObjectsM = config.get('maxDistanceBetweenClusteredObjectsM', self.defaults['maxDistanceBetweenClusteredObjectsM'])
                     self.trackTailLength = config.get('trackTailLength', self.defaults['trackTailLength'])
                     self.maxTrackQueueSize = config.get('maxTrackQueueSize', self.defaults['maxTrackQueueSize'])
+                    self.trackExpirySeconds = config.get('trackExpirySeconds', self.defaults['trackExpirySeconds'])
                     self.showTrackingPlot = config.get('showTrackingPlot', self.defaults['showTrackingPlot'])
                     self.saveTrackingResults = config.get('saveTrackingResults', self.defaults['saveTrackingResults'])
                     self.outputDirectory = config.get('outputDirectory', self.defaults['outputDirectory'])
@@ -101,6 +120,7 @@ class TrackingConfiguration:
         self.maxDistanceBetweenClusteredObjectsM = self.defaults['maxDistanceBetweenClusteredObjectsM']
         self.trackTailLength = self.defaults['trackTailLength']
         self.maxTrackQueueSize = self.defaults['maxTrackQueueSize']
+        self.trackExpirySeconds = self.defaults['trackExpirySeconds']
         self.showTrackingPlot = self.defaults['showTrackingPlot']
         self.saveTrackingResults = self.defaults['saveTrackingResults']
         self.trackingOutputPath = self.defaults['outputDirectory']
@@ -112,9 +132,11 @@ class TrackingConfiguration:
         """
         Dynamically set the attributes of the active filter onto the instance.
         This allows accessing the active filter's settings via dot notation.
+        Any setting missing from the configuration file falls back to the default for that filter.
         """
+        default_filter_settings = self.defaults['filters'].get(self.activeFilter, {})
         active_filter_settings = self.filters.get(self.activeFilter, {})
-        for key, value in active_filter_settings.items():
+        for key, value in {**default_filter_settings, **active_filter_settings}.items():
             setattr(self, key, value)
 
     def __str__(self):
@@ -134,6 +156,7 @@ class TrackingConfiguration:
                f"maxDistanceBetweenClusteredObjectsM: {self.maxDistanceBetweenClusteredObjectsM}\n" \
                f"trackTailLength: {self.trackTailLength}\n" \
                f"maxTrackQueueSize: {self.maxTrackQueueSize}\n" \
+               f"trackExpirySeconds: {self.trackExpirySeconds}\n" \
                 f"showTrackingPlot: {self.showTrackingPlot}\n" \
                 f"outputDirectory: {self.trackingOutputPath}"
 
@@ -0,0 +1,31 @@
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Wall clock time paired with the monotonic clock when this module is imported (once per process)
+_WALL_ANCHOR = datetime.now()
+_MONOTONIC_ANCHOR = time.monotonic()
+
+def monotonic_now() -> datetime:
+    """
+    Full precision timestamp for a detection or measurement.
+
+    The time is taken from the monotonic clock and anchored to the wall clock at import, so it keeps
+    the microseconds, never goes backwards and is not affected by NTP or manual clock changes.
+    The result is still a datetime, so it can be compared with the wall clock and used by Stone Soup.
+    """
+    return _WALL_ANCHOR + timedelta(seconds=time.monotonic() - _MONOTONIC_ANCHOR)
+
+def monotonic_timestamp() -> pd.Timestamp:
+    """
+    The same as monotonic_now(), as a pandas Timestamp for the radar data classes.
+    """
+    return pd.Timestamp(monotonic_now())
+
+def monotonic_seconds(timestamp) -> float:
+    """
+    The time.monotonic() seconds of a timestamp from monotonic_now() or monotonic_timestamp(), to compare it
+    with the monotonic clock, which is shared by all the processes.
+    """
+    return _MONOTONIC_ANCHOR + (pd.Timestamp(timestamp) - pd.Timestamp(_WALL_ANCHOR)).total_seconds()
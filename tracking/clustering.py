@@ -0,0 +1,59 @@
+from typing import List
+import numpy as np
+
+# Used for clustering
+from sklearn.cluster import DBSCAN
+
+from tracking.DetectionsAtTime import DetectionDetails
+from tracking.DetectionBatch import DetectionBatch
+
+def detection_positions(detections: List[DetectionDetails]) -> np.ndarray:
+    """
+    Nx2 array of the (x, y) positions of the detections, read directly from the arrays of a DetectionBatch.
+    """
+    if isinstance(detections, DetectionBatch):
+        return detections.xy
+    return np.array([[detection.data[0], detection.data[2]] for detection in detections])
+
+def cluster_measurements(detections: List[DetectionDetails], eps, min_samples):
+    """
+    Cluster the detections on their (x, y) position using DBSCAN.
+    Returns an Nx2 array of the cluster centroids [x, y]. Noise points are dropped.
+    """
+    # Extract measurements (x, y) from detections
+    measurements = detection_positions(detections)
+
+    # Cluster the measurements using DBSCAN
+    clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(measurements)
+    labels = clustering.labels_
+
+    # Filter out noise points and calculate centroids for each cluster
+    centroids = np.array([measurements[labels == label].mean(axis=0) 
+                        for label in set(labels) if label != -1])
+
+    return centroids
+
+def cluster_measurements_only_on_x(detections: List[DetectionDetails], eps, min_samples):
+    """
+    Cluster the detections on their x position only using DBSCAN.
+    Returns an Nx2 array of the cluster centroids [x, y], the y value is the average y of the cluster.
+    Noise points are dropped.
+    """
+    # Extract measurements (x, y) from detections
+    measurements = detection_positions(detections)
+    x_values = measurements[:, 0]  # Extract x values
+
+    # Cluster only on the x values using DBSCAN
+    clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(x_values.reshape(-1, 1))
+    labels = clustering.labels_
+
+    # Filter out noise points and calculate average y for each cluster
+    centroids = []
+    for label in set(labels):
+        if label != -1:  # Ignore noise points
+            cluster_indices = labels == label
+            cluster_x = x_values[cluster_indices].mean()  # Average x
+            cluster_y = measurements[cluster_indices, 1].mean()  # Average y
+            centroids.append([cluster_x, cluster_y])
+
+    return np.array(centroids)
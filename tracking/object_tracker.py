@@ -0,0 +1,26 @@
+from tracking.TrackingConfiguration import TrackingConfiguration
+
+GM_PHD_FILTER = 'gmPHD'
+GNN_FILTER = 'gnn'
+
+def get_object_tracker(start_time, tracking_config: TrackingConfiguration):
+    """
+    Get the object tracker selected by the 'activeFilter' of the tracking configuration.
+    The trackers share the same interface (update_tracks, print_current_tracks, show_tracks_plot),
+    so they can be used interchangeably. Only the selected tracker's dependencies are imported.
+
+    Args:
+        start_time (datetime): The start time of the tracking.
+        tracking_config (TrackingConfiguration): The tracking configuration.
+
+    Returns:
+        The object tracker for the active filter.
+    """
+    if tracking_config.activeFilter == GM_PHD_FILTER:
+        from tracking.ObjectTrackingGmPhd import get_object_tracking_gm_phd
+        return get_object_tracking_gm_phd(start_time, tracking_config)
+    elif tracking_config.activeFilter == GNN_FILTER:
+        from tracking.ObjectTrackingGnn import get_object_tracking_gnn
+        return get_object_tracking_gnn(start_time, tracking_config)
+    
+    raise ValueError(f"Unknown tracking filter '{tracking_config.activeFilter}'. Options are {GM_PHD_FILTER}, {GNN_FILTER}.")
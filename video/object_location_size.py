@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 from video.CameraDetails import CameraDetails
 
@@ -53,4 +54,34 @@ def object_location(top_left_x, top_left_y,bottom_right_x,bottom_right_y, camera
 
     # Final output
     OutputVec = [OutputEstimatedAzAngle, OutputEstimatedElAngle, OutputEstimatedDistance]
-    return OutputVec
\ No newline at end of file
+    return OutputVec
+
+def object_locations(boxes_xyxy: np.ndarray, detected_objects, camera_details : CameraDetails) -> np.ndarray:
+    """
+    Vectorized version of object_location for all the bounding boxes of a frame.
+    
+    :param boxes_xyxy: Nx4 array of the bounding boxes [top_left_x, top_left_y, bottom_right_x, bottom_right_y]
+    :param detected_objects: The N types of the objects detected
+    :param camera_details: A CameraDetails object containing details of the camera.
+    :return: Nx3 array of [azimuth angle (deg), elevation angle (deg), distance (m)] of each object
+    """
+    boxes_xyxy = np.asarray(boxes_xyxy, dtype=float).reshape(-1, 4)
+    ImageWidth = camera_details.image_width
+    ImageHeight = camera_details.image_height
+    
+    # Coefficient of each object, or the default value if the object is not in the map
+    coefficients = np.array([camera_details.bbCoefficientsMap.get(detected_object, 1.813851) for detected_object in detected_objects])
+    
+    BBWidth = (boxes_xyxy[:, 2] - boxes_xyxy[:, 0] + 1) / ImageWidth
+    BBHorizontalCenterPixels = (boxes_xyxy[:, 0] + boxes_xyxy[:, 2]) / 2
+    BBVerticalCenterPixels = (boxes_xyxy[:, 1] + boxes_xyxy[:, 3]) / 2
+    
+    FOV_horizontal = camera_details.horz_fov
+    FOV_vertical = 2 * math.degrees(math.atan(math.tan(math.radians(camera_details.horz_fov / 2)) * ImageHeight / ImageWidth))/camera_details.aspect_ratio
+    
+    # The same angles as object_location, both of its branches reduce to a single expression
+    OutputEstimatedAzAngle = 90 - (BBHorizontalCenterPixels - ImageWidth / 2) / ImageWidth * (FOV_horizontal / camera_details.zoom_factor)
+    OutputEstimatedElAngle = -(BBVerticalCenterPixels - ImageHeight / 2) / ImageHeight * (FOV_vertical / camera_details.zoom_factor)
+    OutputEstimatedDistance = coefficients / (BBWidth / camera_details.zoom_factor)
+    
+    return np.column_stack([OutputEstimatedAzAngle, OutputEstimatedElAngle, OutputEstimatedDistance])
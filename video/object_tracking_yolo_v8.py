@@ -1,4 +1,5 @@
 from tracking.DetectionsAtTime import DetectionDetails, DetectionsAtTime
+from tracking.DetectionBatch import DetectionBatch
 from ultralytics import YOLO
 import time
 from datetime import datetime
@@ -7,9 +8,14 @@ import os
 import multiprocessing as mp
 import math
 from constants import IMAGE_DETECTION_TYPE
+from tracking.clock import monotonic_now
+from pipeline.LoadController import LoadKnobs, VIDEO_STRIDE
+from pipeline.instrumentation import observe, timer
+from tracking.TraceContext import TraceContext, DSP_OUT, ENQUEUED
 import pandas as pd
+import numpy as np
 
-from video.object_location_size import CameraDetails, object_location
+from video.object_location_size import CameraDetails, object_location, object_locations
 from video.VideoConfiguration import VideoConfiguration
 
 def setup_output_folders(output_directory : str, save_raw_img : bool = True, start_time :pd.Timestamp = None):
@@ -67,9 +73,42 @@ def detection_from_bbox(yolo_box, detected_object, camera_details : CameraDetail
     x = distance_horizontal * math.sin(az_angle_rad)  # Horizontal distance in the x direction
     y = distance * math.sin(el_angle_rad)  # Vertical distance in the y direction
     
-    return DetectionDetails(detected_object, [x, 0.2, y , 0.2])
+    return DetectionDetails(detected_object, [x, 0.2, y , 0.2], yolo_box.conf[0].item())
     
-def track_objects(stop_event, video_config : VideoConfiguration, start_time : pd.Timestamp, data_queue : mp.Queue = None):
+def detections_from_boxes(yolo_boxes, names, camera_details : CameraDetails, print_details=False) -> DetectionBatch:
+    """
+    Calculate the object locations of all the bounding boxes of a frame at once, the vectorized version of detection_from_bbox.
+    
+    :param yolo_boxes: Yolo bounding boxes of the frame
+    :param names: Map of the yolo class index to the object name
+    :param camera_details: A CameraDetails object containing details of the camera.
+    :return: DetectionBatch containing the object types and locations.
+    """
+    class_indexes = yolo_boxes.cls.cpu().numpy().astype(int)
+    if len(class_indexes) == 0:
+        return DetectionBatch.empty()
+    
+    # Index the objects of the frame into a small table of class names
+    class_names, class_ids = np.unique(class_indexes, return_inverse=True)
+    class_names = [names[class_index] for class_index in class_names]
+    detected_objects = [class_names[class_id] for class_id in class_ids]
+    
+    polar_range_data = object_locations(yolo_boxes.xyxy.cpu().numpy(), detected_objects, camera_details=camera_details)
+    az_angle_rad = np.radians(polar_range_data[:, 0])
+    el_angle_rad = np.radians(polar_range_data[:, 1])
+    distance = polar_range_data[:, 2]
+    if print_details:
+        for detected_object, (az, el, dist) in zip(detected_objects, polar_range_data):
+            print(f"Object: {detected_object}, Distance: {dist}, Azimuth Deg: {az}, Elevation Deg: {el}")
+    
+    # Calculate x (horizontal) and y (vertical) distances
+    x = distance * np.cos(el_angle_rad) * np.sin(az_angle_rad)
+    y = distance * np.sin(el_angle_rad)
+    
+    data = np.column_stack([x, np.full_like(x, 0.2), y, np.full_like(x, 0.2)])
+    return DetectionBatch(data, class_ids, class_names, yolo_boxes.conf.cpu().numpy())
+    
+def track_objects(stop_event, video_config : VideoConfiguration, start_time : pd.Timestamp, data_queue : mp.Queue = None, load_knobs : LoadKnobs = None):
     ### PARAMs to the program
     model_weights = video_config.modelWeights
     save_raw_img = video_config.saveRawImages
@@ -101,6 +140,9 @@ def track_objects(stop_event, video_config : VideoConfiguration, start_time : pd
     for i, result in enumerate(results):
         if stop_event.is_set():
             break   
+        # Time yolo took for the frame, in ms for each step. The image was captured before yolo processed it.
+        frame_time = sum(speed or 0 for speed in result.speed.values()) / 1000
+        trace = TraceContext.start(time.monotonic() - frame_time)
         orig_img_h = result.orig_img.shape[0]
         orig_img_w = result.orig_img.shape[1]
         
@@ -109,24 +151,28 @@ def track_objects(stop_event, video_config : VideoConfiguration, start_time : pd
             orig_img_rgb = Image.fromarray(result.orig_img[..., ::-1])  # Convert BGR to RGB
             orig_img_rgb.save(os.path.join(output_folder, "raw", f"image_{i}_{orig_img_w}x{orig_img_h}.jpg"))
         
-        detectionTimestamp = datetime.now().replace(microsecond=0)
-        detections = []
+        detectionTimestamp = monotonic_now()
         
-        # Iterate over the detected objects, add tracking details into the detections_data list
-        for box in result.boxes:
-            classificationIndex = box.cls[0].item()
-            detected_object = result.names[classificationIndex]
-            # print(f"Object: {detected_object}, Confidence { box.conf[0].item()}")
-            
-            detection = detection_from_bbox(box, detected_object, camera_details=camera, print_details=video_config.printDetectedObjects)
-            
-            detections.append(detection)
+        # Find the tracking details of all the detected objects at once
+        with timer('video_locate'):
+            detections = detections_from_boxes(result.boxes, result.names, camera_details=camera, print_details=video_config.printDetectedObjects)
+        
+        trace.mark(DSP_OUT)
         
         # If a data_queue is provided, put the detections into the queue
         if data_queue is not None and len(detections) > 0:
-            data_queue.put(DetectionsAtTime(detectionTimestamp, IMAGE_DETECTION_TYPE, detections))
-    
-        time.sleep(video_config.videoDelayBetweenProcessingSec)
+            with timer('video_queue_put'):
+                trace.mark(ENQUEUED)
+                data_queue.put(DetectionsAtTime(detectionTimestamp, IMAGE_DETECTION_TYPE, detections, trace))
+        
+        observe('video_inference', frame_time)
+    
+        delay = video_config.videoDelayBetweenProcessingSec
+        if load_knobs is not None:
+            load_knobs.record_latency('video', frame_time)
+            # Under load wait for roughly 'videoStride' - 1 frames more, a live stream only keeps the newest frame
+            delay += (load_knobs.get(VIDEO_STRIDE, 1) - 1) * frame_time
+        time.sleep(delay)
     
 
 if __name__ == "__main__":